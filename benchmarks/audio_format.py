@@ -0,0 +1,178 @@
+"""
+Runs the audio stages of the pipeline on one meeting in each audio format and compares the disk
+space and time they take.
+
+Usage:
+    python -m benchmarks.audio_format [videos/<meeting>.mp4] [--minutes 30] [--formats wav flac]
+                                      [--upload-mbps 50]
+
+Without a video a meeting of the given length is generated, with pink noise in bursts standing in
+for speech. Real speech compresses differently, so pass a meeting video for numbers worth quoting.
+Speakers change every one to three minutes. Every stage runs from extraction to the short files,
+in a temporary directory per format. The upload is not run, its time is estimated from the bytes
+`upload_files_to_bucket` would send at the given bandwidth.
+"""
+import argparse
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+from src.processing.audio_format import get_format
+from src.processing.ffmpeg_source import FFMPEG_BINARY
+from src.processing.process_audio import copy_short_audio, label_processed_audio, process_raw_audio
+from src.processing.timeline import TimelineRecord, append_timeline, timeline_path
+from src.transform.to_audio import extract_audio
+
+PARTY_MAPPING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'data',
+                             'party_mapping.json')
+
+SPEAKERS = [
+    'Jón Jónsson (Samf.)',
+    'Anna Sigurðardóttir (Sjálfstfl.)',
+    'Guðmundur Ingi (Vinstri-gr.)',
+    'Inga Sæland (Fl. fólksins)',
+    'Þorgerður Katrín (Viðreisn)',
+    'Sigurður Ingi (Framsfl.)',
+    'Halldóra Mogensen (Píratar)',
+]
+
+
+def write_meeting(path, minutes):
+    """
+    Writes a small video with stereo AAC audio of pink noise that comes and goes like speech.
+    """
+    audio = ("anoisesrc=color=pink:amplitude=0.5:sample_rate=48000,"
+             "volume='0.05+0.95*gt(sin(2*PI*t/3)+sin(2*PI*t/7),0)':eval=frame,pan=stereo|c0=c0|c1=c0")
+    subprocess.run([FFMPEG_BINARY, '-v', 'error', '-y', '-f', 'lavfi', '-i', 'color=c=black:s=320x180:r=25',
+                    '-f', 'lavfi', '-i', audio, '-t', str(minutes * 60), '-c:v', 'libx264', '-preset', 'ultrafast',
+                    '-c:a', 'aac', '-b:a', '128k', path], check=True)
+
+
+def write_timeline(topic_dir, name, duration, seed=0):
+    """
+    Writes a timeline where the speaker changes every one to three minutes.
+    """
+    rng = random.Random(seed)
+    records, pts = [], 0.0
+    while pts < duration:
+        records.append(TimelineRecord(name, int(pts * 25), pts, rng.choice(SPEAKERS), 'Umraeda', 0.0))
+        pts += rng.uniform(60, 180)
+    path = timeline_path(topic_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    append_timeline(path, records)
+
+
+def disk_usage(path, extension=None):
+    """
+    Returns the bytes of the files under a directory, counting hard linked files once.
+    """
+    seen, total = set(), 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            if extension and not filename.endswith(extension):
+                continue
+            stat = os.lstat(os.path.join(root, filename))
+            if stat.st_ino not in seen:
+                seen.add(stat.st_ino)
+                total += stat.st_size
+    return total
+
+
+def upload_bytes(labeled_dir, extension):
+    """
+    Returns the bytes `upload_files_to_bucket` sends for a labeled directory.
+    """
+    total = 0
+    for root, _, filenames in os.walk(labeled_dir):
+        if 'unlabeled' not in root:
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in filenames if f.endswith(extension))
+    return total
+
+
+def run(video_path, work_dir, audio_format, upload_mbps):
+    """
+    Runs the audio stages in a directory and returns the seconds and bytes of each.
+    """
+    audio_format = get_format(audio_format)
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        os.makedirs('audio/raw')
+        times = {}
+
+        start = time.perf_counter()
+        frames = extract_audio(video_path, f'audio/raw/{name}.wav', audio_format.sample_rate)
+        times['extract'] = time.perf_counter() - start
+        write_timeline('logs/topic', name, frames / audio_format.sample_rate)
+
+        start = time.perf_counter()
+        process_raw_audio(audio_format=audio_format.name)
+        times['cut'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        label_processed_audio(party_mapping=PARTY_MAPPING)
+        times['label'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        copy_short_audio(audio_format=audio_format.name)
+        times['short'] = time.perf_counter() - start
+
+        sizes = {
+            'raw': disk_usage('audio/raw'),
+            'processed': disk_usage('audio/processed'),
+            'store': disk_usage('audio/store'),
+            'short': disk_usage('audio/short'),
+            # The stages link files from each other, so this is less than their sum
+            'on disk': disk_usage('audio'),
+            'upload': upload_bytes(os.path.join('audio/labeled', name), audio_format.extension),
+        }
+        times['upload'] = sizes['upload'] * 8 / (upload_mbps * 1e6)
+        return times, sizes
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video_path', nargs='?')
+    parser.add_argument('--minutes', type=float, default=30)
+    parser.add_argument('--formats', nargs='+', default=['wav', 'flac'])
+    parser.add_argument('--upload-mbps', type=float, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = args.video_path
+        if video_path is None:
+            video_path = os.path.join(tmp_dir, 'meeting.mp4')
+            write_meeting(video_path, args.minutes)
+        video_path = os.path.abspath(video_path)
+
+        results = {}
+        for audio_format in args.formats:
+            work_dir = os.path.join(tmp_dir, audio_format)
+            os.makedirs(work_dir)
+            results[audio_format] = run(video_path, work_dir, audio_format, args.upload_mbps)
+
+    base_times, base_sizes = results[args.formats[0]]
+    print(f"{'':>8} " + ' '.join(f"{stage:>10}" for stage in base_times) + f" {'total':>10}")
+    for audio_format, (times, sizes) in results.items():
+        print(f"{audio_format:>8} " + ' '.join(f"{seconds:>9.2f}s" for seconds in times.values())
+              + f" {sum(times.values()):>9.2f}s")
+    print()
+    print(f"{'':>8} " + ' '.join(f"{stage:>10}" for stage in base_sizes))
+    for audio_format, (times, sizes) in results.items():
+        print(f"{audio_format:>8} " + ' '.join(f"{size / 1e6:>8.1f}MB" for size in sizes.values()))
+    print()
+    for audio_format, (times, sizes) in list(results.items())[1:]:
+        print(f"{audio_format} against {args.formats[0]}: "
+              f"{1 - sizes['on disk'] / base_sizes['on disk']:.0%} less disk, "
+              f"{1 - sizes['upload'] / base_sizes['upload']:.0%} less upload, "
+              f"{1 - sum(times.values()) / sum(base_times.values()):.0%} less time end to end "
+              f"(upload estimated at {args.upload_mbps:g} Mbit/s)")
+
+
+if __name__ == "__main__":
+    main()
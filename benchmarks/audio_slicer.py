@@ -0,0 +1,114 @@
+"""
+Compares cutting speaker segments with one ffmpeg process each, as `ffmpeg_extract_subclip` does,
+with `cut_segments` over the memory mapped WAV file.
+
+Usage:
+    python -m benchmarks.audio_slicer [audio/raw/<meeting>.wav] [--hours 5] [--segments 150]
+
+Without a WAV file a silent mono 16-bit meeting of the given length is written to a temporary
+directory. Reports segments per second and the peak RSS of each method, and checks that both
+write the same samples.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import wave
+
+from src.processing.audio_slicer import cut_segments, read_wav_layout
+from src.processing.ffmpeg_source import FFMPEG_BINARY
+
+
+def write_meeting(path, hours, sample_rate=44100):
+    """
+    Writes a silent mono 16-bit WAV file.
+    """
+    chunk = b'\0' * (sample_rate * 2 * 60)
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        for _ in range(int(hours * 60)):
+            f.writeframesraw(chunk)
+
+
+def ffmpeg_cut(wav_path, segments):
+    """
+    Cuts every segment with its own ffmpeg process, like `ffmpeg_extract_subclip`.
+    """
+    for start_time, end_time, output_path in segments:
+        subprocess.run([FFMPEG_BINARY, '-v', 'error', '-y', '-ss', '%0.2f' % start_time, '-i', wav_path,
+                        '-t', '%0.2f' % (end_time - start_time), '-map', '0', '-vcodec', 'copy',
+                        '-acodec', 'copy', output_path], check=True)
+
+
+def mmap_cut(wav_path, segments):
+    """
+    Cuts the segments with `cut_segments`.
+    """
+    cut_segments(wav_path, segments)
+
+
+def measure(method, wav_path, segments):
+    """
+    Runs a method in this process and returns its time and the peak RSS in MB of the process and
+    its children.
+    """
+    start = time.perf_counter()
+    method(wav_path, segments)
+    elapsed = time.perf_counter() - start
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return elapsed, peak / 1024
+
+
+def samples(path):
+    """
+    Returns the sample data of a WAV file.
+    """
+    _, _, _, data_offset, data_size = read_wav_layout(path)
+    with open(path, 'rb') as f:
+        f.seek(data_offset)
+        return f.read(data_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('wav_path', nargs='?')
+    parser.add_argument('--hours', type=float, default=5)
+    parser.add_argument('--segments', type=int, default=150)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        wav_path = args.wav_path
+        if wav_path is None:
+            wav_path = os.path.join(tmp_dir, 'meeting.wav')
+            write_meeting(wav_path, args.hours)
+
+        _, sample_rate, block_align, _, data_size = read_wav_layout(wav_path)
+        duration = data_size // block_align // sample_rate
+        step = max(duration // args.segments, 2)
+
+        results = {}
+        # Each method runs in a fresh process so the peak RSS is its own
+        context = multiprocessing.get_context('spawn')
+        for name, method in [('ffmpeg', ffmpeg_cut), ('mmap', mmap_cut)]:
+            output_dir = os.path.join(tmp_dir, name)
+            os.makedirs(output_dir)
+            segments = [(start, start + step - 1, os.path.join(output_dir, f'{i}.wav'))
+                        for i, start in enumerate(range(0, duration - step, step))][:args.segments]
+            with context.Pool(1) as pool:
+                elapsed, peak = pool.apply(measure, (method, wav_path, segments))
+            results[name] = segments
+            print(f"{name:>6}: {len(segments)} segments in {elapsed:.2f}s "
+                  f"({len(segments) / elapsed:.1f} segments/s), peak RSS {peak:.0f} MB")
+
+        identical = sum(samples(a[2]) == samples(b[2]) for a, b in zip(results['ffmpeg'], results['mmap']))
+        print(f"{identical}/{len(results['mmap'])} segments have identical samples")
+
+
+if __name__ == "__main__":
+    main()
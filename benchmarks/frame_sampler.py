@@ -0,0 +1,84 @@
+"""
+Compares the old seek-per-sample loop of `process_video` with `FrameSampler` and `FFmpegRoiSource`.
+
+Usage:
+    python -m benchmarks.frame_sampler videos/<meeting>.mp4 --frame-skip 500 --samples 100
+"""
+import argparse
+import time
+
+import cv2
+
+from src.processing.ffmpeg_source import FFmpegRoiSource
+from src.processing.frame_sampler import FrameSampler
+
+
+def seek_loop(video_path, frame_skip, start_frame, samples):
+    """
+    Samples frames the way `process_video` used to, seeking before every read.
+
+    Returns:
+    int: The number of frames sampled.
+    """
+    cap = cv2.VideoCapture(video_path)
+    current_frame = start_frame
+    sampled = 0
+    while cap.isOpened() and sampled < samples:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        sampled += 1
+        current_frame += frame_skip
+    cap.release()
+    return sampled
+
+
+def sampler_loop(video_path, frame_skip, start_frame, samples):
+    """
+    Samples frames with `FrameSampler`, decoding the stream forward.
+
+    Returns:
+    int: The number of frames sampled.
+    """
+    end_frame = start_frame + frame_skip * samples
+    sampled = 0
+    with FrameSampler(video_path, frame_skip=frame_skip, start_frame=start_frame, end_frame=end_frame) as sampler:
+        for _ in sampler:
+            sampled += 1
+    return sampled
+
+
+def ffmpeg_loop(video_path, frame_skip, start_frame, samples):
+    """
+    Samples the caption region with `FFmpegRoiSource`.
+
+    Returns:
+    int: The number of frames sampled.
+    """
+    end_frame = start_frame + frame_skip * samples
+    sampled = 0
+    region = [700, 1000, 150, 1700]
+    with FFmpegRoiSource(video_path, region, frame_skip=frame_skip, start_frame=start_frame, end_frame=end_frame) as source:
+        for _ in source:
+            sampled += 1
+    return sampled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video_path')
+    parser.add_argument('--frame-skip', type=int, default=500)
+    parser.add_argument('--start-frame', type=int, default=4000)
+    parser.add_argument('--samples', type=int, default=100)
+    args = parser.parse_args()
+
+    for name, loop in [('seek', seek_loop), ('sequential', sampler_loop), ('ffmpeg roi', ffmpeg_loop)]:
+        start = time.perf_counter()
+        sampled = loop(args.video_path, args.frame_skip, args.start_frame, args.samples)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {sampled} frames in {elapsed:.2f}s ({sampled / elapsed:.2f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compares reading caption images one OCR call at a time with batches of K captions per call.
+
+Usage:
+    python -m benchmarks.ocr_batch [--backend auto] [--rounds 2]
+
+Reports captions per second for each batch size and checks that every batched text is identical to
+the per-frame text, printing the ones that differ and exiting with status 1 if any do.
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.ocr_engines import caption_image
+from src.processing.ocr import batch_image_to_string, get_engine
+
+NAMES = [
+    'Jon Jonsson (Samf.)',
+    'Anna Sigurdardottir (Sjalfstfl.)',
+    'Gudmundur Ingi (Vinstri-gr.)',
+    'Inga Saeland (Fl. folksins)',
+    'Sigmundur David (Midfl.)',
+    'Thorgerdur Katrin (Vidreisn)',
+    'Sigurdur Ingi (Framsfl.)',
+    'Halldora Mogensen (Piratar)',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='auto')
+    parser.add_argument('--config', default=r'--oem 3 --psm 6 -l isl')
+    parser.add_argument('--rounds', type=int, default=2)
+    args = parser.parse_args()
+
+    engine = get_engine(args.config, args.backend)
+    print(f"Backend: {engine.name}")
+
+    mismatches = 0
+
+    for k in (4, 8, 16, 32):
+        images = [caption_image(NAMES[i % len(NAMES)]) for i in range(k)]
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            single = [engine.image_to_string(image) for image in images]
+        single_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            batched = batch_image_to_string(engine, images)
+        batch_elapsed = time.perf_counter() - start
+
+        matching = sum(a == b for a, b in zip(single, batched))
+        captions = k * args.rounds
+        print(f"K={k:>2}: per frame {captions / single_elapsed:.1f} captions/s, "
+              f"batched {captions / batch_elapsed:.1f} captions/s "
+              f"({single_elapsed / batch_elapsed:.2f}x), {matching}/{k} texts identical")
+        for i, (a, b) in enumerate(zip(single, batched)):
+            if a != b:
+                print(f"  image {i}: per frame {a!r}, batched {b!r}")
+        mismatches += k - matching
+
+    if mismatches:
+        print(f"{mismatches} batched texts differ from the per-frame texts")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
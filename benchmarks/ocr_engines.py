@@ -0,0 +1,55 @@
+"""
+Compares the OCR backends in ms/frame on a caption sized image.
+
+Usage:
+    python -m benchmarks.ocr_engines [--image logs/frames/<meeting>/processed_yellow_frame_<n>.png] [--frames 50]
+
+Without --image a speaker caption is drawn on a black 300x1450 image, the size of the yellow ROI.
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from src.processing.ocr import BACKENDS, get_engine
+
+
+def caption_image(text='Jon Jonsson (Samf.)', height=300, width=1450):
+    """
+    Draws white caption text on a black grayscale image.
+
+    Returns:
+    numpy.ndarray: The image.
+    """
+    image = np.zeros((height, width), dtype=np.uint8)
+    cv2.putText(image, text, (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, 255, 3, cv2.LINE_AA)
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--config', default=r'--oem 3 --psm 6 -l isl')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image, cv2.IMREAD_GRAYSCALE) if args.image else caption_image()
+
+    for backend in BACKENDS:
+        try:
+            engine = get_engine(args.config, backend)
+        except ImportError as e:
+            print(f"{backend:>12}: not available ({e})")
+            continue
+
+        text = engine.image_to_string(image)
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            engine.image_to_string(image)
+        elapsed = time.perf_counter() - start
+        print(f"{backend:>12}: {1000 * elapsed / args.frames:.1f} ms/frame, text {text!r}")
+
+
+if __name__ == "__main__":
+    main()
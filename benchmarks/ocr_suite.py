@@ -0,0 +1,263 @@
+"""
+Runs the OCR stage on a synthetic meeting video with known speaker changes, in every combination
+of the given settings, and reports its speed and how close the speaker changes it finds are.
+
+Usage:
+    python -m benchmarks.ocr_suite [--minutes 10] [--video-dir DIR] [--frame-skip 500]
+                                   [--backends pytesseract tesserocr] [--frame-sources opencv ffmpeg]
+                                   [--batches 1 8] [--gates on off] [--shards 1]
+                                   [--output results.json]
+
+The video is 1920x1080 at 25 fps, with yellow speaker captions and white topic captions drawn
+where `FrameProcessor` crops them, and gaps without a caption between some speakers. It and its
+ground truth are kept in --video-dir when given, and reused by later runs with the same length.
+
+Every setting runs `process_video` in a fresh process, so the peak RSS is its own. For each one
+the suite reports wall time, sampled frames per second, OCR calls, peak RSS and the error in
+seconds between the true speaker changes and the ones in the timeline, with the changes missed
+or found where there are none. The results are written as JSON to --output, or printed.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from src.processing.processing_v2 import process_video, similarity_score
+from src.processing.timeline import load_timeline
+
+FPS = 25
+WIDTH, HEIGHT = 1920, 1080
+NAME = 'synthetic-meeting'
+
+SPEAKERS = [
+    'Jon Jonsson (Samf.)',
+    'Anna Sigurdardottir (Sjalfstfl.)',
+    'Gudmundur Ingi (Vinstri-gr.)',
+    'Inga Saeland (Fl. folksins)',
+    'Sigmundur David (Midfl.)',
+    'Thorgerdur Katrin (Vidreisn)',
+    'Sigurdur Ingi (Framsfl.)',
+    'Halldora Mogensen (Piratar)',
+]
+
+TOPICS = [
+    'Fjarlog 2024, 1. umraeda',
+    'Storf thingsins',
+    'Oundirbunar fyrirspurnir',
+    'Husnaedismal, 2. umraeda',
+]
+
+# Same settings as the DAG
+PROCESSOR_ARGS = dict(
+    lower_yellow=np.array([29, 100, 100]),
+    upper_yellow=np.array([33, 255, 255]),
+    lower_white=np.array([240]),
+    upper_white=np.array([255]),
+)
+
+
+def make_truth(minutes, seed=0):
+    """
+    Returns speaker runs of 30 seconds to 2 minutes, some with a gap without a caption before them.
+    """
+    rng = random.Random(seed)
+    duration = minutes * 60
+    runs, start, speaker, topic = [], 5.0, None, TOPICS[0]
+    while start < duration - 30:
+        end = min(start + rng.uniform(30, 120), duration)
+        speaker = rng.choice([s for s in SPEAKERS if s != speaker])
+        if rng.random() < 0.1:
+            topic = rng.choice(TOPICS)
+        runs.append({'start': round(start, 2), 'end': round(end, 2), 'speaker': speaker, 'topic': topic})
+        start = end + (rng.uniform(5, 15) if rng.random() < 0.25 else 0)
+    return {'duration': duration, 'fps': FPS, 'runs': runs}
+
+
+def caption_frame(run=None):
+    """
+    Draws a frame with the captions of a run, or none, inside the yellow and white crop regions.
+    """
+    frame = np.full((HEIGHT, WIDTH, 3), 40, dtype=np.uint8)
+    cv2.rectangle(frame, (0, 0), (WIDTH, 680), (90, 60, 30), -1)
+    if run:
+        cv2.putText(frame, run['speaker'], (170, 780), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 255, 255), 4, cv2.LINE_AA)
+        cv2.putText(frame, run['topic'], (170, 900), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3, cv2.LINE_AA)
+    return frame
+
+
+def write_video(path, truth):
+    """
+    Writes the video of a ground truth, with a moving box so the frames are not all identical.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), FPS, (WIDTH, HEIGHT))
+    frames = {None: caption_frame()}
+    runs = iter(truth['runs'])
+    run = next(runs, None)
+    try:
+        for n in range(int(truth['duration'] * FPS)):
+            t = n / FPS
+            while run and t >= run['end']:
+                run = next(runs, None)
+            current = run if run and t >= run['start'] else None
+            key = current and current['start']
+            if key not in frames:
+                frames = {None: frames[None], key: caption_frame(current)}
+            frame = frames[key].copy()
+            x = (n * 8) % (WIDTH - 200)
+            frame[200:400, x:x + 200] = (200, 120, 60)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def prepare_video(video_dir, minutes):
+    """
+    Writes the video and its ground truth to a directory, unless they are there for this length.
+    """
+    video_path = os.path.join(video_dir, f'{NAME}.mp4')
+    truth_path = os.path.join(video_dir, f'{NAME}.json')
+    truth = make_truth(minutes)
+    if os.path.exists(video_path) and os.path.exists(truth_path):
+        with open(truth_path) as f:
+            if json.load(f) == truth:
+                return truth
+    print(f"Writing a {minutes:g} minute 1080p video to {video_path}")
+    write_video(video_path, truth)
+    with open(truth_path, 'w') as f:
+        json.dump(truth, f)
+    return truth
+
+
+def boundary_error(truth, records, tolerance):
+    """
+    Matches every true speaker change to the nearest one found, within the tolerance in seconds.
+
+    Returns:
+    dict: Mean and max error in seconds of the matched changes, the number missed and the number
+        found that match no true change, and the mean similarity of the matched speaker texts.
+    """
+    found = sorted(records, key=lambda record: record.pts)
+    used, errors, similarities = set(), [], []
+    for run in truth['runs']:
+        candidates = [(abs(record.pts - run['start']), i) for i, record in enumerate(found)
+                      if i not in used and abs(record.pts - run['start']) <= tolerance]
+        if not candidates:
+            continue
+        error, i = min(candidates)
+        used.add(i)
+        errors.append(error)
+        similarities.append(similarity_score(found[i].speaker.strip(), run['speaker']))
+    return {
+        'mean_error_s': round(float(np.mean(errors)), 3) if errors else None,
+        'max_error_s': round(float(np.max(errors)), 3) if errors else None,
+        'missed': len(truth['runs']) - len(errors),
+        'extra': len(found) - len(used),
+        'speaker_similarity': round(float(np.mean(similarities)), 3) if similarities else None,
+    }
+
+
+def measure(video_dir, work_dir, settings, frame_skip, custom_config):
+    """
+    Runs `process_video` in this process and returns its time, peak RSS in MB of the process and
+    its children, and errors.
+    """
+    start = time.perf_counter()
+    _, errors = process_video(video_dir, os.path.join(work_dir, 'logs'), custom_config=custom_config,
+                              frame_skip=frame_skip, start_time=0,
+                              manifest_path=os.path.join(work_dir, 'manifest.sqlite'), **PROCESSOR_ARGS,
+                              **settings)
+    elapsed = time.perf_counter() - start
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return elapsed, peak / 1024, errors
+
+
+def run(video_dir, work_dir, truth, settings, frame_skip, custom_config):
+    """
+    Runs one setting and returns its results.
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        elapsed, peak, errors = pool.apply(measure, (video_dir, work_dir, settings, frame_skip, custom_config))
+    result = dict(settings, wall_s=round(elapsed, 2), peak_rss_mb=round(peak))
+    if errors:
+        result['error'] = errors[f'{NAME}.mp4'].strip().splitlines()[-1]
+        return result
+
+    logs = os.path.join(work_dir, 'logs')
+    with open(os.path.join(logs, 'processing', NAME, f'{NAME}_stats.json')) as f:
+        stats = json.load(f)
+    result.update(stats, frames_per_s=round(stats['frames'] / elapsed, 2),
+                  realtime=round(truth['duration'] / elapsed, 1))
+    # A change is found at the first sample after it, or near it when refined
+    tolerance = frame_skip / FPS + 1
+    result.update(boundary_error(truth, load_timeline(os.path.join(logs, 'topic'), NAME), tolerance))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--video-dir')
+    parser.add_argument('--frame-skip', type=int, default=500)
+    parser.add_argument('--refine-precision', type=float, default=1.0)
+    parser.add_argument('--backends', nargs='+', default=['pytesseract', 'tesserocr'])
+    parser.add_argument('--frame-sources', nargs='+', default=['opencv', 'ffmpeg'])
+    parser.add_argument('--batches', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--gates', nargs='+', choices=['on', 'off'], default=['on'])
+    parser.add_argument('--shards', nargs='+', type=int, default=[1])
+    parser.add_argument('--config', default=r'--oem 3 --psm 6 -l isl')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_dir = args.video_dir or os.path.join(tmp_dir, 'video')
+        os.makedirs(video_dir, exist_ok=True)
+        truth = prepare_video(video_dir, args.minutes)
+
+        results = []
+        for i, (backend, source, batch, gate, shards) in enumerate(itertools.product(
+                args.backends, args.frame_sources, args.batches, args.gates, args.shards)):
+            settings = dict(ocr_backend=backend, frame_source=source, ocr_batch=batch,
+                            caption_gate=gate == 'on', shards=shards, refine_precision=args.refine_precision)
+            results.append(run(video_dir, os.path.join(tmp_dir, str(i)), truth, settings, args.frame_skip,
+                               args.config))
+
+    report = {
+        'video': {'minutes': args.minutes, 'width': WIDTH, 'height': HEIGHT, 'fps': FPS,
+                  'speaker_changes': len(truth['runs']), 'frame_skip': args.frame_skip},
+        'results': results,
+    }
+
+    print()
+    print(f"{'backend':>12} {'source':>7} {'batch':>5} {'gate':>5} {'shards':>6} {'wall':>8} {'frames/s':>8} "
+          f"{'ocr calls':>9} {'rss':>7} {'mean err':>8} {'max err':>8} {'missed':>6} {'extra':>5}")
+    for result in results:
+        row = (f"{result['ocr_backend']:>12} {result['frame_source']:>7} {result['ocr_batch']:>5} "
+               f"{'on' if result['caption_gate'] else 'off':>5} {result['shards']:>6} {result['wall_s']:>7.1f}s ")
+        if 'error' in result:
+            print(row + result['error'])
+            continue
+        print(row + f"{result['frames_per_s']:>8.1f} {result['ocr_calls']:>9} {result['peak_rss_mb']:>5}MB "
+              f"{result['mean_error_s'] if result['mean_error_s'] is not None else '-':>7}s "
+              f"{result['max_error_s'] if result['max_error_s'] is not None else '-':>7}s "
+              f"{result['missed']:>6} {result['extra']:>5}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
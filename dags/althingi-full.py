@@ -12,6 +12,8 @@ from src.processing.processing_v2 import process_video
 from src.processing.process_audio import process_raw_audio
 from src.processing.process_audio import label_processed_audio
 from src.google.gcs import AudioProcessor
+from src.processing.audio_format import get_format
+from src.processing import metrics
 
 
 # Retrieve the values of the Airflow variables
@@ -19,32 +21,47 @@ project_dir = Variable.get("project_dir", default_var="/data/")
 first_meeting = int(Variable.get("first_meeting", default_var="110"))
 max_retries = int(Variable.get("max_retries", default_var="50"))
 party_mapping = Variable.get("party_mapping_dir", default_var="/src/data/party_mapping.json")
+ocr_workers = int(Variable.get("ocr_workers", default_var="1"))
+ocr_shards = int(Variable.get("ocr_shards", default_var="1"))
+transcription_concurrency = int(Variable.get("transcription_concurrency", default_var="8"))
+# 'wav' for 44.1 kHz PCM, 'flac' for FLAC at 16 kHz
+audio_format = Variable.get("audio_format", default_var="wav")
+# Directory of the stage metrics, e.g. 'logs/metrics', empty to not record them
+metrics_dir = Variable.get("metrics_dir", default_var="")
 os.chdir(project_dir)
+metrics.configure(metrics_dir or None)
 
 def download_videos():
     download_meetings(first_meeting=first_meeting, max_downloads='all', max_retries=max_retries, logging=True)
 
 def transform_to_audio():
-    get_audio(video_dir=project_dir+'/videos', audio_dir=project_dir+'/audio/raw', video_format='.mp4', audio_format='.wav')
+    get_audio(video_dir=project_dir+'/videos', audio_dir=project_dir+'/audio/raw', video_format='.mp4', audio_format='.wav',
+              sample_rate=get_format(audio_format).sample_rate)
 
 def process_videos():
-    process_video(video_dir=project_dir+'/videos', log_dir=project_dir+'/logs', 
-                  lower_yellow=np.array([29, 100, 100]), 
-                  upper_yellow=np.array([33, 255, 255]), 
-                  lower_white=np.array([240]),
-                  upper_white=np.array([255]),
-                  custom_config=r'--oem 3 --psm 6 -l isl',
-                  frame_skip=500)
+    _, errors = process_video(video_dir=project_dir+'/videos', log_dir=project_dir+'/logs', 
+                              lower_yellow=np.array([29, 100, 100]), 
+                              upper_yellow=np.array([33, 255, 255]), 
+                              lower_white=np.array([240]),
+                              upper_white=np.array([255]),
+                              custom_config=r'--oem 3 --psm 6 -l isl',
+                              frame_skip=500,
+                              workers=ocr_workers,
+                              shards=ocr_shards)
+    # process_video records the failures in the manifest and carries on, fail the task so they are seen
+    if errors:
+        raise RuntimeError(f"{len(errors)} videos failed to process: {', '.join(sorted(errors))}")
 
 def process_audio():
-    process_raw_audio()
+    process_raw_audio(audio_format=audio_format)
 
 def label_audio(party_mapping=party_mapping):
     label_processed_audio()
 
 def upload_gcs():
     gcs_processor = AudioProcessor('SA/sa-althingi.json', 'althingi-audio-bucket')
-    gcs_processor.upload_files_to_bucket(project_dir + 'audio/labeled/20230601T132241-althingi-115')
+    gcs_processor.upload_files_to_bucket(project_dir + 'audio/labeled/20230601T132241-althingi-115',
+                                         audio_format=audio_format)
 
 def transcribe_gcs():
     gcs_processor = AudioProcessor(project_dir+'SA/sa-althingi.json', 'althingi-audio-bucket')
@@ -52,9 +69,14 @@ def transcribe_gcs():
         '20230601T132241-althingi-115',
         project_dir+'text/labeled/20230601T132241-althingi-115',
         'V1',
-        max_transcriptions=1
+        max_transcriptions=1,
+        concurrency=transcription_concurrency,
+        audio_format=audio_format
     )
 
+def export_metrics():
+    metrics.write_textfile()
+
 default_args = {
     'start_date': datetime(2023, 6, 1),
 }
@@ -108,4 +130,11 @@ t7 = PythonOperator(
     dag=dag,
 )
 
-t1 >> t2 >> t3 >> t4 >> t5 >> t6 >> t7
+t8 = PythonOperator(
+    task_id='export-metrics',
+    python_callable=export_metrics,
+    trigger_rule='all_done',
+    dag=dag,
+)
+
+t1 >> t2 >> t3 >> t4 >> t5 >> t6 >> t7 >> t8
@@ -0,0 +1,162 @@
+"""
+Runs the pipeline one meeting at a time instead of one stage at a time.
+
+Every run finds the ready meetings that have no transcripts yet and maps the whole pipeline over
+them as a task group, so each meeting moves from download to transcription as soon as its own
+inputs exist and a failure only stops that meeting. OCR runs in its own Airflow pool, create it
+before enabling the DAG:
+
+    airflow pools set ocr <slots> "OCR of meeting videos"
+
+Each OCR task takes ocr_shards slots of it. With the metrics_dir variable set, the stages record
+their metrics there and the last task of a run writes them out for the Prometheus node exporter.
+"""
+from airflow.decorators import dag, task, task_group
+from airflow.exceptions import AirflowSkipException
+from airflow.models import Variable
+
+import numpy as np
+from datetime import datetime
+import os
+
+from src.download.get_videos import download_meeting
+from src.transform.to_audio import get_video_audio
+from src.processing.processing_v2 import process_video_file
+from src.processing.process_audio import process_meeting_audio, label_meeting_audio
+from src.processing.audio_format import get_format
+from src.processing import metrics
+from src.processing.manifest import Manifest
+from src.google.gcs import AudioProcessor
+from src.web.get_meetings_id import get_max_fundarnr
+from src.web.metadata import MeetingStore
+
+
+# Retrieve the values of the Airflow variables
+project_dir = Variable.get("project_dir", default_var="/data/")
+lthing = int(Variable.get("lthing", default_var="153"))
+first_meeting = int(Variable.get("first_meeting", default_var="110"))
+max_meetings = int(Variable.get("max_meetings", default_var="16"))
+max_retries = int(Variable.get("max_retries", default_var="50"))
+party_mapping = Variable.get("party_mapping_dir", default_var="src/data/party_mapping.json")
+ocr_pool = Variable.get("ocr_pool", default_var="ocr")
+ocr_shards = int(Variable.get("ocr_shards", default_var="1"))
+transcription_concurrency = int(Variable.get("transcription_concurrency", default_var="8"))
+audio_format = Variable.get("audio_format", default_var="wav")
+metrics_dir = Variable.get("metrics_dir", default_var="")
+os.chdir(project_dir)
+metrics.configure(metrics_dir or None)
+
+
+# Files are transcribed under their blob names, a whole meeting under its video name
+TRANSCRIBE_STAGE = 'transcribe-V1'
+
+
+def meeting_video(fundnr):
+    """
+    Returns the downloaded video of a meeting of the session, or None.
+    """
+    video_path = MeetingStore().video_path(lthing, fundnr)
+    return video_path if video_path and os.path.isfile(video_path) else None
+
+
+def video_name(video_path):
+    return os.path.basename(video_path).split('.')[0]
+
+
+@dag(
+    dag_id='althingi-streaming',
+    start_date=datetime(2023, 6, 1),
+    schedule_interval='@hourly',
+    catchup=False,
+    max_active_runs=1,
+    description='DAG for processing each meeting as soon as it is ready',
+    doc_md=__doc__,
+)
+def althingi_streaming():
+
+    @task
+    def find_meetings():
+        # Update the meeting metadata, then take the ready meetings without transcripts
+        get_max_fundarnr(logging=True, lthing=lthing)
+        manifest = Manifest()
+        meetings = []
+        for fundnr in MeetingStore().ready_meetings(lthing, first_meeting):
+            video_path = meeting_video(fundnr)
+            if video_path and manifest.is_done(TRANSCRIBE_STAGE, video_name(video_path)):
+                continue
+            meetings.append(fundnr)
+        print(f"{len(meetings)} meetings to process, taking the first {max_meetings}: {meetings[:max_meetings]}")
+        return meetings[:max_meetings]
+
+    @task_group
+    def meeting(fundnr):
+
+        @task(max_active_tis_per_dag=3)
+        def download(fundnr):
+            video_path = download_meeting(lthing, fundnr, max_retries=max_retries)
+            if video_path is None:
+                raise AirflowSkipException(f"Meeting {fundnr} has no video yet")
+            return video_path
+
+        @task
+        def transform_to_audio(video_path):
+            get_video_audio(video_path, audio_dir='audio/raw', sample_rate=get_format(audio_format).sample_rate)
+
+        @task(pool=ocr_pool, pool_slots=ocr_shards)
+        def process_video(video_path):
+            process_video_file(video_path, log_dir='logs',
+                               lower_yellow=np.array([29, 100, 100]),
+                               upper_yellow=np.array([33, 255, 255]),
+                               lower_white=np.array([240]),
+                               upper_white=np.array([255]),
+                               custom_config=r'--oem 3 --psm 6 -l isl',
+                               frame_skip=500,
+                               shards=ocr_shards,
+                               party_mapping=party_mapping)
+
+        @task
+        def process_audio(video_path):
+            process_meeting_audio(video_name(video_path), audio_format=audio_format)
+            return video_name(video_path)
+
+        @task
+        def label_audio(name):
+            label_meeting_audio(name, party_mapping)
+            return name
+
+        @task
+        def upload_gcs(name):
+            gcs_processor = AudioProcessor('SA/sa-althingi.json', 'althingi-audio-bucket')
+            counts = gcs_processor.upload_files_to_bucket(os.path.join('audio/labeled', name), audio_format=audio_format)
+            if counts['failed']:
+                raise RuntimeError(f"{counts['failed']} audio files of {name} failed to upload")
+            return name
+
+        @task
+        def transcribe_gcs(name):
+            gcs_processor = AudioProcessor('SA/sa-althingi.json', 'althingi-audio-bucket')
+            counts = gcs_processor.transcribe_audio_files(
+                name,
+                os.path.join('text/labeled', name),
+                'V1',
+                concurrency=transcription_concurrency,
+                audio_format=audio_format
+            )
+            # The meeting is done once every file of it is, find_meetings leaves it out from then on
+            if counts['failed']:
+                raise RuntimeError(f"{counts['failed']} audio files of {name} failed to transcribe")
+            Manifest().complete(TRANSCRIBE_STAGE, name, os.path.join('text/labeled', name, 'V1'))
+
+        video_path = download(fundnr)
+        segments = process_audio(video_path)
+        [transform_to_audio(video_path), process_video(video_path)] >> segments
+        transcribe_gcs(upload_gcs(label_audio(segments)))
+
+    @task(trigger_rule='all_done')
+    def export_metrics():
+        metrics.write_textfile()
+
+    meeting.expand(fundnr=find_meetings()) >> export_metrics()
+
+
+althingi_streaming()
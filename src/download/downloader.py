@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from src.processing import metrics
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """
+    Returns how long to wait before a retry, growing exponentially with full jitter so parallel
+    connections that failed together do not retry together.
+
+    Args:
+    attempt (int): The number of attempts that failed so far, from 1.
+    base (float): The delay limit after the first failure, in seconds.
+    cap (float): The largest delay limit, in seconds.
+
+    Returns:
+    float: The delay in seconds.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def parts_digest(digests):
+    """
+    Combines the SHA-256 digests of the parts of a file into the checksum of the file.
+
+    Args:
+    digests (list): Hex digests of the parts, in order.
+
+    Returns:
+    str: The hex digest.
+    """
+    return hashlib.sha256(b''.join(bytes.fromhex(digest) for digest in digests)).hexdigest()
+
+
+def file_checksum(path, part_size):
+    """
+    Computes the checksum `RangedDownloader` records for a file, by reading it.
+
+    Args:
+    path (str): The file.
+    part_size (int): The part size used for the download.
+
+    Returns:
+    str: The hex digest.
+    """
+    digests = []
+    with open(path, 'rb') as f:
+        for part in iter(lambda: f.read(part_size), b''):
+            digests.append(hashlib.sha256(part).hexdigest())
+    return parts_digest(digests)
+
+
+class RangedDownloader:
+    """
+    A class used to download large files as parallel byte ranges, several files at a time.
+
+    A file is split into parts of part_size bytes which are requested with Range headers, written at
+    their offset in a preallocated '.part' file and hashed while they stream in. Finished parts are
+    recorded next to it with their digest, so an interrupted download continues where it stopped
+    and a recorded part whose bytes no longer match its digest is downloaded again. When all parts
+    are in, the file is renamed and its checksum, the SHA-256 of the SHA-256 of every part, is
+    written to '<file>.sha256', without reading the file again.
+
+    All downloads share one limit on open connections. Failed requests are retried with
+    exponential backoff and jitter. Servers without range support get a single stream.
+
+    ...
+
+    Attributes
+    ----------
+    connections : int
+        open connections allowed over all downloads
+    connections_per_file : int
+        open connections allowed for one file
+    part_size : int
+        bytes in each ranged request
+    chunk_size : int
+        bytes read from the socket at a time
+    max_retries : int
+        attempts for a part before its file fails
+    session : requests.Session
+        session with a connection pool as large as the limit
+
+    Methods
+    -------
+    download(url, path):
+        Downloads one file.
+    download_many(jobs, max_files=3):
+        Downloads several files at a time.
+    """
+
+    def __init__(self, connections=16, connections_per_file=8, part_size=64 << 20, chunk_size=1 << 20,
+                 max_retries=8, timeout=60):
+        """
+        Constructs all the necessary attributes for the RangedDownloader object.
+
+        Parameters
+        ----------
+        connections : int
+            open connections allowed over all downloads
+        connections_per_file : int
+            open connections allowed for one file
+        part_size : int
+            bytes in each ranged request, also the unit of the checksum
+        chunk_size : int
+            bytes read from the socket at a time
+        max_retries : int
+            attempts for a part before its file fails
+        timeout : float
+            seconds to wait for the server to connect or send data
+        """
+        self.connections = connections
+        self.connections_per_file = connections_per_file
+        self.part_size = part_size
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(connections)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=connections, pool_maxsize=connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def probe(self, url):
+        """
+        Asks the server for the size of a file and whether it serves ranges.
+
+        Returns:
+        tuple: (size in bytes or None, True if ranges are supported)
+        """
+        with self.slots:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        response.raise_for_status()
+        size = response.headers.get('content-length')
+        ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+        return (int(size) if size else None), ranges
+
+    def download(self, url, path):
+        """
+        Downloads one file, unless it is already there with the size the server reports.
+
+        Args:
+        url (str): The URL of the file.
+        path (str): Where to write the file.
+
+        Returns:
+        str: The checksum of the file, or None if it was already downloaded.
+        """
+        # A finished download has its checksum next to it and needs no request
+        if os.path.exists(path) and os.path.exists(f'{path}.sha256'):
+            return None
+
+        size, ranges = self.probe(url)
+        if size is not None and os.path.exists(path) and os.path.getsize(path) == size:
+            # Downloaded before checksums were kept, recorded once so later runs skip the request
+            self._write_checksum(path, file_checksum(path, self.part_size))
+            return None
+        with metrics.stage('download', os.path.basename(path).split('.')[0]):
+            if size is None or not ranges or size == 0:
+                return self._download_stream(url, path)
+            return self._download_ranges(url, path, size)
+
+    def _download_ranges(self, url, path, size):
+        """
+        Downloads a file as parts over several connections, resuming from the parts already done.
+
+        Returns:
+        str: The checksum of the file.
+        """
+        part_path = f'{path}.part'
+        state_path = f'{path}.parts'
+        parts = [(offset, min(self.part_size, size - offset)) for offset in range(0, size, self.part_size)]
+        done = self._load_state(state_path, size, part_path)
+
+        if not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            done = {}
+        elif done:
+            done = self._verify_parts(part_path, parts, done)
+
+        lock = threading.Lock()
+        progress = tqdm(total=size, initial=sum(parts[i][1] for i in done), unit='B', unit_scale=True,
+                        desc=os.path.basename(path))
+        fd = os.open(part_path, os.O_WRONLY)
+
+        def fetch(index):
+            digest = self._fetch_part(url, fd, *parts[index], progress)
+            with lock:
+                done[index] = digest
+                self._save_state(state_path, size, done)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections_per_file) as pool:
+                futures = [pool.submit(fetch, i) for i in range(len(parts)) if i not in done]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            os.close(fd)
+            progress.close()
+
+        checksum = parts_digest([done[i] for i in range(len(parts))])
+        os.replace(part_path, path)
+        os.remove(state_path)
+        self._write_checksum(path, checksum)
+        return checksum
+
+    def download_many(self, jobs, max_files=3):
+        """
+        Downloads several files at a time, within the shared connection limit.
+
+        Args:
+        jobs (dict): Maps a key, e.g. the meeting number, to (url, path).
+        max_files (int): The number of files downloaded at a time.
+
+        Returns:
+        tuple: (results, errors), mapping keys to the checksum from `download` and to the exception
+            of the files that failed.
+        """
+        results, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=max_files) as pool:
+            futures = {pool.submit(self.download, url, path): key for key, (url, path) in jobs.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    errors[key] = e
+        return results, errors
+
+    def _fetch_part(self, url, fd, offset, length, progress):
+        """
+        Downloads one part into the file, retrying from the bytes already received.
+
+        Returns:
+        str: The hex SHA-256 digest of the part.
+        """
+        digest = hashlib.sha256()
+        received = 0
+        attempt = 0
+        while received < length:
+            try:
+                headers = {'Range': f'bytes={offset + received}-{offset + length - 1}'}
+                with self.slots, self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise requests.exceptions.HTTPError(
+                            f"Expected 206 for a range, got {response.status_code}", response=response)
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        chunk = chunk[:length - received]
+                        os.pwrite(fd, chunk, offset + received)
+                        digest.update(chunk)
+                        received += len(chunk)
+                        progress.update(len(chunk))
+                        metrics.inc('download_bytes', len(chunk))
+                if received < length:
+                    raise requests.exceptions.ConnectionError("Range ended early")
+            except requests.exceptions.RequestException:
+                attempt += 1
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+        return digest.hexdigest()
+
+    def _download_stream(self, url, path):
+        """
+        Downloads a file over one connection, for servers without range support.
+
+        Returns:
+        str: The checksum of the file.
+        """
+        part_path = f'{path}.part'
+        attempt = 0
+        while True:
+            digests, digest, filled = [], hashlib.sha256(), 0
+            try:
+                with self.slots, self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    with open(part_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                            metrics.inc('download_bytes', len(chunk))
+                            while chunk:
+                                taken = chunk[:self.part_size - filled]
+                                digest.update(taken)
+                                filled += len(taken)
+                                chunk = chunk[len(taken):]
+                                if filled == self.part_size:
+                                    digests.append(digest.hexdigest())
+                                    digest, filled = hashlib.sha256(), 0
+                break
+            except requests.exceptions.RequestException:
+                attempt += 1
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+        if filled:
+            digests.append(digest.hexdigest())
+
+        checksum = parts_digest(digests)
+        os.replace(part_path, path)
+        self._write_checksum(path, checksum)
+        return checksum
+
+    def _load_state(self, state_path, size, part_path):
+        if not (os.path.exists(state_path) and os.path.exists(part_path)):
+            return {}
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+        if state.get('size') != size or state.get('part_size') != self.part_size:
+            return {}
+        return {int(index): digest for index, digest in state['done'].items()}
+
+    def _verify_parts(self, part_path, parts, done):
+        # Keeps the parts whose bytes in the file still have the digest they were recorded with
+        verified = {}
+        with open(part_path, 'rb') as f:
+            for index, digest in done.items():
+                offset, length = parts[index]
+                f.seek(offset)
+                if hashlib.sha256(f.read(length)).hexdigest() == digest:
+                    verified[index] = digest
+        return verified
+
+    def _save_state(self, state_path, size, done):
+        with open(f'{state_path}.tmp', 'w') as f:
+            json.dump({'size': size, 'part_size': self.part_size, 'done': done}, f)
+        os.replace(f'{state_path}.tmp', state_path)
+
+    def _write_checksum(self, path, checksum):
+        with open(f'{path}.sha256', 'w') as f:
+            f.write(f'{checksum}  {os.path.basename(path)}  parts={self.part_size}\n')
@@ -1,105 +1,106 @@
-def download_meetings(first_meeting=110, max_downloads='all', max_retries=50, logging=True):
-    import os
-    import time
-    import requests
-    from bs4 import BeautifulSoup
-    from tqdm import tqdm
+import os
+
+
+def video_file_path(video_url, fundnr, video_dir='videos'):
+    """
+    Returns where the video of a meeting is saved.
+
+    Args:
+    video_url (str): The URL of the video.
+    fundnr (int): The meeting number.
+    video_dir (str): The directory of the videos.
+
+    Returns:
+    str: The path, the file name of the URL with the meeting number before the extension.
+    """
+    # Split the video URL at the last '/' to get the filename, and then split at '.' to insert the postfix before the file extension
+    video_file_parts = video_url.split('/')[-1].split('.')
+    return os.path.join(video_dir, f"{video_file_parts[0]}-althingi-{fundnr}.{video_file_parts[1]}")
+
+
+def download_meetings(first_meeting=110, max_downloads='all', max_retries=50, logging=True,
+                      connections=16, connections_per_file=8, max_files=3,
+                      lthing=153, sessions=None, cache_dir='logs/http_cache', crawl_concurrency=8, crawl_rate=4.0,
+                      store_path='logs/metadata/meetings.sqlite'):
+    from src.download.downloader import RangedDownloader
+    from src.web.crawler import MeetingCrawler
     from src.web.get_meetings_id import get_max_fundarnr
+    from src.web.metadata import MeetingStore
 
 
     print(f"Current working directory: {os.getcwd()}")
     if not os.path.exists('videos'):
         os.makedirs('videos')
 
-    # Get logs to see what is ready if max_fundarnr is not specified
-    max_fundarnr = get_max_fundarnr(logging=logging)
-
-    # Set range for downloads based on max_downloads parameter
-    if max_downloads == 'all':
-        download_range = range(first_meeting, max_fundarnr+1)
+    store = MeetingStore(store_path)
+    if sessions is None:
+        # Update the meeting metadata, then take the ready meetings that are not downloaded yet
+        get_max_fundarnr(logging=logging, lthing=lthing, store_path=store_path, cache_dir=cache_dir)
+        download_range = store.ready_meetings(lthing, first_meeting, downloaded=False)
+
+        # Limit the downloads based on max_downloads parameter
+        if max_downloads != 'all':
+            download_range = download_range[:max_downloads]
+        sessions = {lthing: download_range}
+
+    # Find the videos of the meetings, pages that already link a video are read from the cache
+    crawler = MeetingCrawler(cache_dir=cache_dir, concurrency=crawl_concurrency, rate=crawl_rate)
+    video_links = crawler.video_links(sessions)
+
+    jobs = {}
+    for (session, i), video_url in video_links.items():
+        jobs[(session, i)] = (video_url, video_file_path(video_url, i))
+
+    # Download several meetings at a time, each over several connections
+    downloader = RangedDownloader(connections=connections, connections_per_file=connections_per_file,
+                                  max_retries=max_retries)
+    results, errors = downloader.download_many(jobs, max_files=max_files)
+
+    for session, i in sorted(jobs):
+        key = (session, i)
+        if key in errors:
+            print(f"Download failed for meeting {i} of session {session} due to {type(errors[key]).__name__}: {errors[key]}")
+        else:
+            if results[key] is None:
+                print(f"Video for meeting {i} of session {session} is already downloaded.")
+            else:
+                print(f"Downloaded video for meeting {i} of session {session} to {jobs[key][1]} (sha256 {results[key]})")
+            store.mark_downloaded(session, i, jobs[key][1])
+
+
+def download_meeting(lthing, fundnr, max_retries=50, connections=8, cache_dir='logs/http_cache',
+                     store_path='logs/metadata/meetings.sqlite'):
+    """
+    Downloads the video of one meeting and records it in the meeting store.
+
+    Args:
+    lthing (int): The session.
+    fundnr (int): The meeting number.
+    max_retries (int): Attempts for each part of the video.
+    connections (int): Open connections for the video.
+    cache_dir (str): The directory of the HTTP cache of meeting pages.
+    store_path (str): The meeting metadata store.
+
+    Returns:
+    str: The path of the video, or None if the meeting has no video yet.
+    """
+    from src.download.downloader import RangedDownloader
+    from src.web.crawler import MeetingCrawler
+    from src.web.metadata import MeetingStore
+
+    crawler = MeetingCrawler(cache_dir=cache_dir, concurrency=1)
+    video_url = crawler.video_links({lthing: [fundnr]}).get((lthing, fundnr))
+    if video_url is None:
+        print(f"Meeting {fundnr} of session {lthing} has no video yet.")
+        return None
+
+    os.makedirs('videos', exist_ok=True)
+    video_path = video_file_path(video_url, fundnr)
+    downloader = RangedDownloader(connections=connections, connections_per_file=connections, max_retries=max_retries)
+    checksum = downloader.download(video_url, video_path)
+    if checksum is None:
+        print(f"Video for meeting {fundnr} of session {lthing} is already downloaded.")
     else:
-        download_range = range(first_meeting, min(first_meeting + max_downloads, max_fundarnr+1))
-
-    # Loop through the pages as described
-    for i in download_range:
-        url = f'https://www.althingi.is/altext/upptokur/thingfundur/?lthing=153&fundnr={i}'
-
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Find all links in the webpage
-        links = soup.find_all('a')
-
-        # # Loop through all links and download the .mp4 files
-        # for link in links:
-        #     if 'Vídeóskrá með fundinum' in link.text:
-        #         video_url = link['href']
-        #         # Split the video URL at the last '/' to get the filename, and then split at '.' to insert the postfix before the file extension
-        #         video_file_parts = video_url.split('/')[-1].split('.')
-        #         video_name = os.path.join('videos', f"{video_file_parts[0]}-althingi-{i}.{video_file_parts[1]}")
-
-        #         # Check if the file already exists and get its size
-        #         if os.path.exists(video_name):
-        #             downloaded_size = os.path.getsize(video_name)
-        #         else:
-        #             downloaded_size = 0
-
-        for link in links:
-            if 'Vídeóskrá með fundinum' in link.text:
-                video_url = link['href']
-                # Split the video URL at the last '/' to get the filename, and then split at '.' to insert the postfix before the file extension
-                video_file_parts = video_url.split('/')[-1].split('.')
-                video_name = os.path.join('videos', f"{video_file_parts[0]}-althingi-{i}.{video_file_parts[1]}")
-
-                # Check if the file already exists and get its size
-                if os.path.exists(video_name):
-                    downloaded_size = os.path.getsize(video_name)
-
-                    # Get content length from server
-                    server_response = requests.head(video_url)
-                    server_file_size = int(server_response.headers.get('content-length', 0))
-
-                    if downloaded_size == server_file_size:
-                        print(f"Video for meeting {i} is already downloaded.")
-                        continue
-                else:
-                    downloaded_size = 0
-                    
-                retries = max_retries
-                while retries > 0:
-                    try:
-                        headers = {'Range': f'bytes={downloaded_size}-'}  # Updated Range header
-
-                        # Request with stream=True and the Range header
-                        with requests.get(video_url, headers=headers, stream=True, timeout=None) as video_response:
-                            if video_response.status_code == 416:
-                                print(f"Range not satisfiable. Download for meeting {i} is complete.")
-                                break
-                            print(f"Response status: {video_response.status_code}, headers: {video_response.headers}")
-                            video_response.raise_for_status()
-                            total_size = int(video_response.headers.get('content-length', 0)) + downloaded_size
-                            progress_bar = tqdm(total=total_size, initial=downloaded_size, unit='B', unit_scale=True)
-
-                            with open(video_name, 'ab') as video_file:
-                                for chunk in video_response.iter_content(chunk_size=8192):  # Increased chunk size
-                                    if chunk:
-                                        video_file.write(chunk)
-                                        downloaded_size += len(chunk)
-                                        progress_bar.update(len(chunk))
-
-                            progress_bar.close()
-
-                            # Verify if the file has been downloaded completely
-                            if downloaded_size < total_size:
-                                raise Exception("Download incomplete")
-
-                        print(f"Downloaded video for meeting {i} to {video_name}")
-                        break
-                    except (requests.exceptions.RequestException, requests.exceptions.Timeout, requests.exceptions.ConnectionError, Exception) as e:  # handle network errors and timeouts and incomplete downloads
-                        print(f"Download failed for meeting {i} due to {type(e).__name__}: {e}")
-                        retries -= 1
-                        if retries == 0:
-                            print(f"Max retries reached for meeting {i}. Skipping the download.")
-                        else:
-                            print(f"Retrying download for meeting {i} in 2 seconds...")
-                            time.sleep(2)  # Wait for 2 seconds before retrying
+        print(f"Downloaded video for meeting {fundnr} of session {lthing} to {video_path} (sha256 {checksum})")
+    MeetingStore(store_path).mark_downloaded(lthing, fundnr, video_path)
+    return video_path
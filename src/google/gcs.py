@@ -1,8 +1,23 @@
 import os
+import base64
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import google_crc32c
 from google.oauth2 import service_account
 from google.cloud import storage
 from google.cloud import speech_v1p1beta1 as speech
 from typing import Optional
+from google.api_core import exceptions
+from src.download.downloader import backoff_delay
+from src.google.transcript_cache import TranscriptCache, config_key, content_key
+from src.processing.audio_format import get_format
+from src.processing import metrics
+from src.processing.manifest import Manifest
+
+# Errors that mean the request may succeed later
+RETRYABLE_ERRORS = (exceptions.ResourceExhausted, exceptions.TooManyRequests, exceptions.ServiceUnavailable,
+                    exceptions.InternalServerError, exceptions.DeadlineExceeded)
 
 class AudioProcessor:
     """
@@ -23,72 +38,281 @@ class AudioProcessor:
         self.client = speech.SpeechClient(credentials=credentials)
         self.bucket = self.storage_client.get_bucket(bucket_name)
 
-    def upload_files_to_bucket(self, folder_path: str):
+    def upload_files_to_bucket(self, folder_path: str, workers: int = 8, chunk_size: int = 8 * 1024 * 1024,
+                               resumable_threshold: int = 16 * 1024 * 1024, audio_format: str = 'wav') -> dict:
         """
-        Uploads all .wav files from a local directory to the Google Cloud Storage bucket.
+        Uploads all audio files of the pipeline's format from a local directory to the Google Cloud Storage bucket, skipping those
+        whose content is already there.
+
+        The bucket is listed once. A file is skipped when a blob with its name has the same size and the
+        same CRC32C, or MD5 for blobs without one. Files are uploaded by a pool of threads, those larger
+        than resumable_threshold as resumable uploads in chunks of chunk_size.
 
         Args:
-            folder_path (str): The local path to the folder containing the .wav files to be uploaded.
+            folder_path (str): The local path to the folder containing the audio files to be uploaded.
+            workers (int): The number of files uploaded at a time.
+            chunk_size (int): The chunk size of resumable uploads, a multiple of 256 KB.
+            resumable_threshold (int): Files larger than this many bytes are uploaded in chunks.
+            audio_format (str): The audio format of the pipeline, see `AUDIO_FORMATS`.
+
+        Returns:
+            dict: The number of files 'uploaded', 'skipped' and 'failed'.
         """
         prefix = os.path.basename(folder_path)
+        extension = get_format(audio_format).extension
 
-        # Find all .wav files in the folder tree, excluding those in 'unlabeled' directories
-        for root, dirs, files in os.walk(folder_path):
+        # Find all audio files in the folder tree, excluding those in 'unlabeled' directories
+        files = {}
+        for root, dirs, filenames in os.walk(folder_path):
             if 'unlabeled' not in root:  # exclude 'unlabeled' directories
-                for file in files:
-                    if file.endswith('.wav'):
+                for file in filenames:
+                    if file.endswith(extension):
                         file_path = os.path.join(root, file)
                         blob_name = os.path.relpath(file_path, folder_path)  # Get the relative path to use as blob name
                         blob_name = f"{prefix}/{blob_name}"  # Prepend the prefix
                         blob_name = blob_name.replace('\\', '/')  # Replace backslashes with forward slashes
-                        blob = self.bucket.blob(blob_name)
-                        blob.upload_from_filename(file_path)
-                        print(f"File {file_path} uploaded to {self.bucket.name}/{blob_name}.")
+                        files[blob_name] = file_path
+
+        # One listing gives the size and checksums of every blob under the prefix
+        remote = {blob.name: blob for blob in self.bucket.list_blobs(prefix=f"{prefix}/")}
+
+        def upload(blob_name):
+            file_path = files[blob_name]
+            if blob_name in remote and self.is_unchanged(file_path, remote[blob_name]):
+                return 'skipped'
+            size = os.path.getsize(file_path)
+            blob = self.bucket.blob(blob_name, chunk_size=chunk_size if size > resumable_threshold else None)
+            blob.upload_from_filename(file_path)
+            metrics.inc('upload_bytes', size)
+            print(f"File {file_path} uploaded to {self.bucket.name}/{blob_name}.")
+            return 'uploaded'
 
-    def transcribe_audio_files(self, prefix: str, text_folder_path: str, api_version: str, max_transcriptions: Optional[int] = None):
+        counts = {'uploaded': 0, 'skipped': 0, 'failed': 0}
+        with metrics.stage('upload', prefix), ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(upload, blob_name): blob_name for blob_name in files}
+            for future in as_completed(futures):
+                try:
+                    counts[future.result()] += 1
+                except Exception as e:
+                    counts['failed'] += 1
+                    print(f"Uploading {files[futures[future]]} failed due to {type(e).__name__}: {e}")
+        for result, count in counts.items():
+            metrics.inc('files_uploaded', count, result=result)
+
+        print(f"Uploaded {counts['uploaded']} files, skipped {counts['skipped']} unchanged and {counts['failed']} failed.")
+        return counts
+
+    @staticmethod
+    def is_unchanged(file_path: str, blob) -> bool:
+        """
+        Checks whether a local file has the same content as a blob from a bucket listing.
+
+        Args:
+            file_path (str): The local file.
+            blob (google.cloud.storage.Blob): The blob, with the metadata returned by list_blobs.
+
+        Returns:
+            bool: True if the sizes and the CRC32C, or MD5 when the blob has no CRC32C, are equal.
+        """
+        if blob.size is not None and blob.size != os.path.getsize(file_path):
+            return False
+        if blob.crc32c:
+            checksum, expected = google_crc32c.Checksum(), base64.b64decode(blob.crc32c)
+        elif blob.md5_hash:
+            checksum, expected = hashlib.md5(), base64.b64decode(blob.md5_hash)
+        else:
+            return False
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                checksum.update(chunk)
+        return checksum.digest() == expected
+
+    def transcribe_audio_files(self, prefix: str, text_folder_path: str, api_version: str, max_transcriptions: Optional[int] = None,
+                               concurrency: int = 8, poll_interval: float = 5.0, timeout: float = 60 * 20,
+                               max_retries: int = 6, cache_path: Optional[str] = 'text/transcripts.sqlite',
+                               audio_format: str = 'wav', manifest_path: str = 'logs/manifest.sqlite',
+                               cache_max_entries: Optional[int] = None, cache_max_age_days: Optional[float] = 365) -> dict:
         """
         Transcribes audio files stored on Google Cloud Storage.
 
+        Which files are transcribed already comes from the manifest, where each file is marked done with
+        the hash of its audio once its transcript is written, so changed audio is transcribed again.
+
+        Up to `concurrency` long running recognitions are in flight at a time. They are polled together
+        and each transcription is written as soon as its operation finishes. Requests the API turns down
+        for quota or availability are retried with exponential backoff.
+
+        Transcripts are cached by the hash of the audio and of the recognition settings, so audio that was
+        transcribed before under another name, or appears under several names, is only paid for once.
+
         Args:
             prefix (str): The prefix to filter audio files in the bucket.
             text_folder_path (str): The local path where the transcriptions will be saved.
             api_version (str): The version of the Google Speech-to-Text API to use ('V1' or 'V2').
             max_transcriptions (int, optional): The maximum number of transcriptions to create. If None, all audio files will be transcribed.
+                Files found in the cache do not count towards it and are written regardless.
+            concurrency (int): The number of operations in flight at a time, 1 waits for each file before the next.
+            poll_interval (float): Seconds between two checks of the operations in flight.
+            timeout (float): Seconds an operation may take before it is given up.
+            max_retries (int): Attempts to start an operation before the file is given up.
+            cache_path (str, optional): The transcript cache database, None to not use a cache.
+            audio_format (str): The audio format of the pipeline, see `AUDIO_FORMATS`. The files of the format
+                are transcribed with its encoding and sample rate.
+            manifest_path (str): The pipeline manifest.
+            cache_max_entries (int, optional): Transcripts kept in the cache at most, the least recently used
+                are removed after the run. None for no limit.
+            cache_max_age_days (float, optional): Days a transcript is kept in the cache after it was last used.
+                None for no limit.
+
+        Returns:
+            dict: The number of files 'transcribed', served from the 'cached' transcripts, 'skipped' because
+                they already were and 'failed'.
         """
         text_folder_path = os.path.join(text_folder_path, api_version)
-        blobs = self.bucket.list_blobs(prefix=prefix)
-        transcribed_count = 0
-
-        for blob in blobs:
-            if blob.name.endswith('.wav'):
-                gcs_uri = f'gs://{self.bucket.name}/{blob.name}'
-                config = speech.RecognitionConfig(
-                    encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                    sample_rate_hertz=44100,
-                    language_code='is-IS',
-                    model='default'
-                )
+        audio_format = get_format(audio_format)
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding[audio_format.encoding],
+            sample_rate_hertz=audio_format.sample_rate,
+            language_code='is-IS',
+            model='default'
+        )
+        cache = TranscriptCache(cache_path) if cache_path else None
+        settings = config_key(config, api_version)
+        counts = {'transcribed': 0, 'cached': 0, 'skipped': 0, 'failed': 0}
+        manifest = Manifest(manifest_path)
+        stage = f'transcribe-{api_version}'
+        done = manifest.done(stage)
 
+        # The files still to transcribe, in listing order
+        pending = []
+        for blob in self.bucket.list_blobs(prefix=prefix):
+            if blob.name.endswith(audio_format.extension):
                 # Construct the output file path
-                output_file_path = blob.name.replace('.wav', '.txt').replace(prefix, text_folder_path)
-                os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+                output_file_path = blob.name.replace(audio_format.extension, '.txt').replace(prefix, text_folder_path)
+                content = content_key(blob)
 
-                # Check if the output file already exists, skip this blob if it does
-                if os.path.isfile(output_file_path):
-                    print(f"File {output_file_path} already exists, skipping...")
+                # Transcribed before the manifest was kept
+                if blob.name not in done and os.path.isfile(output_file_path):
+                    manifest.complete(stage, blob.name, output_file_path, content)
+                    done[blob.name] = content
+
+                # Skip this blob if its audio is transcribed
+                if done.get(blob.name) == content:
+                    counts['skipped'] += 1
                     continue
+                key = TranscriptCache.key(content, settings)
+                pending.append((f'gs://{self.bucket.name}/{blob.name}', output_file_path, key, blob.name, content))
+        pending.reverse()
+
+        def write(output_file_path, transcript, blob_name, content):
+            self._write_transcript(output_file_path, transcript)
+            manifest.complete(stage, blob_name, output_file_path, content)
 
-                audio = speech.RecognitionAudio(uri=gcs_uri)
-                operation = self.client.long_running_recognize(config=config, audio=audio)
+        # Operations in flight by cache key, with every output file waiting for the same audio
+        in_flight = {}
+        submitted = 0
+        while pending or in_flight:
+            # Fan out up to the concurrency limit
+            while pending and len(in_flight) < concurrency:
+                gcs_uri, output_file_path, key, blob_name, content = pending[-1]
+                if key in in_flight:
+                    in_flight[key][2].append((output_file_path, blob_name, content))
+                    pending.pop()
+                    continue
+                transcript = cache.get(key) if cache else None
+                if transcript is not None:
+                    write(output_file_path, transcript, blob_name, content)
+                    counts['cached'] += 1
+                    pending.pop()
+                    continue
+                pending.pop()
+                if max_transcriptions and submitted >= max_transcriptions:
+                    # Over the limit, only files found in the cache are still written
+                    continue
+                try:
+                    operation = self._start_recognition(config, gcs_uri, max_retries)
+                except exceptions.GoogleAPICallError as e:
+                    print(f"Starting transcription of {gcs_uri} failed due to {type(e).__name__}: {e}")
+                    manifest.fail(stage, blob_name, f'{type(e).__name__}: {e}')
+                    counts['failed'] += 1
+                    continue
+                submitted += 1
                 print(f"Waiting for operation: \n {output_file_path}\nto complete...")
-                response = operation.result(timeout=60*20)
+                manifest.start(stage, blob_name, content)
+                in_flight[key] = (operation, time.monotonic(), [(output_file_path, blob_name, content)])
+
+            if not in_flight:
+                break
 
-                with open(output_file_path, 'w') as f:
-                    for result in response.results:
-                        # Write each transcription to the file
-                        f.write(result.alternatives[0].transcript + '\n')
+            # Fan in whatever finished
+            finished = False
+            for key, (operation, started, outputs) in list(in_flight.items()):
+                try:
+                    if not operation.done():
+                        if time.monotonic() - started > timeout:
+                            raise TimeoutError(f"no result after {timeout} seconds")
+                        continue
+                    transcript = self._transcript_text(operation.result())
+                    metrics.observe('transcription_seconds', time.monotonic() - started)
+                    if cache:
+                        cache.put(key, transcript)
+                    for output_file_path, blob_name, content in outputs:
+                        write(output_file_path, transcript, blob_name, content)
+                    counts['transcribed'] += 1
+                    counts['cached'] += len(outputs) - 1
+                except (exceptions.GoogleAPICallError, TimeoutError) as e:
+                    print(f"Transcription of {outputs[0][0]} failed due to {type(e).__name__}: {e}")
+                    for _, blob_name, _ in outputs:
+                        manifest.fail(stage, blob_name, f'{type(e).__name__}: {e}')
+                    counts['failed'] += len(outputs)
+                del in_flight[key]
+                finished = True
 
-                transcribed_count += 1   # Increment the count here
+            if in_flight and not finished:
+                time.sleep(poll_interval)
 
-                if max_transcriptions and transcribed_count >= max_transcriptions:
-                    break
+        print(f"Transcribed {counts['transcribed']} files, served {counts['cached']} from the cache, "
+              f"skipped {counts['skipped']} and {counts['failed']} failed.")
+        if cache:
+            print(f"Transcript cache: {cache.stats()}")
+            if cache_max_entries is not None or cache_max_age_days is not None:
+                evicted = cache.evict(cache_max_entries, cache_max_age_days)
+                if evicted:
+                    print(f"Removed {evicted} transcripts from the cache.")
+        return counts
+
+    def _start_recognition(self, config, gcs_uri: str, max_retries: int):
+        """
+        Starts a long running recognition, retrying with exponential backoff while the API is over quota
+        or unavailable.
+
+        Returns:
+            google.api_core.operation.Operation: The operation.
+        """
+        audio = speech.RecognitionAudio(uri=gcs_uri)
+        for attempt in range(1, max_retries + 1):
+            try:
+                return self.client.long_running_recognize(config=config, audio=audio)
+            except RETRYABLE_ERRORS:
+                if attempt == max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt, base=2.0))
+
+    @staticmethod
+    def _transcript_text(response) -> str:
+        """
+        Returns the transcript of a recognition response, one line per result.
+        """
+        # Write each transcription on its own line
+        return ''.join(result.alternatives[0].transcript + '\n' for result in response.results)
+
+    @staticmethod
+    def _write_transcript(output_file_path: str, transcript: str):
+        """
+        Writes a transcript, under a temporary name first so an interrupted write is not taken for a
+        finished file.
+        """
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        with open(f'{output_file_path}.tmp', 'w') as f:
+            f.write(transcript)
+        os.replace(f'{output_file_path}.tmp', output_file_path)
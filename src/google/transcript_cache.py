@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+from typing import Optional
+
+
+def content_key(blob) -> str:
+    """
+    Returns a key for the audio content of a blob from its listing metadata, without downloading it.
+
+    Args:
+        blob (google.cloud.storage.Blob): The blob, with the metadata returned by list_blobs.
+
+    Returns:
+        str: 'md5:<hash>', or 'crc32c:<hash>:<size>' for blobs without an MD5, such as composed ones.
+    """
+    if blob.md5_hash:
+        return f'md5:{blob.md5_hash}'
+    return f'crc32c:{blob.crc32c}:{blob.size}'
+
+
+def config_key(config, api_version: str) -> str:
+    """
+    Returns a key for the recognition settings that change a transcript.
+
+    Args:
+        config (speech.RecognitionConfig): The recognition config.
+        api_version (str): The version of the Google Speech-to-Text API.
+
+    Returns:
+        str: The settings as sorted JSON.
+    """
+    return json.dumps({
+        'api_version': api_version,
+        'encoding': int(config.encoding),
+        'sample_rate_hertz': config.sample_rate_hertz,
+        'audio_channel_count': config.audio_channel_count,
+        'language_code': config.language_code,
+        'model': config.model,
+        'use_enhanced': config.use_enhanced,
+    }, sort_keys=True)
+
+
+class TranscriptCache:
+    """
+    A class used to keep transcripts in SQLite, keyed by the hash of the audio content and of the
+    recognition settings, so renamed or relabeled audio is never transcribed twice.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        path to the SQLite database
+    hits : int
+        lookups answered from the cache since the object was created
+    misses : int
+        lookups not in the cache since the object was created
+
+    Methods
+    -------
+    key(content, settings):
+        Returns the cache key of audio content and recognition settings.
+    get(key):
+        Returns a cached transcript.
+    put(key, transcript):
+        Stores a transcript.
+    stats():
+        Returns hit and miss statistics.
+    evict(max_entries=None, max_age_days=None):
+        Removes the least recently used transcripts.
+    """
+
+    def __init__(self, path: str = 'text/transcripts.sqlite'):
+        """
+        Constructs all the necessary attributes for the TranscriptCache object.
+
+        Parameters
+        ----------
+        path : str
+            path to the SQLite database, created if it does not exist
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS transcripts ('
+                ' key TEXT PRIMARY KEY, transcript TEXT NOT NULL, created REAL NOT NULL,'
+                ' last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def key(content: str, settings: str) -> str:
+        """
+        Returns the cache key of audio content and recognition settings.
+
+        Args:
+            content (str): The content key, see `content_key`.
+            settings (str): The settings key, see `config_key`.
+
+        Returns:
+            str: The SHA-256 hex digest of both.
+        """
+        return hashlib.sha256(f'{content}\n{settings}'.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns a cached transcript and counts the lookup.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The transcript, or None if it is not cached.
+        """
+        with self._connect() as db:
+            row = db.execute('SELECT transcript FROM transcripts WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute('UPDATE transcripts SET last_used = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, transcript: str):
+        """
+        Stores a transcript.
+
+        Args:
+            key (str): The cache key.
+            transcript (str): The transcript.
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO transcripts (key, transcript, created, last_used) VALUES (?, ?, ?, ?)',
+                       (key, transcript, now, now))
+
+    def stats(self) -> dict:
+        """
+        Returns hit and miss statistics.
+
+        Returns:
+            dict: 'hits' and 'misses' of this object, 'hit_rate', and 'entries' and 'total_hits' of the
+                whole cache.
+        """
+        with self._connect() as db:
+            entries, total_hits = db.execute('SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM transcripts').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'total_hits': total_hits,
+        }
+
+    def evict(self, max_entries: Optional[int] = None, max_age_days: Optional[float] = None) -> int:
+        """
+        Removes transcripts not used for max_age_days, then the least recently used ones beyond
+        max_entries.
+
+        Args:
+            max_entries (int, optional): The number of transcripts to keep at most.
+            max_age_days (float, optional): Days a transcript is kept after it was last used.
+
+        Returns:
+            int: The number of transcripts removed.
+        """
+        with self._connect() as db:
+            before = db.total_changes
+            if max_age_days is not None:
+                db.execute('DELETE FROM transcripts WHERE last_used < ?', (time.time() - max_age_days * 86400,))
+            if max_entries is not None:
+                db.execute('DELETE FROM transcripts WHERE key NOT IN'
+                           ' (SELECT key FROM transcripts ORDER BY last_used DESC LIMIT ?)', (max_entries,))
+            return db.total_changes - before
@@ -0,0 +1,133 @@
+import os
+import struct
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+from src.processing.ffmpeg_source import FFMPEG_BINARY
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """
+    The format the audio of the pipeline is kept in, from the raw meeting to the uploaded segments.
+
+    The raw meeting audio is always a mono 16-bit PCM WAV file at the sample rate of the format,
+    since segments are cut from it through a memory mapping. The segments cut from it, and the
+    labeled, short and uploaded files that follow, are encoded with the codec of the format.
+
+    Attributes
+    ----------
+    name : str
+        the name the format is chosen by
+    extension : str
+        the extension of the encoded files
+    sample_rate : int
+        samples per second of all audio
+    codec : str
+        the ffmpeg encoder of the segments, None to write them as PCM WAV
+    encoding : str
+        the name of the matching Speech-to-Text RecognitionConfig.AudioEncoding
+    """
+    name: str
+    extension: str
+    sample_rate: int
+    codec: Optional[str]
+    encoding: str
+
+
+AUDIO_FORMATS = {
+    # The format of the pipeline before the option, 44.1 kHz PCM
+    'wav': AudioFormat('wav', '.wav', 44100, None, 'LINEAR16'),
+    'wav16': AudioFormat('wav16', '.wav', 16000, None, 'LINEAR16'),
+    # Lossless and at the rate Speech-to-Text works at, about a sixth of the 44.1 kHz WAV files
+    'flac': AudioFormat('flac', '.flac', 16000, 'flac', 'FLAC'),
+}
+
+
+def get_format(audio_format='wav'):
+    """
+    Returns an audio format by name.
+
+    Args:
+    audio_format (str or AudioFormat): The name of a format in AUDIO_FORMATS, or the format itself.
+
+    Returns:
+    AudioFormat: The format.
+    """
+    if isinstance(audio_format, AudioFormat):
+        return audio_format
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unknown audio format {audio_format!r}, expected one of {', '.join(AUDIO_FORMATS)}")
+    return AUDIO_FORMATS[audio_format]
+
+
+def encode_pcm(data, output_path, audio_format, sample_rate, channels=1):
+    """
+    Encodes 16-bit PCM samples to a file of the format by piping them through ffmpeg, resampled to
+    the sample rate of the format if they have another.
+
+    Args:
+    data (bytes-like): Little endian 16-bit samples, interleaved if there are several channels.
+    output_path (str): The file to write, in the container of the format whatever its extension.
+    audio_format (AudioFormat): The format, with a codec.
+    sample_rate (int): The sample rate of data.
+    channels (int): The number of channels in data.
+    """
+    command = [FFMPEG_BINARY, '-v', 'error', '-nostdin', '-y',
+               '-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+               '-ar', str(audio_format.sample_rate), '-c:a', audio_format.codec, '-f', audio_format.extension.lstrip('.'), output_path]
+    subprocess.run(command, input=data, check=True)
+
+
+def flac_info(path):
+    """
+    Reads the sample rate, channels and number of samples of a FLAC file from its STREAMINFO block.
+
+    Args:
+    path (str): The FLAC file.
+
+    Returns:
+    tuple: (sample rate, channels, number of samples)
+    """
+    with open(path, 'rb') as f:
+        if f.read(4) != b'fLaC':
+            raise ValueError(f"{path} is not a FLAC file")
+        # STREAMINFO is always the first metadata block, 34 bytes after a 4 byte block header
+        info = f.read(4 + 34)[4:]
+    if len(info) < 34:
+        raise ValueError(f"{path} has no STREAMINFO block")
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1, 36 bits total samples
+    packed = struct.unpack('>Q', info[10:18])[0]
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    return sample_rate, channels, total_samples
+
+
+@contextmanager
+def decoded_wav(path):
+    """
+    Gives a PCM WAV file with the audio of a file, for code that reads WAV files directly.
+
+    WAV files are given as they are. Other files are decoded to a temporary WAV file, removed when
+    the context exits.
+
+    Args:
+    path (str): The audio file.
+
+    Yields:
+    str: The path of the WAV file.
+    """
+    if path.endswith('.wav'):
+        yield path
+        return
+    fd, temp_path = tempfile.mkstemp(suffix='.wav')
+    os.close(fd)
+    try:
+        subprocess.run([FFMPEG_BINARY, '-v', 'error', '-nostdin', '-y', '-i', path,
+                        '-c:a', 'pcm_s16le', temp_path], check=True)
+        yield temp_path
+    finally:
+        os.remove(temp_path)
@@ -0,0 +1,281 @@
+import os
+import mmap
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from src.processing import metrics
+from src.processing.audio_format import encode_pcm, flac_info
+
+
+def read_wav_layout(path):
+    """
+    Finds the format and sample data of a WAV file without reading the samples.
+
+    Args:
+    path (str): The WAV file.
+
+    Returns:
+    tuple: (fmt chunk bytes, sample rate, block align, data offset, data size in bytes)
+    """
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+
+        fmt = None
+        file_size = os.fstat(f.fileno()).st_size
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                f.seek(chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path} has no fmt chunk before its data")
+                data_offset = f.tell()
+                # Writers that stream the file may leave the size unset
+                data_size = min(chunk_size, file_size - data_offset)
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    sample_rate, _, block_align = struct.unpack('<IIH', fmt[4:14])
+    return fmt, sample_rate, block_align, data_offset, data_size
+
+
+def default_packet_samples(sample_rate):
+    """
+    Returns the number of samples in each packet ffmpeg reads from a PCM WAV file, the largest
+    power of two below a tenth of a second.
+
+    Args:
+    sample_rate (int): The sample rate.
+
+    Returns:
+    int: The number of samples.
+    """
+    samples = 1
+    while samples * 2 <= max(sample_rate // 10, 1):
+        samples *= 2
+    return samples
+
+
+def segment_bounds(start_time, end_time, sample_rate, total_samples, packet_samples=None):
+    """
+    Computes the samples of a segment the way `ffmpeg_extract_subclip` cuts it.
+
+    ffmpeg copies whole packets, so a segment starts on the exact sample but its length is rounded
+    up to a whole number of packets, counted from the start.
+
+    Args:
+    start_time (float): Start of the segment in seconds.
+    end_time (float): End of the segment in seconds.
+    sample_rate (int): The sample rate.
+    total_samples (int): The number of samples in the file.
+    packet_samples (int, optional): The samples per packet, defaults to `default_packet_samples`.
+        ffmpeg versions before 6.1 read packets of 4096 bytes instead.
+
+    Returns:
+    tuple: (first sample, number of samples)
+    """
+    if packet_samples is None:
+        packet_samples = default_packet_samples(sample_rate)
+    # ffmpeg_extract_subclip passes both times with two decimals
+    start = round(round(start_time, 2) * sample_rate)
+    duration = round(round(end_time - start_time, 2) * sample_rate)
+    samples = -(-duration // packet_samples) * packet_samples
+    start = min(max(start, 0), total_samples)
+    return start, max(0, min(samples, total_samples - start))
+
+
+def wav_header(fmt, data_size):
+    """
+    Builds the header of a WAV file.
+
+    Args:
+    fmt (bytes): The fmt chunk, as returned by `read_wav_layout`.
+    data_size (int): The size of the sample data in bytes.
+
+    Returns:
+    bytes: The header, followed directly by the sample data.
+    """
+    fmt_chunk = struct.pack('<4sI', b'fmt ', len(fmt)) + fmt + b'\0' * (len(fmt) % 2)
+    riff_size = 4 + len(fmt_chunk) + 8 + data_size + data_size % 2
+    return struct.pack('<4sI4s', b'RIFF', riff_size, b'WAVE') + fmt_chunk + struct.pack('<4sI', b'data', data_size)
+
+
+def write_pieces(wav_path, pieces, workers=8, audio_format=None):
+    """
+    Writes sample ranges of a WAV file to their own files. The file is mapped into memory once,
+    and every piece is written straight from a slice of the mapping by a pool of threads.
+
+    Args:
+    wav_path (str): The 16-bit WAV file to cut from.
+    pieces (list): (first sample, number of samples, output path) for every piece.
+    workers (int): The number of threads writing pieces.
+    audio_format (AudioFormat, optional): The format to encode the pieces in. WAV pieces are
+        written when it is None or has no codec.
+
+    Returns:
+    int: The number of pieces written.
+    """
+    if not pieces:
+        return 0
+
+    fmt, sample_rate, block_align, data_offset, data_size = read_wav_layout(wav_path)
+    channels = struct.unpack('<H', fmt[2:4])[0]
+    encode = audio_format is not None and audio_format.codec is not None
+
+    with open(wav_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+        data = memoryview(mapping)[data_offset:data_offset + data_size // block_align * block_align]
+
+        def write_piece(piece):
+            start, samples, output_path = piece
+            size = samples * block_align
+            # Replaced rather than overwritten, the old file may be linked from the labeled store
+            temp_path = f'{output_path}.part'
+            if encode:
+                encode_pcm(data[start * block_align:start * block_align + size], temp_path, audio_format,
+                           sample_rate, channels)
+                os.replace(temp_path, output_path)
+                return
+            with open(temp_path, 'wb') as output:
+                output.write(wav_header(fmt, size))
+                output.write(data[start * block_align:start * block_align + size])
+                if size % 2:
+                    output.write(b'\0')
+            os.replace(temp_path, output_path)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for _ in pool.map(write_piece, pieces):
+                    pass
+        finally:
+            data.release()
+
+    return len(pieces)
+
+
+def cut_segments(wav_path, segments, workers=8, packet_samples=None, audio_format=None):
+    """
+    Cuts many segments out of a WAV file with `write_pieces`. The samples match those
+    `ffmpeg_extract_subclip` cuts.
+
+    Args:
+    wav_path (str): The WAV file to cut from.
+    segments (list): (start seconds, end seconds, output path) for every segment.
+    workers (int): The number of threads writing segments.
+    packet_samples (int, optional): See `segment_bounds`.
+    audio_format (AudioFormat, optional): See `write_pieces`.
+
+    Returns:
+    int: The number of segments written.
+    """
+    if not segments:
+        return 0
+
+    _, sample_rate, block_align, _, data_size = read_wav_layout(wav_path)
+    total_samples = data_size // block_align
+    pieces = [
+        segment_bounds(start_time, end_time, sample_rate, total_samples, packet_samples) + (output_path,)
+        for start_time, end_time, output_path in segments
+    ]
+    written = write_pieces(wav_path, pieces, workers, audio_format)
+    metrics.inc('segments_cut', written)
+    return written
+
+
+def wav_duration(path):
+    """
+    Returns the duration of a WAV file from its header.
+
+    Args:
+    path (str): The WAV file.
+
+    Returns:
+    float: The duration in seconds.
+    """
+    _, sample_rate, block_align, _, data_size = read_wav_layout(path)
+    return data_size // block_align / sample_rate
+
+
+def audio_duration(path):
+    """
+    Returns the duration of a WAV or FLAC file from its header.
+
+    Args:
+    path (str): The audio file.
+
+    Returns:
+    float: The duration in seconds.
+    """
+    if path.endswith('.flac'):
+        sample_rate, _, total_samples = flac_info(path)
+        return total_samples / sample_rate
+    return wav_duration(path)
+
+
+def window_energy(path, start, samples, window):
+    """
+    Returns the RMS energy of consecutive windows in a range of a 16-bit WAV file, over all channels.
+
+    Args:
+    path (str): The WAV file.
+    start (int): The first sample of the range.
+    samples (int): The number of samples in the range.
+    window (int): The number of samples in a window.
+
+    Returns:
+    numpy.ndarray: The energy of every whole window in the range.
+    """
+    fmt, _, block_align, data_offset, _ = read_wav_layout(path)
+    channels = struct.unpack('<H', fmt[2:4])[0]
+    windows = samples // window
+    with open(path, 'rb') as f:
+        f.seek(data_offset + start * block_align)
+        data = np.frombuffer(f.read(windows * window * block_align), dtype='<i2')
+    data = data[:len(data) // (window * channels) * window * channels].astype(np.float32)
+    return np.sqrt(np.mean(data.reshape(-1, window * channels) ** 2, axis=1))
+
+
+def split_points(path, max_duration=59.5, search_duration=5.0, window_duration=0.05):
+    """
+    Finds where to split a WAV file into pieces no longer than max_duration, at the quietest
+    moment before each limit so words are not cut in half.
+
+    Only the last search_duration seconds before each limit are read, so memory use does not
+    depend on the length of the file.
+
+    Args:
+    path (str): A 16-bit PCM WAV file.
+    max_duration (float): The longest a piece may be, in seconds.
+    search_duration (float): How far before the limit to look for a quiet window, in seconds.
+    window_duration (float): The length of the windows whose energy is compared, in seconds.
+
+    Returns:
+    list: (first sample, number of samples) of every piece.
+    """
+    _, sample_rate, block_align, _, data_size = read_wav_layout(path)
+    total_samples = data_size // block_align
+    max_samples = int(max_duration * sample_rate)
+    search = min(int(search_duration * sample_rate), max_samples // 2)
+    window = max(int(window_duration * sample_rate), 1)
+
+    pieces = []
+    start = 0
+    while total_samples - start > max_samples:
+        search_start = start + max_samples - search
+        energy = window_energy(path, search_start, search, window)
+        if len(energy):
+            # The last of the quietest windows, so pieces stay as long as they can
+            quietest = len(energy) - 1 - int(np.argmin(energy[::-1]))
+            end = search_start + quietest * window + window // 2
+        else:
+            end = start + max_samples
+        pieces.append((start, end - start))
+        start = end
+    pieces.append((start, total_samples - start))
+    return pieces
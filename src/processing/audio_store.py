@@ -0,0 +1,161 @@
+import os
+import re
+import shutil
+import hashlib
+
+# ioctl that makes a file share the blocks of another on copy-on-write file systems (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+class PartyMatcher:
+    """
+    A class used to find the party of a speaker segment from its file name with one compiled pattern.
+
+    The keys of the party mapping are tried in order and the first one found anywhere in the name
+    wins, like searching for each key in turn.
+
+    ...
+
+    Attributes
+    ----------
+    party_mapping : dict
+        maps the party names found in captions to the party directories
+    pattern : re.Pattern
+        matches at every position the first key, in mapping order, that starts there
+
+    Methods
+    -------
+    match(name):
+        Returns the party directory for a name, or None.
+    """
+
+    def __init__(self, party_mapping):
+        """
+        Constructs all the necessary attributes for the PartyMatcher object.
+
+        Parameters
+        ----------
+        party_mapping : dict
+            maps the party names found in captions to the party directories
+        """
+        self.party_mapping = party_mapping
+        self.keys = list(party_mapping)
+        self.priority = {key: i for i, key in enumerate(self.keys)}
+        # The lookahead finds overlapping matches, so a later key can not hide an earlier one
+        self.pattern = re.compile('(?=(' + '|'.join(re.escape(key) for key in self.keys) + '))')
+
+    def match(self, name):
+        """
+        Returns the party directory for a name.
+
+        Args:
+        name (str): The file name of a speaker segment.
+
+        Returns:
+        str: The party directory, or None if no key is found in the name.
+        """
+        found = {match.group(1) for match in self.pattern.finditer(name)}
+        if not found:
+            return None
+        return self.party_mapping[min(found, key=self.priority.__getitem__)]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file.
+
+    Args:
+    path (str): The file.
+    chunk_size (int): Bytes read at a time.
+
+    Returns:
+    str: The digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(source, target):
+    import fcntl
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(source, target):
+    """
+    Makes a file appear at a second path without copying its data, with a hardlink, or a reflink
+    where hardlinks are not possible, falling back to a symlink.
+
+    Args:
+    source (str): The existing file.
+    target (str): The new path, left alone if it already exists.
+
+    Returns:
+    str: 'exists', 'hardlink', 'reflink' or 'symlink'.
+    """
+    if os.path.lexists(target):
+        return 'exists'
+    try:
+        os.link(source, target)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        _reflink(source, target)
+        return 'reflink'
+    except (OSError, ImportError):
+        if os.path.exists(target):
+            os.remove(target)
+    os.symlink(os.path.relpath(os.path.realpath(source), os.path.dirname(os.path.abspath(target))), target)
+    return 'symlink'
+
+
+def add_to_store(path, store_dir='audio/store'):
+    """
+    Puts a file in the content addressed store, as 'store_dir/<first two hex digits>/<digest><ext>',
+    unless a file with the same content is already there.
+
+    The blob is linked to the file, not copied, where the file system allows it.
+
+    Args:
+    path (str): The file.
+    store_dir (str): The store directory.
+
+    Returns:
+    str: The path of the blob.
+    """
+    digest = file_digest(path)
+    blob_dir = os.path.join(store_dir, digest[:2])
+    blob_path = os.path.join(blob_dir, digest + os.path.splitext(path)[1])
+    if not os.path.exists(blob_path):
+        os.makedirs(blob_dir, exist_ok=True)
+        temp_path = f'{blob_path}.{os.getpid()}.tmp'
+        try:
+            os.link(path, temp_path)
+        except OSError:
+            shutil.copyfile(path, temp_path)
+        os.replace(temp_path, blob_path)
+    return blob_path
+
+
+def label_file(filepath, labeled_dir_path, matcher, store_dir='audio/store'):
+    """
+    Adds a speaker segment to the store and links it into its party directory, or 'unlabeled'.
+
+    Args:
+    filepath (str): The speaker segment.
+    labeled_dir_path (str): The labeled directory of the meeting.
+    matcher (PartyMatcher or SpeakerResolver): Finds the party of a file name.
+    store_dir (str): The store directory.
+
+    Returns:
+    str: The party directory the segment was linked into.
+    """
+    filename = os.path.basename(filepath)
+    party = matcher.match(filename) or 'unlabeled'
+    link_file(add_to_store(filepath, store_dir), os.path.join(labeled_dir_path, party, filename))
+    return party
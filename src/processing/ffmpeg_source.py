@@ -0,0 +1,163 @@
+import os
+import subprocess
+import tempfile
+import cv2
+import numpy as np
+from src.processing import metrics
+from src.processing.frame_sampler import DEFAULT_FPS
+
+# The ffmpeg executable, the Docker image installs it on the PATH
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+
+class FFmpegRoiSource:
+    """
+    A class used to sample every n-th frame of a video, cropped to a region, through an ffmpeg pipe.
+
+    OpenCV decodes and converts the full 1920x1080 frame even though only the caption area is used.
+    Here ffmpeg drops the frames that are not sampled and crops the rest with its `select` and
+    `crop` filters. Only the region is converted to BGR and sent over the pipe, where it is read
+    into a preallocated buffer.
+
+    It iterates like FrameSampler, but the frames it yields are the region only, so the
+    FrameProcessor has to be shifted to it with `FrameProcessor.shift_crop`. If ffmpeg fails, e.g. on
+    a corrupt video, iterating raises a RuntimeError with what it wrote to stderr, so a failed decode
+    is never taken for a video without captions.
+
+    ...
+
+    Attributes
+    ----------
+    video_path : str
+        path to the video file
+    region : list
+        [top, bottom, left, right] of the crop in the full frame
+    frame_skip : int
+        number of frames between two samples
+    fps : float
+        frames per second reported by the container
+    frame_count : int
+        number of frames reported by the container
+    start_frame : int
+        the first frame that is sampled
+    end_frame : int
+        frames from this one onwards are not sampled
+
+    Methods
+    -------
+    release():
+        Stops ffmpeg.
+    """
+
+    def __init__(self, video_path, region, frame_skip=500, start_frame=0, end_frame=None):
+        """
+        Constructs all the necessary attributes for the FFmpegRoiSource object.
+
+        Parameters
+        ----------
+        video_path : str
+            path to the video file
+        region : list
+            [top, bottom, left, right] of the crop in the full frame
+        frame_skip : int
+            number of frames between two samples
+        start_frame : int
+            the first frame that is sampled
+        end_frame : int, optional
+            frames from this one onwards are not sampled, defaults to the end of the video
+        """
+        self.video_path = video_path
+        self.region = region
+        self.frame_skip = frame_skip
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+
+        cap = cv2.VideoCapture(video_path)
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        top, bottom, left, right = region
+        # Filled by every read from the pipe, a yielded frame is only valid until the next one
+        self.buffer = np.empty((bottom - top, right - left, 3), dtype=np.uint8)
+        self.process = None
+        self.errors = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def command(self):
+        """
+        Builds the ffmpeg command line.
+
+        Returns:
+        list: The command line arguments.
+        """
+        top, bottom, left, right = self.region
+        command = [FFMPEG_BINARY, '-v', 'error', '-nostdin']
+        if self.start_frame > 0:
+            # Half a frame early so rounding never skips the start frame, ffmpeg seeks accurately
+            command += ['-ss', f'{(self.start_frame - 0.5) / self.fps:.6f}']
+        command += [
+            '-i', self.video_path,
+            '-an', '-sn',
+            '-vf', f"select='not(mod(n\\,{self.frame_skip}))',crop={right - left}:{bottom - top}:{left}:{top}",
+            '-vsync', '0',
+        ]
+        if self.end_frame is not None:
+            samples = -(-(self.end_frame - self.start_frame) // self.frame_skip)
+            command += ['-frames:v', str(max(0, samples))]
+        command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+        return command
+
+    def __iter__(self):
+        """
+        Yields the sampled regions.
+
+        Yields:
+        tuple: (frame number, time in seconds, region as numpy.ndarray)
+        """
+        # stderr goes to a file, a pipe nobody reads could fill up and stall ffmpeg
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(self.command(), stdout=subprocess.PIPE, stderr=self.errors)
+        view = memoryview(self.buffer).cast('B')
+        frame_number = self.start_frame
+        while True:
+            read = 0
+            while read < len(view):
+                n = self.process.stdout.readinto(view[read:])
+                if not n:
+                    break
+                read += n
+            if read < len(view):
+                break
+            # ffmpeg decodes every frame and sends only the selected ones
+            metrics.inc('frames_decoded', self.frame_skip)
+            yield frame_number, frame_number / self.fps, self.buffer
+            frame_number += self.frame_skip
+
+        # The pipe ended, so ffmpeg finished or failed on its own
+        returncode = self.process.wait()
+        self.errors.seek(0)
+        message = self.errors.read().decode('utf-8', 'replace').strip()
+        self.release()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with status {returncode} reading {self.video_path}: {message}")
+
+    def release(self):
+        """
+        Stops ffmpeg. Stopping it before the end of the pipe, e.g. when the caller has all the frames
+        it needs, is not an error.
+        """
+        if self.process is not None:
+            self.process.stdout.close()
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+        if self.errors is not None:
+            self.errors.close()
+            self.errors = None
@@ -0,0 +1,171 @@
+import cv2
+from src.processing import metrics
+
+# Used when the container does not report a frame rate
+DEFAULT_FPS = 25.0
+
+
+class FrameSampler:
+    """
+    A class used to sample every n-th frame of a video by decoding the stream forward.
+
+    Seeking with `cv2.CAP_PROP_POS_FRAMES` before every read makes the decoder jump back to the
+    nearest keyframe and decode forward again for each sample. The sampler instead seeks once to
+    the start frame and then walks the stream with `grab()`, only converting the sampled frames
+    with `retrieve()`.
+
+    ...
+
+    Attributes
+    ----------
+    video_path : str
+        path to the video file
+    frame_skip : int
+        number of frames between two samples
+    fps : float
+        frames per second reported by the container
+    frame_count : int
+        number of frames reported by the container
+    start_frame : int
+        the first frame that is sampled
+    end_frame : int
+        frames from this one onwards are not sampled
+    seek_threshold : int
+        strides above this value seek to each sample instead of decoding forward
+
+    Methods
+    -------
+    read(frame_number):
+        Reads a single frame.
+    release():
+        Releases the underlying video capture.
+    """
+
+    def __init__(self, video_path, frame_skip=500, start_time=160.0, start_frame=None, end_frame=None,
+                 seek_threshold=None):
+        """
+        Constructs all the necessary attributes for the FrameSampler object.
+
+        Parameters
+        ----------
+        video_path : str
+            path to the video file
+        frame_skip : int
+            number of frames between two samples
+        start_time : float
+            time in seconds of the first sample, used when start_frame is not given
+        start_frame : int, optional
+            the first frame that is sampled
+        end_frame : int, optional
+            frames from this one onwards are not sampled, defaults to the end of the video
+        seek_threshold : int, optional
+            if frame_skip is larger than this, seek to every sample instead of decoding forward.
+            Useful when the stride is much longer than the keyframe interval of the video.
+        """
+        self.video_path = video_path
+        self.frame_skip = frame_skip
+        self.cap = cv2.VideoCapture(video_path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if start_frame is None:
+            start_frame = int(round(start_time * self.fps))
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.seek_threshold = seek_threshold
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __iter__(self):
+        """
+        Yields the sampled frames.
+
+        Yields:
+        tuple: (frame number, presentation time in seconds, frame as numpy.ndarray)
+        """
+        if self.seek_threshold is not None and self.frame_skip > self.seek_threshold:
+            yield from self._seek_frames()
+        else:
+            yield from self._decode_frames()
+
+    def _in_range(self, frame_number):
+        return self.end_frame is None or frame_number < self.end_frame
+
+    def _pts(self, frame_number):
+        # CAP_PROP_POS_MSEC holds the timestamp of the last decoded frame
+        msec = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if msec <= 0 and frame_number > 0:
+            return frame_number / self.fps
+        return msec / 1000
+
+    def _decode_frames(self):
+        if self.start_frame > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+
+        frame_number = self.start_frame
+        next_sample = self.start_frame
+        decoded = 0
+        while self._in_range(frame_number) and self.cap.grab():
+            decoded += 1
+            if frame_number == next_sample:
+                ret, frame = self.cap.retrieve()
+                if not ret:
+                    break
+                # Counted once per sample rather than per frame to keep it cheap
+                metrics.inc('frames_decoded', decoded)
+                decoded = 0
+                yield frame_number, self._pts(frame_number), frame
+                next_sample += self.frame_skip
+            frame_number += 1
+        metrics.inc('frames_decoded', decoded)
+
+    def _seek_frames(self):
+        frame_number = self.start_frame
+        while self._in_range(frame_number):
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            metrics.inc('frames_decoded')
+            yield frame_number, self._pts(frame_number), frame
+            frame_number += self.frame_skip
+
+    def read(self, frame_number):
+        """
+        Reads a single frame, seeking to it.
+
+        Args:
+        frame_number (int): The frame to read.
+
+        Returns:
+        tuple: (presentation time in seconds, frame as numpy.ndarray), frame is None if it could not be read.
+        """
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        ret, frame = self.cap.read()
+        if not ret:
+            return frame_number / self.fps, None
+        return self._pts(frame_number), frame
+
+    def release(self):
+        """
+        Releases the underlying video capture.
+        """
+        self.cap.release()
+
+
+def seconds_to_time(total_seconds):
+    """
+    Converts a time in seconds to a time string.
+
+    Args:
+    total_seconds (float): The time in seconds.
+
+    Returns:
+    str: The time in the format 'minutes:seconds'.
+    """
+    minutes = int(total_seconds // 60)
+    seconds = int(total_seconds % 60)
+    return f"{minutes}:{seconds:02d}"
@@ -2,17 +2,37 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 
-def setup_logger(logger_name, log_dir, filename, level=logging.INFO):
+def setup_logger(logger_name, log_dir, filename, level=logging.INFO, max_bytes=10 * 1024 * 1024, backup_count=5):
+    """
+    Returns a logger that writes to a rotating file in the log directory.
+
+    Calling it again for the same logger and file returns the logger as it is, so a handler is only
+    ever added once.
+
+    Args:
+    logger_name (str): The name of the logger.
+    log_dir (str): The directory of the log file.
+    filename (str): The name of the log file.
+    level (int): The logging level.
+    max_bytes (int): The size a log file is rotated at.
+    backup_count (int): The number of rotated files kept.
+
+    Returns:
+    logging.Logger: The logger.
+    """
     # Create necessary directories if they don't exist
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    os.makedirs(log_dir, exist_ok=True)
 
     # Set up the logger
     logger = logging.getLogger(logger_name)
     logger.setLevel(level)
-    handler = RotatingFileHandler(os.path.join(log_dir, filename), maxBytes=2000, backupCount=5)
+    log_path = os.path.abspath(os.path.join(log_dir, filename))
+    if any(getattr(handler, 'baseFilename', None) == log_path for handler in logger.handlers):
+        return logger
+
+    handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count)
     formatter = logging.Formatter('%(message)s')
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-    return logger
\ No newline at end of file
+    return logger
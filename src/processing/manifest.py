@@ -0,0 +1,230 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from src.processing import metrics
+
+# Status of an artifact while its stage runs, and after it finished or failed
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def file_signature(path):
+    """
+    Returns a cheap fingerprint of a file from its metadata, to notice an input that changed
+    without reading it.
+
+    Args:
+    path (str): The file.
+
+    Returns:
+    str: '<size>-<mtime in ns>', or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+class Manifest:
+    """
+    A class used to record the state of every artifact of the pipeline in SQLite, keyed by stage and
+    artifact, e.g. ('ocr', '<video file name>') or ('transcribe', '<blob name>').
+
+    An artifact is only marked done after its stage wrote all of its output, so an interrupted stage
+    leaves it running or failed and it is picked up again on the next run. Stages ask the manifest
+    what is done or pending instead of checking the files one by one. The time and outcome of every
+    stage started here are also recorded in the metrics, when they are turned on.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        path to the SQLite database
+
+    Methods
+    -------
+    status(stage, key):
+        Returns the status and input hash of an artifact.
+    done(stage):
+        Returns the finished artifacts of a stage.
+    is_done(stage, key, input_hash=None):
+        Checks whether an artifact is finished, from the same input.
+    pending(stage, after):
+        Returns the artifacts finished in one stage and not in the next.
+    start(stage, key, input_hash=None):
+        Marks an artifact as running.
+    complete(stage, key, output=None, input_hash=None):
+        Marks an artifact as done.
+    fail(stage, key, error):
+        Marks an artifact as failed.
+    track(stage, key, output=None, input_hash=None):
+        Context manager that marks an artifact running, then done or failed.
+    """
+
+    def __init__(self, path='logs/manifest.sqlite'):
+        """
+        Constructs all the necessary attributes for the Manifest object.
+
+        Parameters
+        ----------
+        path : str
+            path to the SQLite database, created if it does not exist
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS artifacts ('
+                ' stage TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL, input_hash TEXT,'
+                ' output TEXT, error TEXT, updated_at TEXT NOT NULL,'
+                ' PRIMARY KEY (stage, key))'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS artifacts_status ON artifacts (stage, status)')
+
+    @contextmanager
+    def _connect(self):
+        # Commits on success like sqlite3's own context manager, and closes the connection too
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _set(self, stage, key, status, input_hash=None, output=None, error=None):
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._connect() as db:
+            db.execute(
+                'INSERT INTO artifacts (stage, key, status, input_hash, output, error, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (stage, key) DO UPDATE SET status = excluded.status,'
+                ' input_hash = COALESCE(excluded.input_hash, input_hash), output = COALESCE(excluded.output, output),'
+                ' error = excluded.error, updated_at = excluded.updated_at',
+                (stage, key, status, input_hash, output, error, now)
+            )
+
+    def status(self, stage, key):
+        """
+        Returns the status and input hash of an artifact.
+
+        Args:
+        stage (str): The stage.
+        key (str): The artifact.
+
+        Returns:
+        tuple: (status, input hash), or (None, None) if the artifact is not recorded.
+        """
+        with self._connect() as db:
+            row = db.execute('SELECT status, input_hash FROM artifacts WHERE stage = ? AND key = ?',
+                             (stage, key)).fetchone()
+        return row if row else (None, None)
+
+    def done(self, stage):
+        """
+        Returns the finished artifacts of a stage.
+
+        Args:
+        stage (str): The stage.
+
+        Returns:
+        dict: Maps the key of every finished artifact to its input hash.
+        """
+        with self._connect() as db:
+            return dict(db.execute('SELECT key, input_hash FROM artifacts WHERE stage = ? AND status = ?',
+                                   (stage, DONE)))
+
+    def is_done(self, stage, key, input_hash=None):
+        """
+        Checks whether an artifact is finished.
+
+        Args:
+        stage (str): The stage.
+        key (str): The artifact.
+        input_hash (str, optional): The hash of the input now. The artifact only counts as done if it
+            was made from an input with the same hash.
+
+        Returns:
+        bool: True if the artifact is done.
+        """
+        status, recorded_hash = self.status(stage, key)
+        return status == DONE and (input_hash is None or input_hash == recorded_hash)
+
+    def pending(self, stage, after):
+        """
+        Returns the artifacts finished in one stage and not yet in the next, with one indexed query.
+
+        Args:
+        stage (str): The stage to run.
+        after (str): The stage before it.
+
+        Returns:
+        dict: Maps the key of every pending artifact to the output of the stage before.
+        """
+        with self._connect() as db:
+            return dict(db.execute(
+                'SELECT previous.key, previous.output FROM artifacts AS previous'
+                ' LEFT JOIN artifacts AS next ON next.stage = ? AND next.key = previous.key AND next.status = ?'
+                ' WHERE previous.stage = ? AND previous.status = ? AND next.key IS NULL'
+                ' ORDER BY previous.key',
+                (stage, DONE, after, DONE)
+            ))
+
+    def start(self, stage, key, input_hash=None):
+        """
+        Marks an artifact as running.
+
+        Args:
+        stage (str): The stage.
+        key (str): The artifact.
+        input_hash (str, optional): The hash of the input it is made from.
+        """
+        self._set(stage, key, RUNNING, input_hash)
+        metrics.stage_started(stage, key)
+
+    def complete(self, stage, key, output=None, input_hash=None):
+        """
+        Marks an artifact as done. Call it only once all of the output is written.
+
+        Args:
+        stage (str): The stage.
+        key (str): The artifact.
+        output (str, optional): Where the output is.
+        input_hash (str, optional): The hash of the input it was made from.
+        """
+        self._set(stage, key, DONE, input_hash, output)
+        metrics.stage_finished(stage, key, DONE)
+
+    def fail(self, stage, key, error):
+        """
+        Marks an artifact as failed.
+
+        Args:
+        stage (str): The stage.
+        key (str): The artifact.
+        error (str): What went wrong.
+        """
+        self._set(stage, key, FAILED, error=error)
+        metrics.stage_finished(stage, key, FAILED, error)
+
+    @contextmanager
+    def track(self, stage, key, output=None, input_hash=None):
+        """
+        Marks an artifact as running while the block runs, then done, or failed if it raises.
+
+        Args:
+        stage (str): The stage.
+        key (str): The artifact.
+        output (str, optional): Where the output is written.
+        input_hash (str, optional): The hash of the input it is made from.
+        """
+        self.start(stage, key, input_hash)
+        try:
+            yield
+        except BaseException as e:
+            self.fail(stage, key, f'{type(e).__name__}: {e}')
+            raise
+        self.complete(stage, key, output, input_hash)
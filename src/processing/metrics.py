@@ -0,0 +1,420 @@
+import os
+import json
+import atexit
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# Set to a directory to record metrics, inherited by worker processes and Airflow tasks
+METRICS_DIR_ENV = 'ALTHINGI_METRICS_DIR'
+METRICS_FILE = 'metrics.jsonl'
+TEXTFILE = 'althingi.prom'
+PREFIX = 'althingi_'
+
+# Seconds, from a single OCR call to a whole stage of a long meeting
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class Registry:
+    """
+    A class used to hold the counters and histograms of one process until they are flushed.
+
+    Flushing appends what changed since the last flush to the metrics file as JSON lines and starts
+    over from zero, so any number of processes can share the file and the totals are the sums of
+    its lines.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        path to the JSON lines metrics file
+    counters : dict
+        maps (name, labels) to the amount counted since the last flush
+    histograms : dict
+        maps (name, labels) to [bucket counts, sum, count] since the last flush
+    started : dict
+        maps (stage, key) to the time the stage started on the artifact
+    events : list
+        structured log records since the last flush
+
+    Methods
+    -------
+    inc(name, value, labels):
+        Adds to a counter.
+    observe(name, value, labels, buckets):
+        Adds a value to a histogram.
+    event(record):
+        Queues a structured log record.
+    flush():
+        Appends the changes and log records to the metrics file.
+    """
+
+    def __init__(self, metrics_dir):
+        """
+        Constructs all the necessary attributes for the Registry object.
+
+        Parameters
+        ----------
+        metrics_dir : str
+            directory of the metrics file, created if it does not exist
+        """
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.path = os.path.join(metrics_dir, METRICS_FILE)
+        self.counters = {}
+        self.histograms = {}
+        self.started = {}
+        self.events = []
+        self.lock = threading.Lock()
+
+    def inc(self, name, value, labels):
+        """
+        Adds to a counter.
+
+        Args:
+        name (str): The counter.
+        value (float): The amount to add.
+        labels (tuple): Sorted (label, value) pairs.
+        """
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels, buckets=DEFAULT_BUCKETS):
+        """
+        Adds a value to a histogram.
+
+        Args:
+        name (str): The histogram.
+        value (float): The value.
+        labels (tuple): Sorted (label, value) pairs.
+        buckets (tuple): Upper bounds of the buckets, used when the histogram is new.
+        """
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [buckets, [0] * (len(buckets) + 1), 0.0, 0]
+            # The last count is the +Inf bucket
+            histogram[1][bisect.bisect_left(histogram[0], value)] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def event(self, record):
+        """
+        Queues a structured log record, written with the next flush.
+
+        Args:
+        record (dict): The record.
+        """
+        with self.lock:
+            self.events.append(record)
+
+    def flush(self):
+        """
+        Appends the changes since the last flush and the queued log records to the metrics file.
+        """
+        with self.lock:
+            counters, histograms, events = self.counters, self.histograms, self.events
+            self.counters, self.histograms, self.events = {}, {}, []
+        if not (counters or histograms or events):
+            return
+
+        now = datetime.now().isoformat(timespec='seconds')
+        pid = os.getpid()
+        lines = [dict(record, type='event', time=now, pid=pid) for record in events]
+        for (name, labels), value in counters.items():
+            lines.append({'type': 'counter', 'time': now, 'pid': pid, 'name': name, 'labels': dict(labels),
+                          'value': value})
+        for (name, labels), (buckets, counts, total, count) in histograms.items():
+            lines.append({'type': 'histogram', 'time': now, 'pid': pid, 'name': name, 'labels': dict(labels),
+                          'buckets': list(buckets), 'counts': counts, 'sum': total, 'count': count})
+        # One write in append mode, lines of processes writing at once do not interleave
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines))
+
+
+def _from_environment():
+    metrics_dir = os.environ.get(METRICS_DIR_ENV)
+    return Registry(metrics_dir) if metrics_dir else None
+
+
+_registry = _from_environment()
+
+
+def _reset_after_fork():
+    # A forked child would flush the parent's unflushed changes a second time
+    global _registry
+    _registry = _from_environment()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure(metrics_dir):
+    """
+    Turns recording on or off for this process and the processes it starts.
+
+    Args:
+    metrics_dir (str): The directory of the metrics file, None to turn recording off.
+    """
+    global _registry
+    flush()
+    if metrics_dir:
+        os.environ[METRICS_DIR_ENV] = metrics_dir
+    else:
+        os.environ.pop(METRICS_DIR_ENV, None)
+    _registry = _from_environment()
+
+
+def enabled():
+    """
+    Checks whether metrics are recorded.
+
+    Returns:
+    bool: True if a metrics directory is configured.
+    """
+    return _registry is not None
+
+
+def inc(name, value=1, **labels):
+    """
+    Adds to a counter. Does nothing when recording is off.
+
+    Args:
+    name (str): The counter, e.g. 'download_bytes'.
+    value (float): The amount to add.
+    **labels: Label values of the counter.
+    """
+    if _registry is None:
+        return
+    _registry.inc(name, value, tuple(sorted(labels.items())))
+
+
+def observe(name, value, **labels):
+    """
+    Adds a value to a histogram with the default buckets. Does nothing when recording is off.
+
+    Args:
+    name (str): The histogram, e.g. 'ocr_seconds'.
+    value (float): The value.
+    **labels: Label values of the histogram.
+    """
+    if _registry is None:
+        return
+    _registry.observe(name, value, tuple(sorted(labels.items())))
+
+
+class Timer:
+    """
+    A context manager that adds the seconds its block takes to a histogram.
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+        the histogram
+    labels : dict
+        label values of the histogram
+    """
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        """
+        Constructs all the necessary attributes for the Timer object.
+
+        Parameters
+        ----------
+        name : str
+            the histogram
+        labels : dict
+            label values of the histogram
+        """
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+_NO_TIMER = nullcontext()
+
+
+def timer(name, **labels):
+    """
+    Times a block into a histogram, e.g. `with metrics.timer('ocr_seconds', backend='tesserocr'):`.
+
+    Args:
+    name (str): The histogram.
+    **labels: Label values of the histogram.
+
+    Returns:
+    Timer: The context manager, one that does nothing when recording is off.
+    """
+    if _registry is None:
+        return _NO_TIMER
+    return Timer(name, labels)
+
+
+def stage_started(stage, key):
+    """
+    Notes that a stage started on an artifact, e.g. the OCR of a meeting video.
+
+    Args:
+    stage (str): The stage.
+    key (str): The artifact, usually the meeting video name.
+    """
+    if _registry is None:
+        return
+    _registry.started[(stage, key)] = time.perf_counter()
+
+
+def stage_finished(stage, key, status, error=None):
+    """
+    Records the time and outcome of a stage on an artifact and writes a log record of it, then
+    flushes. Artifacts done without being started here, e.g. outputs of earlier runs, are not
+    recorded.
+
+    Args:
+    stage (str): The stage.
+    key (str): The artifact.
+    status (str): 'done' or 'failed'.
+    error (str, optional): What went wrong.
+    """
+    if _registry is None:
+        return
+    start = _registry.started.pop((stage, key), None)
+    if start is None and error is None:
+        return
+    seconds = None if start is None else time.perf_counter() - start
+    if seconds is not None:
+        observe('stage_seconds', seconds, stage=stage)
+    inc('stage_runs', stage=stage, status=status)
+    record = {'stage': stage, 'key': key, 'status': status, 'seconds': seconds}
+    if error:
+        # The last line of a traceback is the exception
+        record['error'] = error.strip().splitlines()[-1]
+    _registry.event(record)
+    flush()
+
+
+@contextmanager
+def stage(stage, key):
+    """
+    Records a stage on an artifact while the block runs, as done, or failed if it raises.
+
+    Args:
+    stage (str): The stage.
+    key (str): The artifact.
+    """
+    stage_started(stage, key)
+    try:
+        yield
+    except BaseException as e:
+        stage_finished(stage, key, 'failed', f'{type(e).__name__}: {e}')
+        raise
+    stage_finished(stage, key, 'done')
+
+
+def flush():
+    """
+    Appends the metrics recorded since the last flush to the metrics file.
+    """
+    if _registry is not None:
+        _registry.flush()
+
+
+atexit.register(flush)
+
+
+def read_metrics(path):
+    """
+    Adds up the lines of a metrics file.
+
+    Args:
+    path (str): The JSON lines metrics file.
+
+    Returns:
+    tuple: (counters, histograms, events). Counters map (name, labels) to totals, histograms map
+        (name, labels) to dicts of buckets, counts, sum and count, events are the log records.
+    """
+    counters, histograms, events = {}, {}, []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = json.loads(line)
+            if line['type'] == 'event':
+                events.append(line)
+                continue
+            key = (line['name'], tuple(sorted(line['labels'].items())))
+            if line['type'] == 'counter':
+                counters[key] = counters.get(key, 0) + line['value']
+            elif key not in histograms or histograms[key]['buckets'] != line['buckets']:
+                histograms[key] = {name: line[name] for name in ('buckets', 'counts', 'sum', 'count')}
+            else:
+                histogram = histograms[key]
+                histogram['counts'] = [a + b for a, b in zip(histogram['counts'], line['counts'])]
+                histogram['sum'] += line['sum']
+                histogram['count'] += line['count']
+    return counters, histograms, events
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def write_textfile(metrics_dir=None, textfile_path=None):
+    """
+    Writes the totals of the metrics file in the Prometheus text format, for the textfile collector
+    of the node exporter.
+
+    Args:
+    metrics_dir (str, optional): The directory of the metrics file, defaults to the configured one.
+    textfile_path (str, optional): The file to write, defaults to althingi.prom in the metrics
+        directory. It is replaced in one step, so the collector never reads half of it.
+
+    Returns:
+    str: The path of the file written, or None if there are no metrics.
+    """
+    metrics_dir = metrics_dir or os.environ.get(METRICS_DIR_ENV)
+    path = os.path.join(metrics_dir, METRICS_FILE) if metrics_dir else None
+    if path is None or not os.path.isfile(path):
+        return None
+    flush()
+    counters, histograms, _ = read_metrics(path)
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {PREFIX}{name}_total counter')
+        for (series, labels), value in sorted(counters.items()):
+            if series == name:
+                lines.append(f'{PREFIX}{name}_total{_labels(labels)} {value:g}')
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f'# TYPE {PREFIX}{name} histogram')
+        for (series, labels), histogram in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(histogram['buckets']) + ['+Inf'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{PREFIX}{name}_sum{_labels(labels)} {histogram["sum"]:g}')
+            lines.append(f'{PREFIX}{name}_count{_labels(labels)} {histogram["count"]}')
+
+    textfile_path = textfile_path or os.path.join(metrics_dir, TEXTFILE)
+    temp_path = f'{textfile_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, textfile_path)
+    return textfile_path
@@ -0,0 +1,286 @@
+import os
+import shlex
+from bisect import bisect_right
+import numpy as np
+import pytesseract
+from src.processing import metrics
+
+# Engines are expensive to start, so each process keeps one per backend and config
+_engines = {}
+
+
+def parse_config(custom_config):
+    """
+    Splits a Tesseract command line config into its options.
+
+    Args:
+    custom_config (str): The config, e.g. '--oem 3 --psm 6 -l isl'.
+
+    Returns:
+    tuple: (lang, oem, psm, variables), where variables maps '-c name=value' settings.
+    """
+    lang, oem, psm, variables = 'eng', 3, 3, {}
+    args = shlex.split(custom_config)
+    for i, arg in enumerate(args[:-1]):
+        value = args[i + 1]
+        if arg == '-l':
+            lang = value
+        elif arg == '--oem':
+            oem = int(value)
+        elif arg == '--psm':
+            psm = int(value)
+        elif arg == '-c':
+            name, _, variable = value.partition('=')
+            variables[name] = variable
+    return lang, oem, psm, variables
+
+
+class PytesseractEngine:
+    """
+    OCR through pytesseract, which starts a `tesseract` process for every image.
+
+    ...
+
+    Attributes
+    ----------
+    custom_config : str
+        the custom configuration for Tesseract OCR
+    calls : int
+        the number of images read so far
+
+    Methods
+    -------
+    image_to_string(image):
+        Returns the text found in an image.
+    image_to_words(image):
+        Returns the text found in an image and its words with their vertical position.
+    """
+
+    name = 'pytesseract'
+
+    def __init__(self, custom_config):
+        self.custom_config = custom_config
+        self.calls = 0
+
+    def image_to_string(self, image):
+        """
+        Returns the text found in an image.
+
+        Args:
+        image (numpy.ndarray): A grayscale or BGR image.
+
+        Returns:
+        str: The text found.
+        """
+        self.calls += 1
+        with metrics.timer('ocr_seconds', backend=self.name):
+            return pytesseract.image_to_string(image, config=self.custom_config)
+
+    def image_to_words(self, image):
+        """
+        Returns the text found in an image and its words with their vertical position, from one
+        Tesseract run writing both the text and the TSV output.
+
+        Args:
+        image (numpy.ndarray): A grayscale or BGR image.
+
+        Returns:
+        tuple: (text, words). The text is what `image_to_string` returns, words are (top, bottom,
+            text) for every word, in the order they appear in the text.
+        """
+        self.calls += 1
+        with metrics.timer('ocr_seconds', backend=self.name):
+            text, tsv = pytesseract.run_and_get_multiple_output(image, extensions=['txt', 'tsv'],
+                                                                config=self.custom_config)
+        words = []
+        for row in tsv.splitlines()[1:]:
+            # level, page, block, paragraph, line, word, left, top, width, height, confidence, text
+            fields = row.split('\t')
+            if len(fields) == 12 and fields[0] == '5' and fields[11].strip():
+                top = int(fields[7])
+                words.append((top, top + int(fields[9]), fields[11]))
+        return text, words
+
+
+class TesserocrEngine:
+    """
+    OCR through tesserocr, which keeps one Tesseract instance loaded in the process and reads numpy
+    buffers directly, so the traineddata is only loaded once.
+
+    ...
+
+    Attributes
+    ----------
+    custom_config : str
+        the custom configuration for Tesseract OCR
+    api : tesserocr.PyTessBaseAPI
+        the loaded Tesseract instance
+    calls : int
+        the number of images read so far
+
+    Methods
+    -------
+    image_to_string(image):
+        Returns the text found in an image.
+    image_to_words(image):
+        Returns the text found in an image and its words with their vertical position.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, custom_config):
+        import tesserocr
+
+        self.custom_config = custom_config
+        self.calls = 0
+        lang, oem, psm, variables = parse_config(custom_config)
+        kwargs = {}
+        if os.environ.get('TESSDATA_PREFIX'):
+            kwargs['path'] = os.environ['TESSDATA_PREFIX']
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, oem=tesserocr.OEM(oem), psm=tesserocr.PSM(psm), **kwargs)
+        for name, value in variables.items():
+            self.api.SetVariable(name, value)
+
+    def image_to_string(self, image):
+        """
+        Returns the text found in an image.
+
+        Args:
+        image (numpy.ndarray): A grayscale or BGR image.
+
+        Returns:
+        str: The text found, formatted like the output of pytesseract.
+        """
+        self._set_image(image)
+        with metrics.timer('ocr_seconds', backend=self.name):
+            text = self.api.GetUTF8Text()
+        # The command line ends every page with a form feed
+        return text + '\f'
+
+    def image_to_words(self, image):
+        """
+        Returns the text found in an image and its words with their vertical position, from one
+        recognition.
+
+        Args:
+        image (numpy.ndarray): A grayscale or BGR image.
+
+        Returns:
+        tuple: (text, words). The text is what `image_to_string` returns, words are (top, bottom,
+            text) for every word, in the order they appear in the text.
+        """
+        from tesserocr import RIL, iterate_level
+
+        self._set_image(image)
+        with metrics.timer('ocr_seconds', backend=self.name):
+            self.api.Recognize()
+            text = self.api.GetUTF8Text() + '\f'
+        iterator = self.api.GetIterator()
+        if iterator is None:
+            return text, []
+
+        words = []
+        for word in iterate_level(iterator, RIL.WORD):
+            word_text = word.GetUTF8Text(RIL.WORD) or ''
+            box = word.BoundingBox(RIL.WORD)
+            if word_text.strip() and box:
+                words.append((box[1], box[3], word_text))
+        return text, words
+
+    def _set_image(self, image):
+        self.calls += 1
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        if channels == 3:
+            # Tesseract expects RGB
+            image = image[:, :, ::-1]
+        self.api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        # The tesseract command line assumes 70 dpi for images without a resolution
+        self.api.SetSourceResolution(70)
+
+    def close(self):
+        """
+        Frees the Tesseract instance.
+        """
+        self.api.End()
+
+
+BACKENDS = {
+    PytesseractEngine.name: PytesseractEngine,
+    TesserocrEngine.name: TesserocrEngine,
+}
+
+
+def get_engine(custom_config, backend='auto'):
+    """
+    Returns the OCR engine of this process for a backend and config, starting it on first use.
+
+    Args:
+    custom_config (str): The custom configuration for Tesseract OCR.
+    backend (str): 'tesserocr', 'pytesseract' or 'auto', which uses tesserocr when it is
+        installed and falls back to pytesseract.
+
+    Returns:
+    PytesseractEngine or TesserocrEngine: The engine.
+    """
+    if backend == 'auto':
+        try:
+            import tesserocr  # noqa: F401
+            backend = TesserocrEngine.name
+        except ImportError:
+            backend = PytesseractEngine.name
+
+    key = (backend, custom_config)
+    if key not in _engines:
+        _engines[key] = BACKENDS[backend](custom_config)
+    return _engines[key]
+
+
+def batch_image_to_string(engine, images, gap=40):
+    """
+    Runs OCR on many images in a single call by stacking them vertically.
+
+    Every call to Tesseract pays for page layout analysis, which dominates for small caption images.
+    The images are stacked with black bands between them and read together. The text of each image
+    is the slice of the stacked text from its first word to its last, as Tesseract wrote it, so blank
+    lines and spacing inside it are kept, followed by the ending Tesseract gave the whole text. That
+    makes it the text `image_to_string` returns for the image alone, as long as Tesseract lays it out
+    the same way in the stack.
+
+    Args:
+    engine (PytesseractEngine or TesserocrEngine): The engine to use.
+    images (list): Grayscale images as numpy.ndarray, with text on a black background.
+    gap (int): Height of the band between two images.
+
+    Returns:
+    list: The text found in each image, formatted like the output of `image_to_string`.
+    """
+    if not images:
+        return []
+
+    width = max(image.shape[1] for image in images)
+    height = sum(image.shape[0] for image in images) + gap * (len(images) - 1)
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    tops = []
+    top = 0
+    for image in images:
+        canvas[top:top + image.shape[0], :image.shape[1]] = image
+        tops.append(top)
+        top += image.shape[0] + gap
+
+    text, words = engine.image_to_words(canvas)
+
+    # Where in the text each image's words start and end, the words are in the order of the text
+    spans = [None] * len(images)
+    position = 0
+    for word_top, word_bottom, word in words:
+        start = text.find(word, position)
+        if start < 0:
+            continue
+        position = start + len(word)
+        i = max(0, bisect_right(tops, (word_top + word_bottom) / 2) - 1)
+        spans[i] = (spans[i][0] if spans[i] else start, position)
+
+    # After the last word comes the ending of a whole text, e.g. '\n\f'
+    ending = text[position:] if any(spans) else '\f'
+    return [text[span[0]:span[1]] + ending if span else '\f' for span in spans]
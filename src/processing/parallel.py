@@ -0,0 +1,85 @@
+import os
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.processing import metrics
+
+
+def threads_per_worker(workers):
+    """
+    Splits the available CPUs evenly between the workers of a pool.
+
+    Args:
+    workers (int): The number of worker processes.
+
+    Returns:
+    int: The number of threads each worker may use, at least 1.
+    """
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def init_worker(threads=1):
+    """
+    Limits the threads Tesseract and OpenCV start inside a worker process so a pool of workers
+    does not oversubscribe the CPUs.
+
+    Args:
+    threads (int): The number of threads the worker may use.
+    """
+    # Tesseract reads this when it is started, pytesseract subprocesses inherit it
+    os.environ['OMP_THREAD_LIMIT'] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+
+
+def _call(func, args):
+    # Exceptions are formatted inside the worker, some of them (e.g. pytesseract's) cannot be
+    # pickled back to the parent and would break the whole pool
+    try:
+        return True, func(*args)
+    except Exception:
+        return False, traceback.format_exc()
+    finally:
+        # Workers are stopped without running exit handlers
+        metrics.flush()
+
+
+def run_in_pool(func, tasks, workers, threads=None):
+    """
+    Runs `func(*args)` for every task in a process pool and collects results and errors per task.
+
+    A task that raises does not stop the others, its traceback is stored in the errors instead.
+
+    Args:
+    func (callable): A module level function to run in the workers.
+    tasks (dict): Maps a task key to the tuple of arguments for `func`.
+    workers (int): The number of worker processes.
+    threads (int, optional): Threads per worker, defaults to an even split of the CPUs.
+
+    Returns:
+    tuple: (results, errors), two dicts keyed by task key.
+    """
+    if threads is None:
+        threads = threads_per_worker(workers)
+
+    results = {}
+    errors = {}
+    # spawn rather than fork, OpenCV's thread pools do not survive a fork
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker, initargs=(threads,)) as executor:
+        futures = {executor.submit(_call, func, args): key for key, args in tasks.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                ok, result = future.result()
+            except Exception:
+                # The worker process itself died
+                ok, result = False, traceback.format_exc()
+            if ok:
+                results[key] = result
+            else:
+                errors[key] = result
+                print(f"Task {key} failed:\n{result}")
+
+    return results, errors
@@ -1,15 +1,23 @@
 import os
 import re
-import shutil
 import json
 from typing import Optional
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
-from pydub import AudioSegment
+from src.processing import metrics
+from src.processing.audio_format import decoded_wav, get_format
+from src.processing.audio_slicer import audio_duration, cut_segments, split_points, write_pieces
+from src.processing.audio_store import label_file, link_file
+from src.processing.manifest import DONE, Manifest, file_signature
+from src.processing.speaker_resolver import SpeakerResolver
+from src.processing.timeline import load_timeline, load_timelines, speech_segments
 
 
 def process_map_audio_files(raw_dir: Optional[str] = 'audio/raw',
                         processed_dir: Optional[str] = 'audio/processed',
-                        labeled_dir: Optional[str] = 'audio/labeled') -> None:
+                        labeled_dir: Optional[str] = 'audio/labeled',
+                        topic_dir: Optional[str] = 'logs/topic',
+                        workers: Optional[int] = 8,
+                        store_dir: Optional[str] = 'audio/store',
+                        audio_format: Optional[str] = 'wav') -> None:
     """
     Processes raw audio files using a specified mapping and logs for further usage.
 
@@ -17,11 +25,17 @@ def process_map_audio_files(raw_dir: Optional[str] = 'audio/raw',
         raw_dir (str, optional): Directory where raw audio files are located.
         processed_dir (str, optional): Directory to store processed audio files.
         labeled_dir (str, optional): Directory to store labeled audio files.
+        topic_dir (str, optional): Directory of the meeting timelines.
+        workers (int, optional): Number of threads writing the segments of a meeting.
+        store_dir (str, optional): Directory of the content addressed store the labeled files link to.
+        audio_format (str, optional): The audio format of the pipeline, see `AUDIO_FORMATS`.
 
     Returns:
         None
     """
 
+    audio_format = get_format(audio_format)
+
     # Create directory for processed audios if it does not exist
     os.makedirs(processed_dir, exist_ok=True)
 
@@ -29,71 +43,27 @@ def process_map_audio_files(raw_dir: Optional[str] = 'audio/raw',
     party_mapping_file = 'src/data/party_mapping.json'
     with open(party_mapping_file, 'r') as f:
         party_mapping = json.load(f)
+    matcher = SpeakerResolver(party_mapping)
 
-    # Get the list of log directories in the topic logs directory
-    log_dirs = os.listdir('logs/topic')
-
-    for log_dir in log_dirs:
-        log_dir_path = os.path.join('logs/topic', log_dir)
-
-        # Ignore files, only process directories
-        if not os.path.isdir(log_dir_path):
-            continue
-
-        video_file_name = log_dir
-
-        # Path to the text file within the directory
-        topic_file_path = os.path.join(log_dir_path, f'{video_file_name}.txt')
-
-        with open(topic_file_path, 'r') as topic_file:
-            lines = topic_file.readlines()
-            topics = []
-            start_times = []
-            end_times = []
-            for line in lines:
-                line = line.strip()
-                if line.startswith("Topic:"):
-                    topic_name = line.split(":", 1)[1].strip()
-                    if len(topic_name) > 7:  # Filter out topics with less than 7 characters
-                        topics.append(topic_name)
-                elif line.startswith("Start:"):
-                    start_time = line.split(":", 1)[1].strip()
-                    start_times.append(int(start_time.split(':')[0]) * 60 + int(start_time.split(':')[1]))  # Convert time to seconds
-                elif line.startswith("End:"):
-                    end_time = line.split(":", 1)[1].strip()
-                    end_times.append(int(end_time.split(':')[0]) * 60 + int(end_time.split(':')[1]))  # Convert time to seconds
-
+    for video_file_name, timeline in load_timelines(topic_dir).items():
         # Create a directory under processed for the current audio file
         processed_file_dir = os.path.join(processed_dir, video_file_name)
         os.makedirs(processed_file_dir, exist_ok=True)
 
-        # Iterate over each identified topic
-        for i in range(len(topics)):
-            topic = topics[i]
-
-            start_time = start_times[i]
-            if i + 1 < len(end_times):
-                end_time = end_times[i + 1] - 1
-            else:
-                end_time = None
-
-            # Cut the segment from the original audio
-            original_audio_path = os.path.join(raw_dir, f'{video_file_name}.wav')  # Replace with your original audio path
-
-            if end_time is not None:
-                duration = end_time - start_time
-            else:
-                end_time = start_time + 10  # Set a default duration of 10 seconds if no end frame is specified
-                duration = None
-
+        # Cut a segment from the original audio for each identified topic
+        original_audio_path = os.path.join(raw_dir, f'{video_file_name}.wav')
+        segments = []
+        for topic, start_time, end_time in speech_segments(timeline, field='topic'):
             # Replace unwanted characters with hyphen
             sanitized_topic = re.sub(' ', '-', topic)
             sanitized_topic = re.sub('[^0-9a-zA-Z -]+', '', sanitized_topic)
 
-            output_filename = f"{sanitized_topic}-{round((start_time / 60), 1)}-{round((end_time / 60), 1)}.wav"
+            output_filename = f"{sanitized_topic}-{round((start_time / 60), 1)}-{round((end_time / 60), 1)}{audio_format.extension}"
             output_filepath = os.path.join(processed_file_dir, output_filename)
 
-            ffmpeg_extract_subclip(original_audio_path, start_time, end_time, targetname=output_filepath)
+            segments.append((start_time, end_time, output_filepath))
+
+        cut_segments(original_audio_path, segments, workers, audio_format=audio_format)
 
         # Create a corresponding directory in labeled audios
         labeled_file_dir = os.path.join(labeled_dir, video_file_name)
@@ -108,176 +78,202 @@ def process_map_audio_files(raw_dir: Optional[str] = 'audio/raw',
         unlabeled_dir = os.path.join(labeled_file_dir, 'unlabeled')
         os.makedirs(unlabeled_dir, exist_ok=True)
 
-        # Copy files to their respective subdirectories based on pattern match
+        # Link files into their respective subdirectories based on pattern match, 'unlabeled' if none
         for filename in os.listdir(processed_file_dir):
             filepath = os.path.join(processed_file_dir, filename)
             if os.path.isfile(filepath):
-                labeled = False
-                for party_names, subdirectory in party_mapping.items():
-                    if re.search(re.escape(party_names), filename):
-                        target_dir = os.path.join(labeled_file_dir, subdirectory)
-                        shutil.copy(filepath, os.path.join(target_dir, filename))
-                        labeled = True
-                        break
-
-                # If no match found in party names, copy to 'unlabeled'
-                if not labeled:
-                    shutil.copy(filepath, os.path.join(unlabeled_dir, filename))
+                label_file(filepath, labeled_file_dir, matcher, store_dir)
 
 
 if __name__ == "__main__":
     process_map_audio_files()
 
 
-def process_raw_audio(raw_dir='audio/raw', processed_dir='audio/processed'):
+def process_raw_audio(raw_dir='audio/raw', processed_dir='audio/processed', topic_dir='logs/topic', workers=8,
+                      audio_format='wav', manifest_path='logs/manifest.sqlite'):
     """
-    Processes raw audio files by cutting them into segments based on start and end times specified in the text files
+    Processes raw audio files by cutting them into segments based on the speaker timelines
     found in the 'logs/topic' directory. The processed audio segments are then saved to the 'processed_dir' directory.
+    Meetings the manifest has as cut are skipped without loading their timelines.
 
     Args:
         raw_dir (str): The directory where raw audio files are located. Default is 'audio/raw'.
         processed_dir (str): The directory where processed audio files will be saved. Default is 'audio/processed'.
+        topic_dir (str): The directory of the meeting timelines. Default is 'logs/topic'.
+        workers (int): The number of threads writing the segments of a meeting. Default is 8.
+        audio_format (str): The audio format of the pipeline, see `AUDIO_FORMATS`. The segments are encoded
+            in it from the raw WAV files. Default is 'wav'.
+        manifest_path (str): The pipeline manifest. Default is 'logs/manifest.sqlite'.
     """
-    # Create directory for processed audios if it does not exist
-    os.makedirs(processed_dir, exist_ok=True)
-
-    # Get the list of log directories in the topic logs directory
-    log_dirs = os.listdir('logs/topic')
+    done = Manifest(manifest_path).done('cut')
+    for video_file_name in sorted(os.listdir(topic_dir)):
+        if video_file_name not in done and os.path.isdir(os.path.join(topic_dir, video_file_name)):
+            process_meeting_audio(video_file_name, None, raw_dir, processed_dir, workers, audio_format, topic_dir,
+                                  manifest_path)
 
-    for log_dir in log_dirs:
-        log_dir_path = os.path.join('logs/topic', log_dir)
-
-        # Ignore files, only process directories
-        if not os.path.isdir(log_dir_path):
-            continue
-
-        video_file_name = log_dir
-
-        # Path to the text file within the directory
-        topic_file_path = os.path.join(log_dir_path, f'{video_file_name}.txt')
-
-        with open(topic_file_path, 'r') as topic_file:
-            lines = topic_file.readlines()
-            topics = []
-            start_times = []
-            end_times = []
-            for line in lines:
-                line = line.strip()
-                if line.startswith("Speaker:"): # Topic changed to -> Speaker
-                    topic_name = line.split(":", 1)[1].strip()
-                    if len(topic_name) > 7:  # Filter out topics with less than 7 characters
-                        topics.append(topic_name)
-                elif line.startswith("Start:"):
-                    start_time = line.split(":", 1)[1].strip()
-                    start_times.append(int(start_time.split(':')[0]) * 60 + int(start_time.split(':')[1]))  # Convert time to seconds
-                elif line.startswith("End:"):
-                    end_time = line.split(":", 1)[1].strip()
-                    end_times.append(int(end_time.split(':')[0]) * 60 + int(end_time.split(':')[1]))  # Convert time to seconds
-
-        # Create a directory under processed for the current audio file
-        processed_file_dir = os.path.join(processed_dir, video_file_name)
-        os.makedirs(processed_file_dir, exist_ok=True)
-
-        # Iterate over each identified topic
-        for i in range(len(topics)):
-            topic = topics[i]
-            start_time = start_times[i]
-            if i + 1 < len(end_times):
-                end_time = end_times[i + 1] - 1
-            else:
-                end_time = None
-
-            # Cut the segment from the original audio
-            original_audio_path = os.path.join(raw_dir, f'{video_file_name}.wav')  # Replace with your original audio path
-
-            if end_time is not None:
-                duration = end_time - start_time
-            else:
-                end_time = start_time + 10  # Set a default duration of 10 seconds if no end frame is specified
-                duration = None
-                
-            # Sanitize the name    
-            sanitized_topic = re.sub(' ', '-', topic)
-            sanitized_topic = re.sub('[^0-9a-zA-Z-ÁáÉéÍíÓóÚúÝýÐðÞþÆæÖö]+', '', sanitized_topic)
 
+def process_meeting_audio(video_file_name, timeline=None, raw_dir='audio/raw', processed_dir='audio/processed',
+                          workers=8, audio_format='wav', topic_dir='logs/topic', manifest_path='logs/manifest.sqlite'):
+    """
+    Cuts the raw audio of one meeting into a segment per speaker, skipping segments that already exist.
+    Nothing is cut while the OCR of the meeting is unfinished, or once the manifest has the meeting as cut.
 
-            output_filename = f"{sanitized_topic}-{round((start_time / 60), 1)}-{round((end_time / 60), 1)}.wav"
-            output_filepath = os.path.join(processed_file_dir, output_filename)
+    Args:
+        video_file_name (str): Name of the meeting's video file, without extension.
+        timeline (list, optional): The meeting's timeline records. Loaded from 'topic_dir' if None.
+        raw_dir (str): The directory where raw audio files are located. Default is 'audio/raw'.
+        processed_dir (str): The directory where processed audio files will be saved. Default is 'audio/processed'.
+        workers (int): The number of threads writing the segments. Default is 8.
+        audio_format (str): The audio format of the pipeline, see `AUDIO_FORMATS`. Default is 'wav'.
+        topic_dir (str): The directory of the meeting timelines. Default is 'logs/topic'.
+        manifest_path (str): The pipeline manifest. Default is 'logs/manifest.sqlite'.
 
-            # Skip if the file has already been processed
-            if not os.path.exists(output_filepath):
-                ffmpeg_extract_subclip(original_audio_path, start_time, end_time, targetname=output_filepath)
+    Returns:
+        int: The number of segments written.
+    """
+    audio_format = get_format(audio_format)
+    manifest = Manifest(manifest_path)
+    ocr_status, _ = manifest.status('ocr', video_file_name)
+    if ocr_status not in (None, DONE):
+        print(f"OCR of {video_file_name} is not finished, not cutting its audio.")
+        return 0
+    if manifest.is_done('cut', video_file_name):
+        return 0
+    if timeline is None:
+        timeline = load_timeline(topic_dir, video_file_name)
+
+    # Create a directory under processed for the current audio file
+    processed_file_dir = os.path.join(processed_dir, video_file_name)
+    os.makedirs(processed_file_dir, exist_ok=True)
+
+    # Cut a segment from the original audio for each identified speaker
+    original_audio_path = os.path.join(raw_dir, f'{video_file_name}.wav')
+    segments = []
+    for topic, start_time, end_time in speech_segments(timeline, field='speaker'):
+        # Sanitize the name
+        sanitized_topic = re.sub(' ', '-', topic)
+        sanitized_topic = re.sub('[^0-9a-zA-Z-ÁáÉéÍíÓóÚúÝýÐðÞþÆæÖö]+', '', sanitized_topic)
+
+        output_filename = f"{sanitized_topic}-{round((start_time / 60), 1)}-{round((end_time / 60), 1)}{audio_format.extension}"
+        output_filepath = os.path.join(processed_file_dir, output_filename)
+
+        # Skip if the file has already been processed
+        if not os.path.exists(output_filepath):
+            segments.append((start_time, end_time, output_filepath))
+
+    with manifest.track('cut', video_file_name, processed_file_dir, file_signature(original_audio_path)):
+        return cut_segments(original_audio_path, segments, workers, audio_format=audio_format)
 
 import os
-import shutil
 
-def label_processed_audio(party_mapping='src/data/party_mapping.json', processed_dir='audio/processed', labeled_dir='audio/labeled'):
+def label_processed_audio(party_mapping='src/data/party_mapping.json', processed_dir='audio/processed', labeled_dir='audio/labeled',
+                          store_dir='audio/store', manifest_path='logs/manifest.sqlite'):
     """
     Takes processed audio files and maps them to the 'labeled_dir' directory based on the party mapping file.
+    Parties are found with a SpeakerResolver, so OCR misreadings of a party that are not in the mapping are labeled too.
+    Each file is stored once in the content addressed 'store_dir' and linked into its party directory.
 
     Args:
         processed_dir (str): The directory where processed audio files are located. Default is 'audio/processed'.
         labeled_dir (str): The directory where labeled audio files will be saved. Default is 'audio/labeled'.
+        store_dir (str): The directory of the content addressed store. Default is 'audio/store'.
+        manifest_path (str): The pipeline manifest. Default is 'logs/manifest.sqlite'.
     """
     # Load party mapping from JSON file
     party_mapping_file = party_mapping
     with open(party_mapping_file, 'r') as f:
         party_mapping = json.load(f)
+    matcher = SpeakerResolver(party_mapping)
 
     # Get the list of processed directories in the processed directory
     processed_dirs = os.listdir(processed_dir)
+    done = Manifest(manifest_path).done('label')
 
     for dir_name in processed_dirs:
-        processed_dir_path = os.path.join(processed_dir, dir_name)
-
         # Ignore files, only process directories
-        if not os.path.isdir(processed_dir_path):
-            continue
+        if dir_name not in done and os.path.isdir(os.path.join(processed_dir, dir_name)):
+            label_meeting_audio(dir_name, matcher, processed_dir, labeled_dir, store_dir, manifest_path)
 
-        # Check if the directory already exists in labeled_dir
-        labeled_dir_path = os.path.join(labeled_dir, dir_name)
-        if os.path.exists(labeled_dir_path):
-            continue
 
-        # Create a corresponding directory in labeled audios
-        os.makedirs(labeled_dir_path, exist_ok=True)
+def label_meeting_audio(video_file_name, matcher, processed_dir='audio/processed', labeled_dir='audio/labeled',
+                        store_dir='audio/store', manifest_path='logs/manifest.sqlite'):
+    """
+    Links the processed audio files of one meeting into party directories under 'labeled_dir',
+    once its audio is cut and unless the manifest has it as labeled.
 
-        # Create subdirectories for each party under the labeled file directory
-        for party_name in set(party_mapping.values()):
-            party_dir = os.path.join(labeled_dir_path, party_name)
-            os.makedirs(party_dir, exist_ok=True)
+    Args:
+        video_file_name (str): Name of the meeting's video file, without extension.
+        matcher (SpeakerResolver or str): The party resolver, or the path of the party mapping file to build one from.
+        processed_dir (str): The directory where processed audio files are located. Default is 'audio/processed'.
+        labeled_dir (str): The directory where labeled audio files will be saved. Default is 'audio/labeled'.
+        store_dir (str): The directory of the content addressed store. Default is 'audio/store'.
+        manifest_path (str): The pipeline manifest. Default is 'logs/manifest.sqlite'.
 
-        # Add 'unlabeled' subdirectory as well
-        unlabeled_dir = os.path.join(labeled_dir_path, 'unlabeled')
-        os.makedirs(unlabeled_dir, exist_ok=True)
+    Returns:
+        bool: True if the meeting was labeled, False if it already was or is not cut yet.
+    """
+    if isinstance(matcher, str):
+        with open(matcher, 'r') as f:
+            matcher = SpeakerResolver(json.load(f))
+    processed_dir_path = os.path.join(processed_dir, video_file_name)
+    labeled_dir_path = os.path.join(labeled_dir, video_file_name)
+
+    manifest = Manifest(manifest_path)
+    status, _ = manifest.status('label', video_file_name)
+    if status is None and os.path.exists(labeled_dir_path):
+        # Labeled before the manifest was kept
+        manifest.complete('label', video_file_name, labeled_dir_path)
+        status = DONE
+    cut_status, _ = manifest.status('cut', video_file_name)
+    if status == DONE or cut_status not in (None, DONE):
+        return False
+
+    with manifest.track('label', video_file_name, labeled_dir_path):
+        label_meeting_files(processed_dir_path, labeled_dir_path, matcher, store_dir)
+    return True
+
+
+def label_meeting_files(processed_dir_path, labeled_dir_path, matcher, store_dir):
+    """
+    Links every file of a processed meeting directory into the party directories of a labeled one.
+    """
+    # Create a corresponding directory in labeled audios
+    os.makedirs(labeled_dir_path, exist_ok=True)
 
-        # Copy files to their respective subdirectories based on pattern match
-        for filename in os.listdir(processed_dir_path):
-            filepath = os.path.join(processed_dir_path, filename)
-            if os.path.isfile(filepath):
-                labeled = False
-                for party_names, subdirectory in party_mapping.items():
-                    match = re.search(re.escape(party_names), filename)
-                    if match:
-                        target_dir = os.path.join(labeled_dir_path, subdirectory)
-                        shutil.copy(filepath, os.path.join(target_dir, filename))
-                        labeled = True
-                        break
+    # Create subdirectories for each party under the labeled file directory
+    for party_name in set(matcher.party_mapping.values()):
+        party_dir = os.path.join(labeled_dir_path, party_name)
+        os.makedirs(party_dir, exist_ok=True)
 
-                # If no match found in party names, copy to 'unlabeled'
-                if not labeled:
-                    shutil.copy(filepath, os.path.join(unlabeled_dir, filename))
+    # Add 'unlabeled' subdirectory as well
+    unlabeled_dir = os.path.join(labeled_dir_path, 'unlabeled')
+    os.makedirs(unlabeled_dir, exist_ok=True)
 
+    # Link files into their respective subdirectories based on pattern match, 'unlabeled' if none
+    for filename in os.listdir(processed_dir_path):
+        filepath = os.path.join(processed_dir_path, filename)
+        if os.path.isfile(filepath):
+            party = label_file(filepath, labeled_dir_path, matcher, store_dir)
+            metrics.inc('files_labeled', party=party)
 
-def copy_short_audio(labeled_dir='audio/labeled', short_dir='audio/short'):
+
+def copy_short_audio(labeled_dir='audio/labeled', short_dir='audio/short', audio_format='wav',
+                     manifest_path='logs/manifest.sqlite'):
     """
-    Copies audio files from the 'labeled_dir' directory to the 'short_dir' directory, splitting them into segments
-    that are below 60 seconds.
+    Links audio files from the 'labeled_dir' directory into the 'short_dir' directory, splitting those longer
+    than 59.5 seconds into segments that are not, at the quietest moment before each limit.
+    Meetings the manifest has as done are skipped without walking their files.
 
     Args:
         labeled_dir (str): The directory where labeled audio files are located. Default is 'audio/labeled'.
         short_dir (str): The directory where short audio files will be saved. Default is 'audio/short'.
+        audio_format (str): The audio format of the pipeline the split segments are encoded in. Default is 'wav'.
+        manifest_path (str): The pipeline manifest. Default is 'logs/manifest.sqlite'.
     """
+    audio_format = get_format(audio_format)
+    manifest = Manifest(manifest_path)
+    done = manifest.done('short')
+
     # Create directory for short audios if it does not exist
     os.makedirs(short_dir, exist_ok=True)
 
@@ -287,6 +283,10 @@ def copy_short_audio(labeled_dir='audio/labeled', short_dir='audio/short'):
     for labeled_dir_name in labeled_dirs:
         labeled_dir_path = os.path.join(labeled_dir, labeled_dir_name)
 
+        # Skip finished meetings and those still being labeled
+        if labeled_dir_name in done or manifest.status('label', labeled_dir_name)[0] not in (None, DONE):
+            continue
+
         # Ignore files, only process directories
         if not os.path.isdir(labeled_dir_path):
             continue
@@ -296,40 +296,45 @@ def copy_short_audio(labeled_dir='audio/labeled', short_dir='audio/short'):
             continue
 
         short_file_dir = os.path.join(short_dir, labeled_dir_name)
-        os.makedirs(short_file_dir, exist_ok=True)
-
-        # Get the list of party directories within the labeled directory
-        party_dirs = os.listdir(labeled_dir_path)
-
-        for party_dir_name in party_dirs:
-            party_dir_path = os.path.join(labeled_dir_path, party_dir_name)
+        with manifest.track('short', labeled_dir_name, short_file_dir):
+            copy_short_meeting_audio(labeled_dir_path, short_file_dir, audio_format)
 
-            # Ignore files, only process subdirectories
-            if not os.path.isdir(party_dir_path):
-                continue
 
-            short_party_dir = os.path.join(short_file_dir, party_dir_name)
-            os.makedirs(short_party_dir, exist_ok=True)
+def copy_short_meeting_audio(labeled_dir_path, short_file_dir, audio_format):
+    """
+    Links or splits the labeled audio files of one meeting into its short directory.
+    """
+    os.makedirs(short_file_dir, exist_ok=True)
 
-            # Copy files and split into segments below 60 seconds
-            for filename in os.listdir(party_dir_path):
-                labeled_filepath = os.path.join(party_dir_path, filename)
-                if os.path.isfile(labeled_filepath):
-                    short_filepath = os.path.join(short_party_dir, filename)
+    # Get the list of party directories within the labeled directory
+    party_dirs = os.listdir(labeled_dir_path)
 
-                    audio = AudioSegment.from_file(labeled_filepath)
-                    duration = len(audio) / 1000  # Duration in seconds
+    for party_dir_name in party_dirs:
+        party_dir_path = os.path.join(labeled_dir_path, party_dir_name)
 
-                    if duration <= 59.5:
-                        shutil.copy(labeled_filepath, short_filepath)
-                    else:
-                        num_splits = int(duration / 59.5)  # Number of splits required
-                        segment_duration = duration / num_splits  # Duration of each segment
+        # Ignore files, only process subdirectories
+        if not os.path.isdir(party_dir_path):
+            continue
 
-                        for i in range(num_splits):
-                            start_time = i * segment_duration * 1000  # Start time in milliseconds
-                            end_time = (i + 1) * segment_duration * 1000  # End time in milliseconds
-                            segment = audio[int(start_time):int(end_time)]
-                            split_filename = os.path.splitext(filename)[0] + f"_{i+1}" + os.path.splitext(filename)[1]
+        short_party_dir = os.path.join(short_file_dir, party_dir_name)
+        os.makedirs(short_party_dir, exist_ok=True)
+
+        # Link files and split into segments below 60 seconds
+        for filename in os.listdir(party_dir_path):
+            labeled_filepath = os.path.join(party_dir_path, filename)
+            if os.path.isfile(labeled_filepath):
+                short_filepath = os.path.join(short_party_dir, filename)
+
+                duration = audio_duration(labeled_filepath)  # Duration in seconds
+
+                if duration <= 59.5:
+                    link_file(labeled_filepath, short_filepath)
+                else:
+                    # Split at the quietest moment before every 59.5 seconds
+                    with decoded_wav(labeled_filepath) as wav_filepath:
+                        pieces = []
+                        for i, (start, samples) in enumerate(split_points(wav_filepath, 59.5)):
+                            split_filename = os.path.splitext(filename)[0] + f"_{i+1}" + audio_format.extension
                             split_filepath = os.path.join(short_party_dir, split_filename)
-                            segment.export(split_filepath, format='wav')
+                            pieces.append((start, samples, split_filepath))
+                        write_pieces(wav_filepath, pieces, audio_format=audio_format)
@@ -5,6 +5,7 @@ import os
 import numpy as np
 from datetime import datetime
 from src.processing.logging import setup_logger
+from src.processing.frame_sampler import FrameSampler, seconds_to_time
 
 
 class FrameProcessor:
@@ -41,10 +42,7 @@ def frame_to_time(frame_number, fps):
     Returns:
     str: The time in the format 'minutes:seconds'.
     """
-    total_seconds = frame_number / fps
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
-    return f"{minutes}:{seconds:02d}"
+    return seconds_to_time(frame_number / fps)
 
 def similarity_score(a, b):
     """
@@ -91,7 +89,8 @@ def process_video(video_dir='videos', log_dir='logs/processing',
                   lower_yellow=np.array([29, 100, 100]), 
                   upper_yellow=np.array([35, 255, 255]), 
                   custom_config=r'--oem 3 --psm 6 -l isl',
-                  frame_skip=500):
+                  frame_skip=500,
+                  start_time=160):
     """
     Processes a video and extracts the topics discussed in it.
 
@@ -103,6 +102,7 @@ def process_video(video_dir='videos', log_dir='logs/processing',
     upper_yellow (numpy.ndarray): The upper color range for yellow.
     custom_config (str): The custom configuration for Tesseract OCR.
     frame_skip (int): The number of frames to skip between processing.
+    start_time (float): Time in seconds of the first processed frame.
 
     Returns:
     None
@@ -126,43 +126,29 @@ def process_video(video_dir='videos', log_dir='logs/processing',
             continue
 
         print(f"Going over topics for {video_file}:")
-        cap = cv2.VideoCapture(os.path.join(video_dir, video_file))
-        processing_logged = False
-        current_frame = 4000
+        sampler = FrameSampler(os.path.join(video_dir, video_file), frame_skip=frame_skip, start_time=start_time)
         current_topic = ""
 
-        with open(os.path.join(topic_dir, f'{video_file_name}.txt'), 'a') as topic_file:
-            while cap.isOpened():
-                cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-                ret, frame = cap.read()
+        with sampler, open(os.path.join(topic_dir, f'{video_file_name}.txt'), 'a') as topic_file:
+            for current_frame, current_time, frame in sampler:
+                extracted_text, gray = process_frame(frame, lower_yellow, upper_yellow, custom_config)
+                similarity = similarity_score(current_topic, extracted_text)
 
-                if ret:
-                    extracted_text, gray = process_frame(frame, lower_yellow, upper_yellow, custom_config)
-                    similarity = similarity_score(current_topic, extracted_text)
+                if 7 < len(extracted_text) < 150 and similarity < 0.7:
+                    if current_topic:
+                        topic_end_time = seconds_to_time(current_time)
+                        topic_file.write(f'End: {topic_end_time}\n')
 
-                    if 7 < len(extracted_text) < 150 and similarity < 0.7:
-                        if current_topic:
-                            topic_end_time = frame_to_time(current_frame, 25)
-                            topic_file.write(f'End: {topic_end_time}\n')
+                    current_topic = extracted_text
 
-                        current_topic = extracted_text
+                    topic_start_time = seconds_to_time(current_time)
+                    topic_file.write(f'Timestamp: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
+                    topic_file.write(f'Similarity score: {similarity}\n')
+                    topic_file.write(f'Video file: {video_file_name}\n')
+                    topic_file.write(f'Topic: {current_topic}\n')
+                    topic_file.write(f'Start: {topic_start_time}\n')
 
-                        topic_start_time = frame_to_time(current_frame, 25)
-                        topic_file.write(f'Timestamp: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
-                        topic_file.write(f'Similarity score: {similarity}\n')
-                        topic_file.write(f'Video file: {video_file_name}\n')
-                        topic_file.write(f'Topic: {current_topic}\n')
-                        topic_file.write(f'Start: {topic_start_time}\n')
+                    cv2.imwrite(os.path.join(frames_dir, f'original_frame_{current_frame}.png'), frame)
+                    cv2.imwrite(os.path.join(frames_dir, f'processed_frame_{current_frame}.png'), gray)
 
-                        cv2.imwrite(os.path.join(frames_dir, f'original_frame_{current_frame}.png'), frame)
-                        cv2.imwrite(os.path.join(frames_dir, f'processed_frame_{current_frame}.png'), gray)
-
-                        print(f"New topic '{current_topic}' starts at frame {current_frame}")
-
-                else:
-                    print(f"Frame {current_frame} not read correctly.")
-                    break
-
-                current_frame += frame_skip
-
-        cap.release()
\ No newline at end of file
+                    print(f"New topic '{current_topic}' starts at frame {current_frame}")
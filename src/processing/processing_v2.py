@@ -1,10 +1,19 @@
-from difflib import SequenceMatcher
 import cv2
 import pytesseract
 import os
+import json
+import traceback
 import numpy as np
 from datetime import datetime
 from src.processing.logging import setup_logger
+from src.processing.frame_sampler import FrameSampler, seconds_to_time
+from src.processing.parallel import run_in_pool
+from src.processing.ocr import get_engine, batch_image_to_string
+from src.processing.ffmpeg_source import FFmpegRoiSource
+from src.processing.timeline import TimelineRecord, append_timeline, export_columnar, read_timeline
+from src.processing.manifest import DONE, Manifest
+from src.processing import metrics
+from src.processing.speaker_resolver import SpeakerResolver, ngram_similarity
 
 
 class FrameProcessor:
@@ -25,6 +34,16 @@ class FrameProcessor:
         upper color range for white in HSV color space
     custom_config : str
         the custom configuration for Tesseract OCR
+    ocr : PytesseractEngine or TesserocrEngine
+        the OCR engine, shared by all processors in the process
+    caption_gate : bool
+        whether OCR is skipped for frames without a caption or with the same caption as the last one
+    min_caption_ratio : float
+        share of yellow pixels in the crop below which a frame has no caption
+    change_threshold : float
+        share of caption blocks that must differ between two frames for the caption to have changed
+    stats : dict
+        number of frames seen, skipped for having no caption, skipped as unchanged, and OCR'd
 
     Methods
     -------
@@ -32,9 +51,24 @@ class FrameProcessor:
         Processes a frame and extracts yellow text from it.
     process_white_frame(frame):
         Processes a frame and extracts white text from it.
+    prepare_yellow_frame(frame):
+        Masks the yellow text of a frame and decides whether it needs OCR.
+    prepare_white_frame(frame):
+        Masks the white text of a frame.
+    caption_signature(mask):
+        Returns a small version of a caption mask that is cheap to compare.
+    caption_changed(signature, previous):
+        Checks whether two caption signatures show different captions.
+    caption_state(frame):
+        Returns the caption signature of a frame without running OCR.
+    crop_region():
+        Returns the smallest region of the frame containing both crops.
+    shift_crop(top, left):
+        Moves the crops so the processor takes frames cropped to a region.
     """
 
-    def __init__(self, lower_yellow, upper_yellow, lower_white, upper_white, custom_config):
+    def __init__(self, lower_yellow, upper_yellow, lower_white, upper_white, custom_config, ocr_backend='auto',
+                 caption_gate=True, min_caption_ratio=0.001, change_threshold=0.05):
         """
         Constructs all the necessary attributes for the FrameProcessor object.
 
@@ -50,14 +84,29 @@ class FrameProcessor:
             upper color range for white in HSV color space
         custom_config : str
             the custom configuration for Tesseract OCR
+        ocr_backend : str
+            'tesserocr', 'pytesseract' or 'auto' to use tesserocr when it is installed
+        caption_gate : bool
+            whether OCR is skipped for frames without a caption or with the same caption as the last one
+        min_caption_ratio : float
+            share of yellow pixels in the crop below which a frame has no caption
+        change_threshold : float
+            share of caption blocks that must differ between two frames for the caption to have changed
         """
         self.lower_yellow = lower_yellow
         self.upper_yellow = upper_yellow
         self.lower_white = lower_white
         self.upper_white = upper_white
         self.custom_config = custom_config
+        self.ocr = get_engine(custom_config, ocr_backend)
         self.crop_coords_yellow = [700, 1000, 150, 1600]  # add this line
         self.crop_coords_white = [800, 1000, 150, 1700]  # add this line
+        self.caption_gate = caption_gate
+        self.min_caption_ratio = min_caption_ratio
+        self.change_threshold = change_threshold
+        self.stats = {'frames': 0, 'no_caption': 0, 'unchanged': 0, 'ocr': 0}
+        self._last_signature = None
+        self._last_text = ""
 
     def process_yellow_frame(self, frame):
         """
@@ -69,6 +118,26 @@ class FrameProcessor:
         Returns:
         str: The processed frame.
         """
+        decision, gray = self.prepare_yellow_frame(frame)
+        if decision == 'ocr':
+            # Use Tesseract to do OCR on the processed image
+            self._last_text = self.ocr.image_to_string(gray)
+        elif decision == 'no_caption':
+            self._last_text = ""
+
+        return self._last_text, gray
+
+    def prepare_yellow_frame(self, frame):
+        """
+        Masks the yellow text of a frame and decides with the caption gate whether it needs OCR.
+
+        Args:
+        frame (numpy.ndarray): A frame from a video.
+
+        Returns:
+        tuple: (decision, gray). The decision is 'ocr', 'unchanged' when the caption is the same as
+            in the previous frame or 'no_caption'. Gray is the masked image to run OCR on.
+        """
         # Convert BGR to HSV
         cropped_frame = frame[self.crop_coords_yellow[0]:self.crop_coords_yellow[1], self.crop_coords_yellow[2]:self.crop_coords_yellow[3]]
         hsv = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2HSV)
@@ -80,10 +149,99 @@ class FrameProcessor:
         # Convert the result to grayscale
         gray = cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
 
-        # Use Tesseract to do OCR on the processed image
-        text = pytesseract.image_to_string(gray, config=self.custom_config)
+        self.stats['frames'] += 1
+        if self.caption_gate:
+            if cv2.countNonZero(mask) < self.min_caption_ratio * mask.size:
+                # No caption, OCR would only find noise
+                self.stats['no_caption'] += 1
+                self._last_signature = None
+                return 'no_caption', gray
 
-        return text, gray
+            signature = self.caption_signature(mask)
+            if self._last_signature is not None and not self.caption_changed(signature, self._last_signature):
+                self.stats['unchanged'] += 1
+                return 'unchanged', gray
+            self._last_signature = signature
+
+        self.stats['ocr'] += 1
+        return 'ocr', gray
+
+    def crop_region(self):
+        """
+        Returns the smallest region of the frame containing both crops.
+
+        Returns:
+        list: [top, bottom, left, right] of the region.
+        """
+        return [
+            min(self.crop_coords_yellow[0], self.crop_coords_white[0]),
+            max(self.crop_coords_yellow[1], self.crop_coords_white[1]),
+            min(self.crop_coords_yellow[2], self.crop_coords_white[2]),
+            max(self.crop_coords_yellow[3], self.crop_coords_white[3]),
+        ]
+
+    def shift_crop(self, top, left):
+        """
+        Moves the crops so the processor takes frames that were already cropped to a region.
+
+        Args:
+        top (int): The first row of the region in the full frame.
+        left (int): The first column of the region in the full frame.
+        """
+        for coords in (self.crop_coords_yellow, self.crop_coords_white):
+            coords[0] -= top
+            coords[1] -= top
+            coords[2] -= left
+            coords[3] -= left
+
+    def caption_signature(self, mask):
+        """
+        Returns a small version of a caption mask that is cheap to compare.
+
+        Args:
+        mask (numpy.ndarray): The yellow mask of the cropped frame.
+
+        Returns:
+        numpy.ndarray: The mask downsampled 4 times in each direction.
+        """
+        height, width = mask.shape
+        return cv2.resize(mask, (width // 4, height // 4), interpolation=cv2.INTER_AREA)
+
+    def caption_state(self, frame):
+        """
+        Returns the caption signature of a frame without running OCR.
+
+        Args:
+        frame (numpy.ndarray): A frame from a video.
+
+        Returns:
+        numpy.ndarray: The signature, None if the frame has no caption.
+        """
+        cropped_frame = frame[self.crop_coords_yellow[0]:self.crop_coords_yellow[1], self.crop_coords_yellow[2]:self.crop_coords_yellow[3]]
+        hsv = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, self.lower_yellow, self.upper_yellow)
+        if cv2.countNonZero(mask) < self.min_caption_ratio * mask.size:
+            return None
+        return self.caption_signature(mask)
+
+    def caption_changed(self, signature, previous):
+        """
+        Checks whether two caption signatures show different captions.
+
+        Args:
+        signature (numpy.ndarray): The signature of the current frame, None for no caption.
+        previous (numpy.ndarray): The signature of an earlier frame, None for no caption.
+
+        Returns:
+        bool: True if the captions differ.
+        """
+        if signature is None or previous is None:
+            # A caption appeared or disappeared
+            return (signature is None) != (previous is None)
+        # A block counts when more than a quarter of its pixels are caption pixels
+        changed = np.count_nonzero(cv2.absdiff(signature, previous) > 64)
+        area = max(np.count_nonzero(signature > 64), np.count_nonzero(previous > 64), 1)
+        return changed / area > self.change_threshold
 
 
     def process_white_frame(self, frame):
@@ -96,6 +254,28 @@ class FrameProcessor:
         Returns:
         str: The processed frame.
         """
+        gray = self.prepare_white_frame(frame)
+
+        # Use adaptive thresholding to convert the image to binary
+    #    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+        # Use Tesseract to do OCR on the processed image
+    #    text = pytesseract.image_to_string(thresh, config=self.custom_config)
+
+        text = self.ocr.image_to_string(gray)
+
+        return text, gray
+
+    def prepare_white_frame(self, frame):
+        """
+        Masks the white text of a frame.
+
+        Args:
+        frame (numpy.ndarray): A frame from a video.
+
+        Returns:
+        numpy.ndarray: The masked grayscale image to run OCR on.
+        """
         # Convert BGR to HSV
         cropped_frame = frame[self.crop_coords_white[0]:self.crop_coords_white[1], self.crop_coords_white[2]:self.crop_coords_white[3]]
    
@@ -106,17 +286,7 @@ class FrameProcessor:
         res = cv2.bitwise_and(cropped_frame, cropped_frame, mask=mask)
 
         # Convert the result to grayscale
-        gray = cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
-
-        # Use adaptive thresholding to convert the image to binary
-    #    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-
-        # Use Tesseract to do OCR on the processed image
-    #    text = pytesseract.image_to_string(thresh, config=self.custom_config)
-
-        text = pytesseract.image_to_string(gray, config=self.custom_config)
-
-        return text, gray
+        return cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
 
     
     def process_frame(self, frame):
@@ -131,7 +301,7 @@ class FrameProcessor:
         # Convert to grayscale
         gray = cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
         # Extract text from the processed frame
-        extracted_text = pytesseract.image_to_string(gray, config=self.custom_config)
+        extracted_text = self.ocr.image_to_string(gray)
 
         return extracted_text
 
@@ -146,14 +316,12 @@ def frame_to_time(frame_number, fps):
     Returns:
     str: The time in the format 'minutes:seconds'.
     """
-    total_seconds = frame_number / fps
-    minutes = int(total_seconds // 60)
-    seconds = int(total_seconds % 60)
-    return f"{minutes}:{seconds:02d}"
+    return seconds_to_time(frame_number / fps)
 
 def similarity_score(a, b):
     """
-    Calculates and returns the similarity score between two strings.
+    Calculates and returns the similarity score between two strings, from their character trigrams
+    after folding away case, punctuation, accents and letters OCR confuses.
 
     Args:
     a (str): The first string.
@@ -162,7 +330,7 @@ def similarity_score(a, b):
     Returns:
     float: The similarity score.
     """
-    return SequenceMatcher(None, a, b).ratio()
+    return ngram_similarity(a, b)
 
 def process_frame(frame, lower_yellow, upper_yellow, custom_config):
     """
@@ -198,87 +366,500 @@ def process_video(video_dir='videos', log_dir='logs/processing',
                   lower_white=np.array([232]),
                   upper_white=np.array([255]),
                   custom_config=r'--oem 3 --psm 6 -l isl',
-                  frame_skip=500):
+                  frame_skip=500,
+                  start_time=160,
+                  seek_threshold=None,
+                  workers=1,
+                  threads=None,
+                  shards=1,
+                  ocr_backend='auto',
+                  caption_gate=True,
+                  refine_precision=1.0,
+                  frame_source='opencv',
+                  ocr_batch=1,
+                  manifest_path='logs/manifest.sqlite',
+                  party_mapping='src/data/party_mapping.json'):
+    """
+    Processes the videos in a directory and extracts the topics discussed in them.
+
+    Args:
+    video_dir (str): The directory containing the .mp4 files.
+    log_dir (str): The path where the logs will be saved.
+    lower_yellow (numpy.ndarray): The lower color range for yellow.
+    upper_yellow (numpy.ndarray): The upper color range for yellow.
+    lower_white (numpy.ndarray): The lower grayscale range for white.
+    upper_white (numpy.ndarray): The upper grayscale range for white.
+    custom_config (str): The custom configuration for Tesseract OCR.
+    frame_skip (int): The number of frames to skip between processing.
+    start_time (float): Time in seconds of the first processed frame.
+    seek_threshold (int, optional): Seek to every processed frame instead of decoding forward
+        when frame_skip is larger than this.
+    workers (int): The number of videos processed in parallel, each in its own process.
+    threads (int, optional): Threads each worker may give Tesseract and OpenCV. Defaults to
+        the CPUs split evenly between the workers.
+    shards (int): The number of time ranges each video is split into and scanned in parallel.
+        Up to workers * shards processes run at once.
+    ocr_backend (str): 'tesserocr', 'pytesseract' or 'auto' to use tesserocr when it is installed.
+    caption_gate (bool): Skip OCR for frames without a caption or with an unchanged caption.
+    refine_precision (float, optional): Find each speaker change to within this many seconds by
+        bisecting between the coarse samples. None keeps the coarse frame_skip precision.
+    frame_source (str): 'opencv' to decode full frames with OpenCV, 'ffmpeg' to have ffmpeg
+        decode and send only the caption region.
+    ocr_batch (int): The number of speaker captions read in one OCR call.
+    manifest_path (str): The pipeline manifest. Videos it has as done are skipped.
+    party_mapping (str): The party mapping file the speakers of the timelines are resolved with.
+
+    Returns:
+    tuple: (results, errors), dicts keyed by video file. Results hold the number of speakers
+        found in each video, errors the traceback of each video that failed.
+    """
+
+    # One query for the finished videos instead of a look for every topic log
+    done = Manifest(manifest_path).done('ocr')
+    video_files = [f for f in os.listdir(video_dir) if f.endswith('.mp4') and f.split('.')[0] not in done]
+    tasks = {
+        video_file: (os.path.join(video_dir, video_file), log_dir, lower_yellow, upper_yellow,
+                     lower_white, upper_white, custom_config, frame_skip, start_time, seek_threshold,
+                     shards, None, ocr_backend, caption_gate, refine_precision,
+                     frame_source, ocr_batch, manifest_path, party_mapping)
+        for video_file in video_files
+    }
+
+    if workers > 1:
+        results, errors = run_in_pool(process_video_file, tasks, workers, threads)
+    else:
+        results = {}
+        errors = {}
+        for video_file, args in tasks.items():
+            try:
+                results[video_file] = process_video_file(*args)
+            except Exception:
+                errors[video_file] = traceback.format_exc()
+                print(f"Processing {video_file} failed:\n{errors[video_file]}")
+
+    if errors:
+        print(f"{len(errors)} of {len(video_files)} videos failed: {', '.join(sorted(errors))}")
+        manifest = Manifest(manifest_path)
+        for video_file, error in errors.items():
+            manifest.fail('ocr', video_file.split('.')[0], error)
+
+    return results, errors
+
+
+def process_video_file(video_path, log_dir='logs/processing',
+                       lower_yellow=np.array([29, 100, 100]),
+                       upper_yellow=np.array([33, 255, 255]),
+                       lower_white=np.array([232]),
+                       upper_white=np.array([255]),
+                       custom_config=r'--oem 3 --psm 6 -l isl',
+                       frame_skip=500,
+                       start_time=160,
+                       seek_threshold=None,
+                       shards=1,
+                       threads=None,
+                       ocr_backend='auto',
+                       caption_gate=True,
+                       refine_precision=1.0,
+                       frame_source='opencv',
+                       ocr_batch=1,
+                       manifest_path='logs/manifest.sqlite',
+                       party_mapping='src/data/party_mapping.json'):
     """
-    Processes a video and extracts the topics discussed in it.
+    Processes a single video and writes the speakers and topics found in it to the topic log.
+
+    With shards > 1 the video is split into that many time ranges which are scanned in parallel,
+    each by its own process, and the speaker runs are stitched back together afterwards so the
+    log matches that of a serial run. The frame and OCR call counts of the run are saved to
+    <log_dir>/processing/<video>/<video>_stats.json.
 
     Args:
     video_path (str): The path to the video file.
-    logs_path (str): The path where the logs will be saved.
-    frames_path (str): The path where the processed and original frames will be saved.
+    log_dir (str): The path where the logs will be saved.
     lower_yellow (numpy.ndarray): The lower color range for yellow.
     upper_yellow (numpy.ndarray): The upper color range for yellow.
+    lower_white (numpy.ndarray): The lower grayscale range for white.
+    upper_white (numpy.ndarray): The upper grayscale range for white.
     custom_config (str): The custom configuration for Tesseract OCR.
     frame_skip (int): The number of frames to skip between processing.
+    start_time (float): Time in seconds of the first processed frame.
+    seek_threshold (int, optional): Seek to every processed frame instead of decoding forward
+        when frame_skip is larger than this.
+    shards (int): The number of time ranges the video is split into.
+    threads (int, optional): Threads each shard may give Tesseract and OpenCV.
+    ocr_backend (str): 'tesserocr', 'pytesseract' or 'auto' to use tesserocr when it is installed.
+    caption_gate (bool): Skip OCR for frames without a caption or with an unchanged caption.
+    refine_precision (float, optional): Find each speaker change to within this many seconds by
+        bisecting between the coarse samples. None keeps the coarse frame_skip precision.
+    frame_source (str): 'opencv' to decode full frames with OpenCV, 'ffmpeg' to have ffmpeg
+        decode and send only the caption region.
+    ocr_batch (int): The number of speaker captions read in one OCR call.
+    manifest_path (str): The pipeline manifest, where the video is marked done once its topic log
+        and timeline are written.
+    party_mapping (str): The party mapping file. The speaker captions are resolved with it to the
+        name, party and confidence written to the timeline.
 
     Returns:
-    None
+    int: The number of speakers found, or None if the video was already processed.
+    """
+    video_file = os.path.basename(video_path)
+    video_file_name = video_file.split('.')[0]
+    topic_dir = os.path.join(log_dir, 'topic', video_file_name)
+    processing_dir = os.path.join(log_dir, 'processing', video_file_name)
+    frames_dir = os.path.join(log_dir, 'frames', video_file_name)
+
+    # Create necessary directories if they don't exist
+    os.makedirs(topic_dir, exist_ok=True)
+    os.makedirs(processing_dir, exist_ok=True)
+    os.makedirs(frames_dir, exist_ok=True)
+
+    topic_file_path = os.path.join(topic_dir, f'{video_file_name}.txt')
+    timeline_base = os.path.join(topic_dir, video_file_name)
+    manifest = Manifest(manifest_path)
+    status, _ = manifest.status('ocr', video_file_name)
+    if status is None and os.path.exists(topic_file_path):
+        # Processed before the manifest was kept
+        manifest.complete('ocr', video_file_name, topic_file_path)
+        status = DONE
+    if status == DONE:
+        print(f"Skipping {video_file}, already processed.")
+        return None
+
+    # Outputs of a run that did not finish are appended to, start them over
+    for path in (topic_file_path, f'{timeline_base}.jsonl', f'{timeline_base}.npz'):
+        if os.path.exists(path):
+            os.remove(path)
+    manifest.start('ocr', video_file_name)
+
+    print(f"Going over topics for {video_file}:")
+    processor_args = (lower_yellow, upper_yellow, lower_white, upper_white, custom_config, ocr_backend,
+                      caption_gate)
+
+    with FrameSampler(video_path, start_time=start_time) as probe:
+        start_frame = probe.start_frame
+        frame_count = probe.frame_count
+
+    ranges = shard_ranges(start_frame, frame_count, frame_skip, shards)
+    tasks = {
+        i: (video_path, frames_dir, processor_args, frame_skip, range_start, range_end, seek_threshold,
+            frame_source, ocr_batch)
+        for i, (range_start, range_end) in enumerate(ranges)
+    }
+    if len(tasks) > 1:
+        results, errors = run_in_pool(scan_video_range, tasks, len(tasks), threads)
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(tasks)} shards of {video_file} failed")
+    else:
+        results = {i: scan_video_range(*args) for i, args in tasks.items()}
+
+    observations = [observation for i in sorted(results) for observation in results[i][0]]
+    stats = {name: sum(results[i][1][name] for i in results) for name in results[0][1]}
+    print(f"OCR ran on {stats['ocr']} of {stats['frames']} frames of {video_file}, skipped "
+          f"{stats['no_caption']} without a caption and {stats['unchanged']} with an unchanged caption.")
+    frame_processor = FrameProcessor(*processor_args)
+    ocr_calls = frame_processor.ocr.calls
+    with open(party_mapping, 'r') as f:
+        resolver = SpeakerResolver(json.load(f))
+    speakers = stitch_observations(
+        observations, lambda frame_number: read_white_text(video_path, frame_number, frame_processor), resolver)
+
+    if refine_precision:
+        refine_boundaries(video_path, speakers, frame_skip, start_frame, frame_processor, refine_precision)
+
+    # The white text and boundary refinement reads run here, not in the shards
+    stats['ocr_calls'] += frame_processor.ocr.calls - ocr_calls
+    stats['speakers'] = len(speakers)
+    for outcome in ('no_caption', 'unchanged', 'ocr'):
+        metrics.inc('frames_sampled', stats[outcome], outcome=outcome)
+    with open(os.path.join(processing_dir, f'{video_file_name}_stats.json'), 'w') as f:
+        json.dump(stats, f)
+
+    write_topic_log(topic_file_path, video_file_name, speakers)
+    write_timeline(timeline_base, video_file_name, speakers)
+    manifest.complete('ocr', video_file_name, topic_file_path)
+    print(f"Found {len(speakers)} speakers in {video_file}.")
+
+    return len(speakers)
+
+
+def shard_ranges(start_frame, frame_count, frame_skip, shards):
     """
+    Splits the sampled frames of a video into contiguous frame ranges.
 
-    video_files = [f for f in os.listdir(video_dir) if f.endswith('.mp4')]
+    Range boundaries fall on sampled frames, so the shards together sample exactly the frames a
+    serial run would.
 
-    for video_file in video_files:
-        video_file_name = video_file.split('.')[0]
-        topic_dir = os.path.join(log_dir, 'topic', video_file_name)
-        processing_dir = os.path.join(log_dir, 'processing', video_file_name)
-        frames_dir = os.path.join(log_dir, 'frames', video_file_name)
+    Args:
+    start_frame (int): The first sampled frame.
+    frame_count (int): The number of frames in the video.
+    frame_skip (int): The number of frames between two samples.
+    shards (int): The number of ranges wanted.
 
-        # Create necessary directories if they don't exist
-        os.makedirs(topic_dir, exist_ok=True)
-        os.makedirs(processing_dir, exist_ok=True)
-        os.makedirs(frames_dir, exist_ok=True)
+    Returns:
+    list: (start frame, end frame) tuples. The end frame is exclusive and None for the last range.
+    """
+    samples = max(0, -(-(frame_count - start_frame) // frame_skip))
+    shards = max(1, min(shards, samples))
+    bounds = [start_frame + (samples * i // shards) * frame_skip for i in range(shards)]
+    return list(zip(bounds, bounds[1:] + [None]))
 
-        if os.path.exists(os.path.join(topic_dir, f'{video_file_name}.txt')):
-            print(f"Skipping {video_file}, already processed.")
-            continue
 
-        print(f"Going over topics for {video_file}:")
-        cap = cv2.VideoCapture(os.path.join(video_dir, video_file))
-        processing_logged = False
-        current_frame = 4000
-        current_topic = ""
-        frame_processor = FrameProcessor(lower_yellow, upper_yellow, lower_white, upper_white, custom_config)
+def scan_video_range(video_path, frames_dir, processor_args, frame_skip, start_frame, end_frame=None,
+                     seek_threshold=None, frame_source='opencv', ocr_batch=1):
+    """
+    Runs OCR on the sampled frames of a range of a video.
 
-        with open(os.path.join(topic_dir, f'{video_file_name}.txt'), 'a') as topic_file:
-            while cap.isOpened():
-                cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-                ret, frame = cap.read()
+    The speaker continuity check is done within the range, starting with no speaker, and the white
+    topic text is only read for frames where the speaker changes. `stitch_observations` redoes the
+    continuity check across ranges.
 
-                if ret:
-                    extracted_text_yellow, gray_yellow = frame_processor.process_yellow_frame(frame)
-                    similarity = similarity_score(current_topic, extracted_text_yellow)
+    Args:
+    video_path (str): The path to the video file.
+    frames_dir (str): The directory where the frames of speaker changes are saved.
+    processor_args (tuple): Arguments for FrameProcessor.
+    frame_skip (int): The number of frames to skip between processing.
+    start_frame (int): The first frame of the range.
+    end_frame (int, optional): The frame after the last one of the range.
+    seek_threshold (int, optional): Seek to every processed frame instead of decoding forward
+        when frame_skip is larger than this.
+    frame_source (str): 'opencv' to decode full frames with OpenCV, 'ffmpeg' to have ffmpeg
+        decode and send only the caption region. The saved frames are then the region only.
+    ocr_batch (int): The number of speaker captions read in one OCR call. Above 1 the original
+        frames are not saved, only the processed ones.
 
-                    if 7 < len(extracted_text_yellow) < 150 and similarity < 0.7:
-                        extracted_text_white, gray_white = frame_processor.process_white_frame(frame)
-                        
-                        if current_topic:
-                            topic_end_time = frame_to_time(current_frame, 25)
-                            topic_file.write(f'End: {topic_end_time}\n')
+    Returns:
+    tuple: (observations, stats). Observations are (frame number, time in seconds, speaker text,
+        topic text or None) for every sampled frame that has a caption, stats are the caption
+        gate counters of the FrameProcessor and the number of OCR calls.
+    """
+    frame_processor = FrameProcessor(*processor_args)
+    # The engine is shared by every processor of the process, count the calls of this range only
+    ocr_calls = frame_processor.ocr.calls
+    observations = []
+    current_topic = ""
+
+    if frame_source == 'ffmpeg':
+        region = frame_processor.crop_region()
+        frame_processor.shift_crop(region[0], region[2])
+        sampler = FFmpegRoiSource(video_path, region, frame_skip=frame_skip, start_frame=start_frame,
+                                  end_frame=end_frame)
+    else:
+        sampler = FrameSampler(video_path, frame_skip=frame_skip, start_frame=start_frame, end_frame=end_frame,
+                               seek_threshold=seek_threshold)
+
+    def observe(current_frame, current_time, extracted_text_yellow, gray_yellow, read_white, frame=None):
+        nonlocal current_topic
+        if not 7 < len(extracted_text_yellow) < 150:
+            return
+
+        extracted_text_white = None
+        if similarity_score(current_topic, extracted_text_yellow) < 0.7:
+            extracted_text_white, gray_white = read_white()
+            current_topic = extracted_text_yellow
+
+            if frame is not None:
+                cv2.imwrite(os.path.join(frames_dir, f'original_frame_{current_frame}.png'), frame)
+            cv2.imwrite(os.path.join(frames_dir, f'processed_yellow_frame_{current_frame}.png'), gray_yellow)
+            cv2.imwrite(os.path.join(frames_dir, f'processed_white_frame_{current_frame}.png'), gray_white)
+
+            print(f"New Speaker: '{current_topic}\nTopic: {extracted_text_white}' starts at frame {current_frame}")
+
+        observations.append((current_frame, current_time, extracted_text_yellow, extracted_text_white))
+
+    def read_white_gray(gray_white):
+        return frame_processor.ocr.image_to_string(gray_white), gray_white
+
+    # Frames waiting for a batched OCR call, with the decision of the caption gate
+    pending = []
+    pending_ocr = 0
+    last_text = ""
+
+    def flush():
+        nonlocal last_text
+        texts = iter(batch_image_to_string(frame_processor.ocr, [p[3] for p in pending if p[2] == 'ocr']))
+        for current_frame, current_time, decision, gray_yellow, gray_white in pending:
+            if decision == 'ocr':
+                last_text = next(texts)
+            elif decision == 'no_caption':
+                last_text = ""
+            observe(current_frame, current_time, last_text, gray_yellow,
+                    lambda gray_white=gray_white: read_white_gray(gray_white))
+        pending.clear()
+
+    with sampler:
+        for current_frame, current_time, frame in sampler:
+            if ocr_batch > 1:
+                decision, gray_yellow = frame_processor.prepare_yellow_frame(frame)
+                if decision == 'ocr':
+                    # The white text is only read on a speaker change, which is not known yet. Frames
+                    # with an unchanged caption or none can never be a change, so they keep no images.
+                    pending.append((current_frame, current_time, decision, gray_yellow,
+                                    frame_processor.prepare_white_frame(frame)))
+                    pending_ocr += 1
+                else:
+                    pending.append((current_frame, current_time, decision, None, None))
+                if pending_ocr >= ocr_batch:
+                    flush()
+                    pending_ocr = 0
+            else:
+                extracted_text_yellow, gray_yellow = frame_processor.process_yellow_frame(frame)
+                observe(current_frame, current_time, extracted_text_yellow, gray_yellow,
+                        lambda: frame_processor.process_white_frame(frame), frame)
+        flush()
 
-                        current_topic = extracted_text_yellow
+    return observations, dict(frame_processor.stats, ocr_calls=frame_processor.ocr.calls - ocr_calls)
 
 
-                        topic_start_time = frame_to_time(current_frame, 25)
-                        topic_file.write(f'\nTimestamp: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')                   
-                        topic_file.write(f'Similarity score: {similarity}\n')
-                        topic_file.write(f'Video file: {video_file_name}\n')
-                        topic_file.write(f'Start: {topic_start_time}\n')    
-                        topic_file.write(f'Frame: {current_frame}\n')                             
-                        topic_file.write(f'Speaker: {current_topic}')
-                        topic_file.write(f'Topic: {extracted_text_white}\n')                     
+def stitch_observations(observations, read_white_text, resolver=None):
+    """
+    Turns the captions found in one or more consecutive ranges into speaker runs.
 
+    Applies the same similarity threshold as a serial scan over all observations in order, so a
+    speaker whose run crosses a range boundary is only counted once.
 
-                        cv2.imwrite(os.path.join(frames_dir, f'original_frame_{current_frame}.png'), frame)
-                        cv2.imwrite(os.path.join(frames_dir, f'processed_yellow_frame_{current_frame}.png'), gray_yellow)
-                        cv2.imwrite(os.path.join(frames_dir, f'processed_white_frame_{current_frame}.png'), gray_white)
+    Args:
+    observations (list): Observations of `scan_video_range` for each range, concatenated in order.
+    read_white_text (callable): Returns the topic text for a frame number. Used for speaker changes
+        the range scan did not see, which happens when a range starts in the middle of a run.
+    resolver (SpeakerResolver, optional): Resolves the caption of every run, after the ranges are
+        stitched so all of them share the names it learns.
 
-                        print(f"New Speaker: '{current_topic}\nTopic: {extracted_text_white}' starts at frame {current_frame}")
+    Returns:
+    list: A dict with frame, time, speaker, topic and similarity for every speaker run, and with a
+        resolver the name, party and confidence its caption was resolved to.
+    """
+    speakers = []
+    current_topic = ""
+    for current_frame, current_time, extracted_text_yellow, extracted_text_white in observations:
+        similarity = similarity_score(current_topic, extracted_text_yellow)
+        if similarity >= 0.7:
+            continue
 
+        if extracted_text_white is None:
+            extracted_text_white = read_white_text(current_frame)
+        current_topic = extracted_text_yellow
+        speaker = {
+            'frame': current_frame,
+            'time': current_time,
+            'speaker': extracted_text_yellow,
+            'topic': extracted_text_white,
+            'similarity': similarity,
+        }
+        if resolver is not None:
+            resolution = resolver.resolve(extracted_text_yellow)
+            speaker.update(name=resolution.speaker, party=resolution.party, confidence=resolution.speaker_confidence)
+        speakers.append(speaker)
+
+    return speakers
+
+
+def refine_boundaries(video_path, speakers, frame_skip, start_frame, frame_processor, precision=1.0):
+    """
+    Moves each speaker change from the coarse sample where it was seen back to where it happened.
 
-                else:
-                    print(f"Frame {current_frame} not read correctly.")
+    The change lies between the sample where it was seen and the sample before it. That interval is
+    bisected for the first frame showing the new caption, using the cheap caption check of the
+    FrameProcessor without OCR, until it is shorter than the precision. Decoding a few frames per
+    boundary is far cheaper than a dense scan.
+
+    Args:
+    video_path (str): The path to the video file.
+    speakers (list): Speaker runs as returned by `stitch_observations`, updated in place.
+    frame_skip (int): The number of frames between two coarse samples.
+    start_frame (int): The first coarse sample, changes seen there are not refined.
+    frame_processor (FrameProcessor): The processor used for the caption check.
+    precision (float): The wanted precision in seconds.
+    """
+    with FrameSampler(video_path) as sampler:
+        step = max(1, int(precision * sampler.fps))
+        for speaker in speakers:
+            low = speaker['frame'] - frame_skip
+            high = speaker['frame']
+            if low < start_frame:
+                continue
+
+            _, frame = sampler.read(high)
+            if frame is None:
+                continue
+            after = frame_processor.caption_state(frame)
+            high_time = speaker['time']
+
+            # Look for where the new caption appears rather than where the old one changed, the
+            # two differ when there is a gap without a caption between speakers
+            while high - low > step:
+                middle = (low + high) // 2
+                middle_time, frame = sampler.read(middle)
+                if frame is None:
                     break
+                if frame_processor.caption_changed(frame_processor.caption_state(frame), after):
+                    low = middle
+                else:
+                    high, high_time = middle, middle_time
+
+            speaker['frame'] = high
+            speaker['time'] = high_time
 
-                current_frame += frame_skip
 
-        cap.release()
+def read_white_text(video_path, frame_number, frame_processor):
+    """
+    Reads the topic text of a single frame.
+
+    Args:
+    video_path (str): The path to the video file.
+    frame_number (int): The frame to read.
+    frame_processor (FrameProcessor): The processor used for OCR.
+
+    Returns:
+    str: The topic text, empty if the frame could not be read.
+    """
+    with FrameSampler(video_path) as sampler:
+        _, frame = sampler.read(frame_number)
+    if frame is None:
+        return ""
+    extracted_text_white, _ = frame_processor.process_white_frame(frame)
+    return extracted_text_white
+
+
+def write_timeline(timeline_path, video_file_name, speakers):
+    """
+    Writes speaker runs as timeline records, appended to '<timeline_path>.jsonl' and exported
+    to '<timeline_path>.npz' for fast loading. Runs resolved by `stitch_observations` are written
+    with the speaker's name, party and the confidence in the name.
+
+    Args:
+    timeline_path (str): The path of the timeline, without extension.
+    video_file_name (str): The name of the video, without extension.
+    speakers (list): Speaker runs as returned by `stitch_observations`.
+    """
+    records = [
+        TimelineRecord(video=video_file_name, frame=int(speaker['frame']), pts=float(speaker['time']),
+                       speaker=speaker['speaker'].strip(), topic=speaker['topic'].strip(),
+                       similarity=float(speaker['similarity']), confidence=speaker.get('confidence'),
+                       name=speaker.get('name'), party=speaker.get('party'))
+        for speaker in speakers
+    ]
+    append_timeline(f'{timeline_path}.jsonl', records)
+    # The export covers the whole log, including records appended by earlier runs
+    export_columnar(f'{timeline_path}.npz', read_timeline(f'{timeline_path}.jsonl'))
+
+
+def write_topic_log(topic_file_path, video_file_name, speakers):
+    """
+    Writes speaker runs to a topic log. Each run ends where the next one starts.
+
+    Args:
+    topic_file_path (str): The path of the topic log.
+    video_file_name (str): The name of the video, without extension.
+    speakers (list): Speaker runs as returned by `stitch_observations`.
+    """
+    with open(topic_file_path, 'a') as topic_file:
+        for i, speaker in enumerate(speakers):
+            if i > 0:
+                topic_file.write(f'End: {seconds_to_time(speaker["time"])}\n')
+
+            topic_file.write(f'\nTimestamp: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
+            topic_file.write(f'Similarity score: {speaker["similarity"]}\n')
+            topic_file.write(f'Video file: {video_file_name}\n')
+            topic_file.write(f'Start: {seconds_to_time(speaker["time"])}\n')
+            topic_file.write(f'Frame: {speaker["frame"]}\n')
+            topic_file.write(f'Speaker: {speaker["speaker"]}')
+            topic_file.write(f'Topic: {speaker["topic"]}\n')
@@ -0,0 +1,330 @@
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from src.processing.audio_store import PartyMatcher
+
+# Characters OCR confuses, and Icelandic letters without an ASCII decomposition
+FOLD = str.maketrans({'I': 'l', '|': 'l', 'ð': 'd', 'Ð': 'd', 'þ': 'th', 'Þ': 'th', 'æ': 'ae', 'Æ': 'ae'})
+
+# Glyphs OCR reads for one another in captions, made the same when parties are compared
+CONFUSABLE = (('rn', 'm'), ('i', 'l'), ('1', 'l'), ('0', 'o'))
+
+# A caption is 'Name (Party)', the party in the last parentheses
+CAPTION_PATTERN = re.compile(r'^(.*?)\s*\(([^()]*)\)?\s*$')
+
+
+@lru_cache(maxsize=65536)
+def normalize(text):
+    """
+    Folds a caption or file name to the form it is compared in: lowercase ASCII words, with the
+    letters OCR mixes up made the same and numbers left out.
+
+    Args:
+    text (str): The text.
+
+    Returns:
+    str: The words, separated by single spaces.
+    """
+    text = unicodedata.normalize('NFKD', text.translate(FOLD).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(word for word in re.findall(r'[a-z0-9]+', text) if not word.isdigit())
+
+
+def skeleton(text):
+    """
+    Folds a text after `normalize` further, making the glyphs in CONFUSABLE the same, so e.g.
+    'framsfi' and 'framsfl' compare equal.
+
+    Args:
+    text (str): The normalized text.
+
+    Returns:
+    str: The folded text.
+    """
+    for glyph, replacement in CONFUSABLE:
+        text = text.replace(glyph, replacement)
+    return text
+
+
+@lru_cache(maxsize=65536)
+def ngrams(text, n=3):
+    """
+    Returns the character n-grams of a text after `normalize`, with the ends padded so short words
+    have n-grams too.
+
+    Args:
+    text (str): The text.
+    n (int): The length of the n-grams.
+
+    Returns:
+    frozenset: The n-grams.
+    """
+    padded = f' {normalize(text)} '
+    return frozenset(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def ngram_similarity(a, b):
+    """
+    Returns the Dice coefficient of the character trigrams of two texts, 1.0 for texts that only
+    differ in case, punctuation, accents or letters OCR confuses.
+
+    Args:
+    a (str): The first text.
+    b (str): The second text.
+
+    Returns:
+    float: The similarity, from 0.0 to 1.0.
+    """
+    grams_a, grams_b = ngrams(a), ngrams(b)
+    if not grams_a or not grams_b:
+        return 1.0 if grams_a == grams_b else 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class NgramIndex:
+    """
+    A class used to find the entries most similar to a text through an inverted index of their
+    character n-grams, so only entries that share an n-gram with the text are scored.
+
+    ...
+
+    Attributes
+    ----------
+    entries : list
+        the indexed texts
+    n : int
+        the length of the n-grams
+    postings : dict
+        maps every n-gram to the positions of the entries that have it
+
+    Methods
+    -------
+    add(text):
+        Adds an entry and returns its position.
+    best(text):
+        Returns the position and similarity of the entry most similar to a text.
+    """
+
+    def __init__(self, entries=(), n=3):
+        """
+        Constructs all the necessary attributes for the NgramIndex object.
+
+        Parameters
+        ----------
+        entries : iterable
+            texts to index
+        n : int
+            the length of the n-grams
+        """
+        self.entries = []
+        self.n = n
+        self.postings = {}
+        for text in entries:
+            self.add(text)
+
+    def add(self, text):
+        """
+        Adds an entry.
+
+        Args:
+        text (str): The entry.
+
+        Returns:
+        int: Its position in entries.
+        """
+        self.entries.append(text)
+        for gram in ngrams(text, self.n):
+            self.postings.setdefault(gram, []).append(len(self.entries) - 1)
+        return len(self.entries) - 1
+
+    def best(self, text):
+        """
+        Returns the entry most similar to a text, the first one indexed on a tie.
+
+        Args:
+        text (str): The text.
+
+        Returns:
+        tuple: (position, similarity) of the entry, or (None, 0.0) if none shares an n-gram with it.
+        """
+        grams = ngrams(text, self.n)
+        shared = Counter(i for gram in grams for i in self.postings.get(gram, ()))
+        if not shared:
+            return None, 0.0
+        scores = ((2 * count / (len(grams) + len(ngrams(self.entries[i], self.n))), -i) for i, count in shared.items())
+        score, i = max(scores)
+        return -i, score
+
+
+@dataclass(frozen=True)
+class Resolution:
+    """
+    The speaker and party a caption was resolved to.
+
+    Attributes
+    ----------
+    speaker : str
+        the name as first seen, shared by every noisy reading of it
+    party : str
+        the party directory, None if no party was found
+    speaker_confidence : float
+        similarity of the name to the known name, 1.0 for a name seen for the first time
+    party_confidence : float
+        similarity of the party to the closest variant in the party mapping, 0.0 if none was found
+    """
+    speaker: str
+    party: Optional[str]
+    speaker_confidence: float
+    party_confidence: float
+
+
+class SpeakerResolver:
+    """
+    A class used to map noisy OCR captions and the segment file names made from them to a speaker
+    and party.
+
+    Parties are looked up with the exact variants of the party mapping first, like PartyMatcher,
+    then by n-gram similarity to them with the glyphs OCR confuses made the same, so OCR errors that
+    are not in the mapping still find their party. A party found by similarity needs a higher
+    similarity than a name, as other words in a caption are often close to a short abbreviation,
+    e.g. 'Forsetinn' to 'forseti'. Names are matched against the names already resolved and a name unlike all of them is
+    added, so every reading of a speaker resolves to the first one. Results are cached by text.
+
+    ...
+
+    Attributes
+    ----------
+    party_mapping : dict
+        maps the party names found in captions to the party directories
+    threshold : float
+        the similarity from which a text is taken to be a known name
+    party_threshold : float
+        the similarity from which a text is taken to be a party not in the mapping
+    parties : NgramIndex
+        index of the party variants, normalized and folded with `skeleton`
+    party_dirs : list
+        the party directory of every entry of parties
+    names : NgramIndex
+        index of the speaker names resolved so far
+
+    Methods
+    -------
+    match(name):
+        Returns the party directory for a caption or file name, or None.
+    match_party(text):
+        Returns the party directory for a text and the confidence in it.
+    resolve(caption):
+        Returns the speaker and party of a caption.
+    """
+
+    # Party names have up to this many words, longer runs of words are not compared to them
+    MAX_PARTY_WORDS = 3
+
+    def __init__(self, party_mapping, names=(), threshold=0.7, party_threshold=0.8):
+        """
+        Constructs all the necessary attributes for the SpeakerResolver object.
+
+        Parameters
+        ----------
+        party_mapping : dict
+            maps the party names found in captions to the party directories
+        names : iterable
+            known speaker names, in the spelling they should resolve to
+        threshold : float
+            the similarity from which a text is taken to be a known name
+        party_threshold : float
+            the similarity from which a text is taken to be a party not in the mapping
+        """
+        self.party_mapping = party_mapping
+        self.threshold = threshold
+        self.party_threshold = party_threshold
+        self.exact = PartyMatcher(party_mapping)
+        # Variants that only differ in punctuation fold to one entry, the first in mapping order
+        variants = {}
+        for key, party in party_mapping.items():
+            variants.setdefault(skeleton(normalize(key)), party)
+        # Bigrams, a misread letter costs a short abbreviation too many of its trigrams
+        self.parties = NgramIndex(variants, n=2)
+        self.party_dirs = list(variants.values())
+        self.names = NgramIndex(names)
+        self._parties = {}
+        self._resolved = {}
+
+    def match_party(self, text):
+        """
+        Returns the party directory for a caption, a party name or a file name.
+
+        Args:
+        text (str): The text.
+
+        Returns:
+        tuple: (party directory, confidence), (None, 0.0) if no part of the text is similar enough
+            to a party.
+        """
+        if text in self._parties:
+            return self._parties[text]
+        party = self.exact.match(text)
+        if party is not None:
+            result = (party, 1.0)
+        else:
+            # Every run of up to MAX_PARTY_WORDS words is a candidate, the most similar one wins
+            words = skeleton(normalize(text)).split()
+            best, result = 0.0, (None, 0.0)
+            for size in range(1, self.MAX_PARTY_WORDS + 1):
+                for start in range(len(words) - size + 1):
+                    i, score = self.parties.best(' '.join(words[start:start + size]))
+                    if i is not None and score > best:
+                        best = score
+                        if score >= self.party_threshold:
+                            result = (self.party_dirs[i], score)
+        self._parties[text] = result
+        return result
+
+    def match(self, name):
+        """
+        Returns the party directory for a name, with the interface of PartyMatcher.
+
+        Args:
+        name (str): A caption or the file name of a speaker segment.
+
+        Returns:
+        str: The party directory, or None if no party is found in the name.
+        """
+        return self.match_party(name)[0]
+
+    def resolve(self, caption):
+        """
+        Returns the speaker and party of a caption.
+
+        Args:
+        caption (str): The speaker caption as read by OCR, e.g. 'Jón Jónsson (Samf.)'.
+
+        Returns:
+        Resolution: The speaker, party and the confidence in each.
+        """
+        caption = caption.strip()
+        if caption in self._resolved:
+            return self._resolved[caption]
+
+        match = CAPTION_PATTERN.match(caption)
+        name, party_text = (match.group(1), match.group(2)) if match else (caption, caption)
+        party, party_confidence = self.match_party(party_text)
+        if party is None and match:
+            # The parentheses were misread, look through the whole caption
+            party, party_confidence = self.match_party(caption)
+
+        if not normalize(name):
+            resolution = Resolution(name, party, 0.0, party_confidence)
+            self._resolved[caption] = resolution
+            return resolution
+
+        i, speaker_confidence = self.names.best(name)
+        if i is None or speaker_confidence < self.threshold:
+            i, speaker_confidence = self.names.add(name), 1.0
+
+        resolution = Resolution(self.names.entries[i], party, speaker_confidence, party_confidence)
+        self._resolved[caption] = resolution
+        return resolution
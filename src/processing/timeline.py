@@ -0,0 +1,261 @@
+import os
+import json
+from dataclasses import dataclass, asdict, fields
+from typing import List, Optional
+import numpy as np
+
+
+@dataclass
+class TimelineRecord:
+    """
+    One speaker run found in a meeting video.
+
+    Attributes:
+        video (str): Name of the video file, without extension.
+        frame (int): Frame where the speaker caption appears.
+        pts (float): Time in seconds where the speaker caption appears.
+        speaker (str): The yellow speaker caption as read by OCR.
+        topic (str): The white topic caption as read by OCR.
+        similarity (float): Similarity of the caption to the previous speaker's.
+        confidence (float, optional): How sure the pipeline is of the speaker, when known.
+        name (str, optional): The speaker the caption was resolved to, the same for every reading of
+            their name.
+        party (str, optional): The party directory of the speaker, when known.
+    """
+    video: str
+    frame: int
+    pts: float
+    speaker: str
+    topic: str
+    similarity: float
+    confidence: Optional[float] = None
+    name: Optional[str] = None
+    party: Optional[str] = None
+
+
+def timeline_path(topic_dir: str, video_file_name: str, extension: str = '.jsonl') -> str:
+    """
+    Returns the path of a meeting's timeline file.
+
+    Args:
+        topic_dir (str): The topic log directory, e.g. 'logs/topic'.
+        video_file_name (str): Name of the video file, without extension.
+        extension (str): '.jsonl' for the record log, '.npz' for the columnar export, '.txt' for the
+            topic log.
+
+    Returns:
+        str: The path.
+    """
+    return os.path.join(topic_dir, video_file_name, f'{video_file_name}{extension}')
+
+
+def append_timeline(path: str, records: List[TimelineRecord]) -> None:
+    """
+    Appends records to a JSON lines timeline, one record per line.
+
+    Args:
+        path (str): The .jsonl file.
+        records (list): The records to append.
+    """
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(asdict(record), ensure_ascii=False) + '\n')
+
+
+def read_timeline(path: str) -> List[TimelineRecord]:
+    """
+    Reads a JSON lines timeline.
+
+    Args:
+        path (str): The .jsonl file.
+
+    Returns:
+        list: The records.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return [TimelineRecord(**json.loads(line)) for line in f if line.strip()]
+
+
+def export_columnar(path: str, records: List[TimelineRecord]) -> None:
+    """
+    Writes records as one compressed array per field, which loads much faster than JSON.
+
+    Args:
+        path (str): The .npz file.
+        records (list): The records to write.
+    """
+    columns = {
+        'video': np.array([r.video for r in records], dtype=str),
+        'frame': np.array([r.frame for r in records], dtype=np.int64),
+        'pts': np.array([r.pts for r in records], dtype=np.float64),
+        'speaker': np.array([r.speaker for r in records], dtype=str),
+        'topic': np.array([r.topic for r in records], dtype=str),
+        'similarity': np.array([r.similarity for r in records], dtype=np.float64),
+        'confidence': np.array([np.nan if r.confidence is None else r.confidence for r in records], dtype=np.float64),
+        'name': np.array([r.name or '' for r in records], dtype=str),
+        'party': np.array([r.party or '' for r in records], dtype=str),
+    }
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, **columns)
+
+
+def read_columnar(path: str) -> List[TimelineRecord]:
+    """
+    Reads records written by `export_columnar`.
+
+    Args:
+        path (str): The .npz file.
+
+    Returns:
+        list: The records.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        # Exports made before a field existed leave it at its default
+        columns = {field.name: data[field.name].tolist() for field in fields(TimelineRecord)
+                   if field.name in data.files}
+    records = [TimelineRecord(**dict(zip(columns, values))) for values in zip(*columns.values())]
+    for record in records:
+        if record.confidence != record.confidence:  # NaN
+            record.confidence = None
+        record.name = record.name or None
+        record.party = record.party or None
+    return records
+
+
+def parse_seconds(value: str) -> float:
+    """
+    Parses a 'minutes:seconds' or 'hours:minutes:seconds' time from the topic log.
+
+    Args:
+        value (str): The time.
+
+    Returns:
+        float: The time in seconds.
+    """
+    seconds = 0.0
+    for part in value.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+# Fields of the text topic log, and the record attribute each one fills
+_TOPIC_LOG_FIELDS = {
+    'Similarity score': 'similarity',
+    'Video file': 'video',
+    'Start': 'pts',
+    'Frame': 'frame',
+    'Speaker': 'speaker',
+    'Topic': 'topic',
+}
+
+
+def parse_topic_log(path: str) -> List[TimelineRecord]:
+    """
+    Reads the text topic log written before timelines existed.
+
+    A record starts at every 'Timestamp:' line. Captions that span several lines are joined, and
+    logs of the first format, which only had 'Topic:', have no speaker.
+
+    Args:
+        path (str): The .txt topic log.
+
+    Returns:
+        list: The records.
+    """
+    video_file_name = os.path.splitext(os.path.basename(path))[0]
+    records = []
+    current = None
+    text_field = None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            stripped = line.strip()
+            key, separator, value = stripped.partition(':')
+            if separator and key == 'Timestamp':
+                current = {'video': video_file_name, 'frame': -1, 'pts': 0.0, 'speaker': '', 'topic': '',
+                           'similarity': 0.0}
+                records.append(current)
+                text_field = None
+            elif current is None:
+                continue
+            elif separator and key in _TOPIC_LOG_FIELDS:
+                attribute = _TOPIC_LOG_FIELDS[key]
+                value = value.strip()
+                if attribute in ('speaker', 'topic'):
+                    current[attribute] = value
+                    text_field = attribute
+                else:
+                    current[attribute] = {'pts': parse_seconds, 'frame': int, 'similarity': float}.get(attribute, str)(value)
+                    text_field = None
+            elif separator and key == 'End':
+                text_field = None
+            elif text_field and stripped:
+                # Continuation of a caption that had a line break in it
+                current[text_field] = f'{current[text_field]} {stripped}'.strip()
+
+    return [TimelineRecord(**record) for record in records]
+
+
+def load_timeline(topic_dir: str, video_file_name: str) -> List[TimelineRecord]:
+    """
+    Loads the timeline of a meeting from the fastest format available: the columnar export, the
+    JSON lines timeline or the text topic log.
+
+    Args:
+        topic_dir (str): The topic log directory, e.g. 'logs/topic'.
+        video_file_name (str): Name of the video file, without extension.
+
+    Returns:
+        list: The records, empty if the meeting has no timeline.
+    """
+    for extension, reader in (('.npz', read_columnar), ('.jsonl', read_timeline), ('.txt', parse_topic_log)):
+        path = timeline_path(topic_dir, video_file_name, extension)
+        if os.path.isfile(path):
+            return reader(path)
+    return []
+
+
+def load_timelines(topic_dir: str = 'logs/topic') -> dict:
+    """
+    Loads the timelines of all meetings in the topic log directory.
+
+    Args:
+        topic_dir (str): The topic log directory.
+
+    Returns:
+        dict: Maps each video file name to its records.
+    """
+    timelines = {}
+    for video_file_name in sorted(os.listdir(topic_dir)):
+        if os.path.isdir(os.path.join(topic_dir, video_file_name)):
+            timelines[video_file_name] = load_timeline(topic_dir, video_file_name)
+    return timelines
+
+
+def speech_segments(records: List[TimelineRecord], field: str = 'speaker', min_length: int = 7,
+                    default_duration: int = 10) -> List[tuple]:
+    """
+    Turns a timeline into the audio segments to cut, one per speaker run.
+
+    Each segment runs from the start of its run to one second before the next run starts. The last
+    one gets a default duration, as its end is not known.
+
+    Args:
+        records (list): The timeline.
+        field (str): The caption used as the segment name, 'speaker' or 'topic'.
+        min_length (int): Runs whose caption is not longer than this are skipped.
+        default_duration (int): Duration in seconds of the last segment.
+
+    Returns:
+        list: (name, start seconds, end seconds) tuples, in whole seconds.
+    """
+    records = [r for r in records if len(getattr(r, field).strip()) > min_length]
+    segments = []
+    for i, record in enumerate(records):
+        start_time = int(record.pts)
+        if i + 1 < len(records):
+            end_time = int(records[i + 1].pts) - 1
+        else:
+            end_time = start_time + default_duration
+        segments.append((getattr(record, field).strip(), start_time, end_time))
+    return segments
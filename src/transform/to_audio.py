@@ -1,44 +1,166 @@
 import os
-from moviepy.editor import AudioFileClip
-from pydub import AudioSegment
+import subprocess
+import tempfile
+import wave
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from src.processing.manifest import Manifest, file_signature
 
-def get_audio(video_dir='videos', audio_dir='audio/raw', video_format='.mp4', audio_format='.wav'):
-    # Ensure audio directory exists
-    if not os.path.exists(audio_dir):
-        os.makedirs(audio_dir)
+# moviepy clipped samples to +-0.99 of full scale before writing them, which is +-32440 in 16 bits
+CLIP_LIMIT = 32440
 
-    # Get a list of all .mp4 files in the videos directory
-    video_files = [f for f in os.listdir(video_dir) if f.endswith(video_format)]
 
-    # Loop through all .mp4 files
-    for video_file in video_files:
-        video_path = os.path.join(video_dir, video_file)
-        audio_path = os.path.join(audio_dir, video_file.replace(video_format, audio_format))
+def output_frames(duration, sample_rate):
+    """
+    Returns the number of frames the audio of a video has, the way it was counted when moviepy and
+    pydub extracted it.
+
+    moviepy wrote int(sample_rate * duration) frames, padding with silence past the end of the audio
+    stream. pydub then dropped the last millisecond of files whose length rounded to an odd number
+    of milliseconds.
+
+    Args:
+    duration (float): The duration of the video as reported by ffmpeg.
+    sample_rate (int): The sample rate of the audio file.
+
+    Returns:
+    int: The number of frames.
+    """
+    frames = int(sample_rate * duration)
+    milliseconds = round(1000 * (frames / sample_rate))
+    if milliseconds % 2 != 0:
+        frames = int((milliseconds - 1) * (sample_rate / 1000.0))
+    return frames
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def extract_audio(video_path, audio_path, sample_rate=44100, chunk_seconds=10):
+    """
+    Extracts the audio of a video to a mono 16-bit WAV file in one pass with constant memory.
+
+    ffmpeg decodes the audio to 16-bit stereo, which is read in chunks, clipped and mixed down to
+    mono the way moviepy and pydub did, and written straight to the WAV file. If ffmpeg fails, a
+    RuntimeError with what it wrote to stderr is raised and no WAV file is left behind.
+
+    Args:
+    video_path (str): The video file.
+    audio_path (str): The WAV file to write. It is written under a temporary name first, so an
+        interrupted extraction never leaves a file that looks finished.
+    sample_rate (int): The sample rate of the WAV file.
+    chunk_seconds (float): Seconds of audio held in memory at a time.
 
-        # Check if the audio file already exists. If it does, skip this video file.
-        if os.path.isfile(audio_path):
-            print(f"Audio file for {video_file} already exists. Skipping...")
-            continue
+    Returns:
+    int: The number of frames written.
+    """
+    frames = output_frames(ffmpeg_parse_infos(video_path)['duration'], sample_rate)
+    command = [FFMPEG_BINARY, '-v', 'error', '-nostdin', '-i', video_path, '-vn',
+               '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), '-ac', '2', 'pipe:1']
+    chunk_frames = int(sample_rate * chunk_seconds)
+    audio_path_temp = audio_path.replace('.wav', '_temp.wav')
 
-        # Extract audio
-        audio = AudioFileClip(video_path)
-        audio_path_temp = audio_path.replace(audio_format, '_temp' + audio_format)
-        audio.write_audiofile(audio_path_temp)
+    # stderr goes to a file, a pipe nobody reads could fill up and stall ffmpeg
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+        ended, stopped = False, False
+        try:
+            with wave.open(audio_path_temp, 'wb') as audio:
+                audio.setnchannels(1)
+                audio.setsampwidth(2)
+                audio.setframerate(sample_rate)
 
-        audio_mono = AudioSegment.from_wav(audio_path_temp)
+                written = 0
+                while written < frames:
+                    wanted = min(chunk_frames, frames - written)
+                    stereo = np.frombuffer(process.stdout.read(wanted * 4), dtype='<i2').reshape(-1, 2)
+                    if len(stereo) == 0:
+                        ended = True
+                        # Past the end of the audio stream, moviepy filled up the duration with silence
+                        audio.writeframes(np.zeros(wanted, dtype='<i2').tobytes())
+                        written += wanted
+                        continue
 
-        if audio_mono.sample_width != 2:
-            audio_mono = audio_mono.set_sample_width(2)
+                    stereo = np.clip(stereo.astype(np.int32), -CLIP_LIMIT, CLIP_LIMIT)
+                    # pydub's mono mix is the floor of the average of the channels
+                    mono = (stereo[:, 0] + stereo[:, 1]) >> 1
+                    audio.writeframes(mono.astype('<i2').tobytes())
+                    written += len(mono)
+        except BaseException:
+            _remove(audio_path_temp)
+            raise
+        finally:
+            process.stdout.close()
+            if not ended and process.poll() is None:
+                # The duration was written, the rest of the stream is not needed
+                process.kill()
+                stopped = True
+            process.wait()
 
-        # Ensure an even number of frames
-        if len(audio_mono) % 2 != 0:
-            audio_mono = audio_mono[:-1]
+        if process.returncode != 0 and not stopped:
+            _remove(audio_path_temp)
+            errors.seek(0)
+            message = errors.read().decode('utf-8', 'replace').strip()
+            raise RuntimeError(f"ffmpeg exited with status {process.returncode} extracting the audio of "
+                               f"{video_path}: {message}")
 
-        audio_mono = audio_mono.set_channels(1)
+    os.replace(audio_path_temp, audio_path)
+    return frames
 
-        # Save mono audio
-        audio_mono.export(audio_path, format='wav')
 
-        # Delete temporary stereo file
-        os.remove(audio_path_temp)
+def get_video_audio(video_path, audio_dir='audio/raw', video_format='.mp4', audio_format='.wav', sample_rate=44100,
+                    manifest_path='logs/manifest.sqlite'):
+    """
+    Extracts the audio of one video to the audio directory, unless the manifest has it as done from
+    the same video.
 
+    Args:
+    video_path (str): The video file.
+    audio_dir (str): The directory of the audio files.
+    video_format (str): The extension of the video file.
+    audio_format (str): The extension of the audio file.
+    sample_rate (int): The sample rate of the audio file.
+    manifest_path (str): The pipeline manifest.
+
+    Returns:
+    str: The path of the audio file.
+    """
+    os.makedirs(audio_dir, exist_ok=True)
+    video_file = os.path.basename(video_path)
+    audio_path = os.path.join(audio_dir, video_file.replace(video_format, audio_format))
+    key = video_file.split('.')[0]
+    video_signature = file_signature(video_path)
+
+    manifest = Manifest(manifest_path)
+    status, _ = manifest.status('audio', key)
+    if status is None and os.path.isfile(audio_path):
+        # Extracted before the manifest was kept
+        manifest.complete('audio', key, audio_path, video_signature)
+
+    # Skip this video file if its audio was extracted from it
+    if manifest.is_done('audio', key, video_signature):
+        print(f"Audio file for {video_file} already exists. Skipping...")
+        return audio_path
+
+    # Extract mono 16-bit audio
+    with manifest.track('audio', key, audio_path, video_signature):
+        extract_audio(video_path, audio_path, sample_rate)
+    return audio_path
+
+
+def get_audio(video_dir='videos', audio_dir='audio/raw', video_format='.mp4', audio_format='.wav', sample_rate=44100,
+              manifest_path='logs/manifest.sqlite'):
+    # Ensure audio directory exists
+    if not os.path.exists(audio_dir):
+        os.makedirs(audio_dir)
+
+    # Get a list of all .mp4 files in the videos directory
+    video_files = [f for f in os.listdir(video_dir) if f.endswith(video_format)]
+
+    # Loop through all .mp4 files
+    for video_file in video_files:
+        get_video_audio(os.path.join(video_dir, video_file), audio_dir, video_format, audio_format, sample_rate,
+                        manifest_path)
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+MEETING_URL = 'https://www.althingi.is/altext/upptokur/thingfundur/?lthing={lthing}&fundnr={fundnr}'
+VIDEO_LINK_TEXT = 'Vídeóskrá með fundinum'
+
+
+class HttpCache:
+    """
+    A class used to keep HTTP responses on disk with the validators needed to revalidate them.
+
+    Every URL is stored as '<sha256 of url>.json' with its ETag, Last-Modified and fetch time, next
+    to '<sha256 of url>.body' with the response body.
+
+    ...
+
+    Attributes
+    ----------
+    cache_dir : str
+        the directory the responses are kept in
+
+    Methods
+    -------
+    get(url):
+        Returns the cached metadata and body of a URL.
+    put(url, response):
+        Stores a response.
+    touch(url):
+        Marks a cached response as revalidated now.
+    """
+
+    def __init__(self, cache_dir='logs/http_cache'):
+        """
+        Constructs all the necessary attributes for the HttpCache object.
+
+        Parameters
+        ----------
+        cache_dir : str
+            the directory the responses are kept in
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url, extension):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + extension)
+
+    def get(self, url):
+        """
+        Returns the cached metadata and body of a URL.
+
+        Args:
+        url (str): The URL.
+
+        Returns:
+        tuple: (metadata dict, body bytes), or (None, None) if the URL is not cached.
+        """
+        try:
+            with open(self._path(url, '.json'), 'r') as f:
+                meta = json.load(f)
+            with open(self._path(url, '.body'), 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def put(self, url, response):
+        """
+        Stores a response, body first so a cached entry is never missing its body.
+
+        Args:
+        url (str): The URL.
+        response (requests.Response): A successful response.
+        """
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.encoding,
+            'fetched': time.time(),
+        }
+        self._write(self._path(url, '.body'), response.content, 'wb')
+        self._write(self._path(url, '.json'), json.dumps(meta), 'w')
+
+    def touch(self, url):
+        """
+        Marks a cached response as revalidated now.
+
+        Args:
+        url (str): The URL.
+        """
+        meta, _ = self.get(url)
+        if meta is not None:
+            meta['fetched'] = time.time()
+            self._write(self._path(url, '.json'), json.dumps(meta), 'w')
+
+    @staticmethod
+    def _write(path, data, mode):
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, mode) as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+
+class RateLimiter:
+    """
+    A class used to space out requests started by many threads to at most `rate` per second.
+
+    ...
+
+    Attributes
+    ----------
+    rate : float
+        requests per second
+
+    Methods
+    -------
+    wait():
+        Waits until the next request may start.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Waits until the next request may start.
+        """
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class MeetingCrawler:
+    """
+    A class used to fetch meeting pages from althingi.is, many at a time, over one pooled session.
+
+    Pages are kept in an HttpCache and revalidated with If-None-Match and If-Modified-Since, so a
+    page that has not changed costs a 304 without a body. A meeting page that already links its video
+    is final and is read from the cache without a request at all.
+
+    ...
+
+    Attributes
+    ----------
+    cache : HttpCache
+        the cache of fetched pages
+    concurrency : int
+        requests in flight at a time
+    rate : float
+        requests started per second at most
+    session : requests.Session
+        session with a connection pool as large as the concurrency
+
+    Methods
+    -------
+    fetch(url):
+        Fetches a page, revalidating the cached copy.
+    crawl(urls):
+        Fetches many pages concurrently.
+    video_links(sessions):
+        Returns the video URL of every meeting in ranges of sessions.
+    """
+
+    def __init__(self, cache_dir='logs/http_cache', concurrency=8, rate=4.0, timeout=30):
+        """
+        Constructs all the necessary attributes for the MeetingCrawler object.
+
+        Parameters
+        ----------
+        cache_dir : str
+            the directory of the HTTP cache
+        concurrency : int
+            requests in flight at a time
+        rate : float
+            requests started per second at most
+        timeout : float
+            seconds to wait for the server
+        """
+        self.cache = HttpCache(cache_dir)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency, max_retries=3)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url):
+        """
+        Fetches a page, sending the validators of the cached copy so an unchanged page is not sent
+        again.
+
+        Args:
+        url (str): The URL.
+
+        Returns:
+        str: The page, or None if the server does not have it.
+        """
+        meta, body = self.cache.get(url)
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and body is not None:
+            self.cache.touch(url)
+            return body.decode(meta.get('encoding') or 'utf-8', errors='replace')
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        self.cache.put(url, response)
+        return response.text
+
+    def cached(self, url):
+        """
+        Returns the cached copy of a page without any request.
+
+        Args:
+        url (str): The URL.
+
+        Returns:
+        str: The page, or None if it is not cached.
+        """
+        meta, body = self.cache.get(url)
+        if meta is None:
+            return None
+        return body.decode(meta.get('encoding') or 'utf-8', errors='replace')
+
+    def crawl(self, urls):
+        """
+        Fetches many pages concurrently, within the concurrency and rate limits.
+
+        Args:
+        urls (list): The URLs.
+
+        Returns:
+        tuple: (pages, errors), mapping URLs to the page from `fetch` and to the exception of the
+            requests that failed.
+        """
+        pages, errors = {}, {}
+        if not urls:
+            return pages, errors
+
+        limiter = RateLimiter(self.rate)
+
+        def crawl_one(url):
+            limiter.wait()
+            return self.fetch(url)
+
+        # Plain threads, so it also runs where an event loop is already running, e.g. in Jupyter
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(crawl_one, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    pages[url] = future.result()
+                except requests.exceptions.RequestException as e:
+                    errors[url] = e
+        return pages, errors
+
+    def video_links(self, sessions):
+        """
+        Returns the video URL of every meeting in ranges of sessions.
+
+        Args:
+        sessions (dict): Maps a session (lthing) to the range of its meeting numbers (fundnr).
+
+        Returns:
+        dict: Maps (lthing, fundnr) to the video URL of the meetings that have one.
+        """
+        urls = {MEETING_URL.format(lthing=lthing, fundnr=fundnr): (lthing, fundnr)
+                for lthing, meetings in sessions.items() for fundnr in meetings}
+
+        links = {}
+        to_fetch = []
+        for url, meeting in urls.items():
+            page = self.cached(url)
+            video_url = video_link(page) if page else None
+            if video_url:
+                links[meeting] = video_url
+            else:
+                to_fetch.append(url)
+
+        pages, errors = self.crawl(to_fetch)
+        for url, error in errors.items():
+            print(f"Fetching meeting {urls[url][1]} of session {urls[url][0]} failed due to {type(error).__name__}: {error}")
+        for url, page in pages.items():
+            video_url = video_link(page) if page else None
+            if video_url:
+                links[urls[url]] = video_url
+
+        print(f"Found videos for {len(links)} of {len(urls)} meetings, fetched {len(to_fetch)} pages.")
+        return links
+
+
+def video_link(page):
+    """
+    Finds the link to the video file on a meeting page.
+
+    Args:
+    page (str): The meeting page.
+
+    Returns:
+    str: The video URL, or None if the page has none yet.
+    """
+    if VIDEO_LINK_TEXT not in page:
+        return None
+    soup = BeautifulSoup(page, 'html.parser')
+    for link in soup.find_all('a'):
+        if VIDEO_LINK_TEXT in link.text and link.get('href'):
+            return link['href']
+    return None
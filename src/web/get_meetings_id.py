@@ -1,70 +1,40 @@
 import os
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-from datetime import datetime
-
-def get_max_fundarnr(logging=False):
-    # Fetch the HTML content
-    url = "https://www.althingi.is/thingstorf/thingfundir-og-raedur/fundargerdir-og-upptokur/"
-    response = requests.get(url)
-
-    # Parse the HTML with BeautifulSoup
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    # Find the table on the page
-    table = soup.find('table')
-
-    # Parse the table into a list of dictionaries
-    data = []
-    for row in table.find_all('tr')[1:]:  # Skip the header row
-        cols = row.find_all('td')
-        data.append({
-            'Fundarnúmer': cols[0].text,
-            'Fundur hefst': cols[1].text,
-            'Horfa': 'Horfa' in cols[1].text
-        })
-
-    # Convert the list of dictionaries into a DataFrame
-    df = pd.DataFrame(data)
-
-    # Extract number from 'Fundarnúmer' column
-    df['Fundarnúmer'] = df['Fundarnúmer'].str.extract('(\d+)')[0].fillna(0).astype(int)
-
-    # Extract start and end times from the original 'Fundur hefst' column
-    df[['start_time', 'end_time']] = df['Fundur hefst'].str.extract('\((\d+:\d+) - (\d+:\d+)\)')
-
-    # Convert 'Fundur hefst' into a datetime
-    df['Fundur hefst'] = pd.to_datetime(df['Fundur hefst'].str.extract('(\d+\.\d+\.\d+)')[0], format='%d.%m.%Y')
-
-    # Create 'ready' column
-    now = datetime.now()
-    df['ready'] = (df['Fundur hefst'] < now) & df['Horfa']
-
-    # Convert to timedelta if not null
-    df['start_time'] = pd.to_timedelta(df['start_time'] + ':00')
-    df['end_time'] = pd.to_timedelta(df['end_time'] + ':00')
-
-    # Calculate duration
-    df['duration'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 60
-
-    # Get the max 'Fundarnúmer' where 'ready' is True
-    max_fundarnr = df[(df['ready'] == True)]['Fundarnúmer'].max()
+from src.web.crawler import MeetingCrawler
+from src.web.metadata import SESSION_MEETINGS_URL, MeetingStore, parse_meetings_table
+
+
+def get_max_fundarnr(logging=False, lthing=153, store_path='logs/metadata/meetings.sqlite',
+                     cache_dir='logs/http_cache'):
+    """
+    Updates the meeting metadata store from althingi.is and returns the highest ready meeting number.
+
+    The meetings page is revalidated through the HTTP cache, and only meetings that are new or
+    changed are written to the store.
+
+    Args:
+    logging (bool): Write the whole store to 'logs/metadata/meetings.csv' when it changed.
+    lthing (int): The session whose meetings page is read.
+    store_path (str): The SQLite metadata store.
+    cache_dir (str): The HTTP cache directory.
+
+    Returns:
+    int: The highest meeting number that is ready.
+    """
+    # Fetch the meetings page of the session, a 304 answer reuses the cached page
+    url = SESSION_MEETINGS_URL.format(lthing=lthing)
+    html = MeetingCrawler(cache_dir=cache_dir, concurrency=1).fetch(url)
+    if html is None:
+        print(f"No meetings page for session {lthing}.")
+        return MeetingStore(store_path).max_ready(lthing)
+
+    store = MeetingStore(store_path)
+    changed = store.update(lthing, parse_meetings_table(html))
+    print(f"Meeting metadata: {changed} new or changed meetings.")
 
     # Check if logging is True
-    if logging:
-        # Current timestamp
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-
-        # Filename
-        filename = f'metadata_{timestamp}.csv'
-        # Path
-        file_path = 'logs/metadata/'
-
-        # Ensure directory exists
+    if logging and changed:
+        file_path = os.path.dirname(store_path)
         os.makedirs(file_path, exist_ok=True)
+        store.export_csv(os.path.join(file_path, 'meetings.csv'))
 
-        # Save DataFrame to a CSV file
-        df.to_csv(os.path.join(file_path, filename), index=False)
-
-    return max_fundarnr
+    return store.max_ready(lthing)
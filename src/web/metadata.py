@@ -0,0 +1,226 @@
+import os
+import re
+import csv
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from bs4 import BeautifulSoup
+
+MEETINGS_URL = "https://www.althingi.is/thingstorf/thingfundir-og-raedur/fundargerdir-og-upptokur/"
+# The meetings page of one session, MEETINGS_URL alone lists the current one
+SESSION_MEETINGS_URL = MEETINGS_URL + "?lthing={lthing}"
+
+NUMBER_PATTERN = re.compile(r'(\d+)')
+DATE_PATTERN = re.compile(r'(\d+)\.(\d+)\.(\d+)')
+TIMES_PATTERN = re.compile(r'\((\d+):(\d+) - (\d+):(\d+)\)')
+
+COLUMNS = ['lthing', 'fundnr', 'date', 'start_time', 'end_time', 'duration', 'has_video', 'text']
+
+
+def parse_meetings_table(html):
+    """
+    Parses the meetings table of althingi.is without pandas.
+
+    Args:
+    html (str or bytes): The meetings page.
+
+    Returns:
+    list: A dict per meeting with fundnr, date (ISO), start_time and end_time ('HH:MM', or None),
+        duration in minutes (or None), has_video and the text of the row.
+    """
+    table = BeautifulSoup(html, 'html.parser').find('table')
+    rows = []
+    for row in table.find_all('tr')[1:]:  # Skip the header row
+        cols = row.find_all('td')
+        number = NUMBER_PATTERN.search(cols[0].text)
+        text = cols[1].text
+        date = DATE_PATTERN.search(text)
+        times = TIMES_PATTERN.search(text)
+
+        start_time = end_time = duration = None
+        if times:
+            start_hour, start_minute, end_hour, end_minute = map(int, times.groups())
+            start_time = f'{start_hour:02d}:{start_minute:02d}'
+            end_time = f'{end_hour:02d}:{end_minute:02d}'
+            duration = (end_hour * 60 + end_minute) - (start_hour * 60 + start_minute)
+
+        rows.append({
+            'fundnr': int(number.group(1)) if number else 0,
+            'date': f'{int(date.group(3)):04d}-{int(date.group(2)):02d}-{int(date.group(1)):02d}' if date else None,
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration': duration,
+            'has_video': 'Horfa' in text,
+            'text': text.strip(),
+        })
+    return rows
+
+
+class MeetingStore:
+    """
+    A class used to keep the meetings table in SQLite, keyed by session (lthing) and meeting
+    number (fundnr), so each run only writes the rows that changed.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        path to the SQLite database
+
+    Methods
+    -------
+    update(lthing, rows):
+        Inserts new meetings and updates the ones that changed.
+    ready_meetings(lthing, first_meeting=0, downloaded=None):
+        Returns the meetings that are ready, optionally only those not downloaded yet.
+    max_ready(lthing):
+        Returns the highest ready meeting number.
+    mark_downloaded(lthing, fundnr, video_path):
+        Records that the video of a meeting was downloaded.
+    video_path(lthing, fundnr):
+        Returns where the video of a meeting was downloaded to.
+    export_csv(csv_path):
+        Writes the whole table to one CSV file.
+    """
+
+    def __init__(self, path='logs/metadata/meetings.sqlite'):
+        """
+        Constructs all the necessary attributes for the MeetingStore object.
+
+        Parameters
+        ----------
+        path : str
+            path to the SQLite database, created if it does not exist
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS meetings ('
+                ' lthing INTEGER NOT NULL, fundnr INTEGER NOT NULL, date TEXT, start_time TEXT,'
+                ' end_time TEXT, duration INTEGER, has_video INTEGER NOT NULL, text TEXT,'
+                ' video_path TEXT, downloaded_at TEXT, updated_at TEXT NOT NULL,'
+                ' PRIMARY KEY (lthing, fundnr))'
+            )
+
+    @contextmanager
+    def _connect(self):
+        # Commits on success like sqlite3's own context manager, and closes the connection too
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def update(self, lthing, rows):
+        """
+        Inserts new meetings and updates the ones that changed. Unchanged rows are not written.
+
+        Args:
+        lthing (int): The session the rows belong to.
+        rows (list): Meetings as returned by `parse_meetings_table`.
+
+        Returns:
+        int: The number of rows inserted or updated.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._connect() as db:
+            before = db.total_changes
+            db.executemany(
+                'INSERT INTO meetings (lthing, fundnr, date, start_time, end_time, duration, has_video, text, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (lthing, fundnr) DO UPDATE SET'
+                ' date = excluded.date, start_time = excluded.start_time, end_time = excluded.end_time,'
+                ' duration = excluded.duration, has_video = excluded.has_video, text = excluded.text,'
+                ' updated_at = excluded.updated_at'
+                ' WHERE (date, start_time, end_time, duration, has_video, text) IS NOT'
+                ' (excluded.date, excluded.start_time, excluded.end_time, excluded.duration,'
+                ' excluded.has_video, excluded.text)',
+                [(lthing, row['fundnr'], row['date'], row['start_time'], row['end_time'], row['duration'],
+                  int(row['has_video']), row['text'], now) for row in rows]
+            )
+            return db.total_changes - before
+
+    def ready_meetings(self, lthing, first_meeting=0, downloaded=None, today=None):
+        """
+        Returns the meetings that are ready, those that have a video and took place today or before.
+
+        Args:
+        lthing (int): The session.
+        first_meeting (int): Meetings with lower numbers are left out.
+        downloaded (bool, optional): True for only downloaded meetings, False for only those not
+            downloaded yet, None for both.
+        today (str, optional): ISO date to compare with, defaults to today.
+
+        Returns:
+        list: The meeting numbers, in order.
+        """
+        query = ('SELECT fundnr FROM meetings WHERE lthing = ? AND fundnr >= ? AND has_video = 1'
+                 ' AND date <= ?')
+        if downloaded is True:
+            query += ' AND downloaded_at IS NOT NULL'
+        elif downloaded is False:
+            query += ' AND downloaded_at IS NULL'
+        today = today or datetime.now().date().isoformat()
+        with self._connect() as db:
+            return [fundnr for fundnr, in db.execute(query + ' ORDER BY fundnr', (lthing, first_meeting, today))]
+
+    def max_ready(self, lthing):
+        """
+        Returns the highest ready meeting number of a session.
+
+        Args:
+        lthing (int): The session.
+
+        Returns:
+        int: The meeting number, or None if no meeting is ready.
+        """
+        ready = self.ready_meetings(lthing)
+        return ready[-1] if ready else None
+
+    def mark_downloaded(self, lthing, fundnr, video_path):
+        """
+        Records that the video of a meeting was downloaded.
+
+        Args:
+        lthing (int): The session.
+        fundnr (int): The meeting number.
+        video_path (str): Where the video was written.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._connect() as db:
+            db.execute('UPDATE meetings SET video_path = ?, downloaded_at = ? WHERE lthing = ? AND fundnr = ?',
+                       (video_path, now, lthing, fundnr))
+
+    def video_path(self, lthing, fundnr):
+        """
+        Returns where the video of a meeting was downloaded to.
+
+        Args:
+        lthing (int): The session.
+        fundnr (int): The meeting number.
+
+        Returns:
+        str: The path of the video, or None if it was not downloaded.
+        """
+        with self._connect() as db:
+            row = db.execute('SELECT video_path FROM meetings WHERE lthing = ? AND fundnr = ?',
+                             (lthing, fundnr)).fetchone()
+        return row[0] if row else None
+
+    def export_csv(self, csv_path):
+        """
+        Writes the whole table to one CSV file.
+
+        Args:
+        csv_path (str): The CSV file, replaced if it exists.
+        """
+        with self._connect() as db:
+            rows = db.execute(f'SELECT {", ".join(COLUMNS)}, video_path, downloaded_at FROM meetings'
+                              ' ORDER BY lthing, fundnr').fetchall()
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS + ['video_path', 'downloaded_at'])
+            writer.writerows(rows)
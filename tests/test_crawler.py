@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.web.crawler import MeetingCrawler, RateLimiter
+
+PAGE = '<html><a href="https://example.com/{path}.mp4">Vídeóskrá með fundinum</a></html>'
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        if self.path.startswith('/missing'):
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == f'"{self.path}"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = PAGE.format(path=self.path.strip('/')).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', f'"{self.path}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    PageHandler.requests_seen = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_crawl(server, tmp_path):
+    crawler = MeetingCrawler(cache_dir=str(tmp_path), concurrency=4, rate=0)
+    urls = [f'{server}/meeting{i}' for i in range(10)] + [f'{server}/missing']
+
+    pages, errors = crawler.crawl(urls)
+
+    assert errors == {}
+    assert pages[f'{server}/missing'] is None
+    assert 'meeting3.mp4' in pages[f'{server}/meeting3']
+    assert len(pages) == 11
+
+    # Unchanged pages are revalidated and read from the cache
+    pages, _ = crawler.crawl(urls[:2])
+    assert 'meeting1.mp4' in pages[f'{server}/meeting1']
+
+
+def test_crawl_inside_a_running_event_loop(server, tmp_path):
+    crawler = MeetingCrawler(cache_dir=str(tmp_path), concurrency=2, rate=0)
+
+    async def notebook_cell():
+        return crawler.crawl([f'{server}/meeting1'])
+
+    pages, errors = asyncio.run(notebook_cell())
+
+    assert errors == {}
+    assert 'meeting1.mp4' in pages[f'{server}/meeting1']
+
+
+def test_rate_limiter_spaces_out_threads():
+    limiter = RateLimiter(20)
+    starts = []
+
+    def worker():
+        limiter.wait()
+        starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    starts.sort()
+    assert starts[-1] - starts[0] >= 4 * 0.05 - 0.01
@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.download.downloader import RangedDownloader, file_checksum
+
+PART_SIZE = 1000
+DATA = os.urandom(10 * PART_SIZE + 123)
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-(\d+)')
+
+
+class VideoHandler(BaseHTTPRequestHandler):
+    """
+    Serves DATA, with or without Range support, failing the ranges that start at `fail_offsets`.
+    """
+    ranges = True
+    fail_offsets = set()
+    requested = []
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(DATA)))
+        if self.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+        if not (self.ranges and match):
+            self.requested.append(None)
+            self._send(200, DATA)
+            return
+
+        start, end = int(match.group(1)), int(match.group(2))
+        self.requested.append(start)
+        if start in self.fail_offsets:
+            self.send_error(503)
+            return
+        self._send(206, DATA[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(DATA)}'})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    VideoHandler.ranges = True
+    VideoHandler.fail_offsets = set()
+    VideoHandler.requested = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), VideoHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/meeting.mp4'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def downloader():
+    return RangedDownloader(connections=4, connections_per_file=4, part_size=PART_SIZE, chunk_size=256,
+                            max_retries=1)
+
+
+def assert_downloaded(path, checksum):
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    assert checksum == file_checksum(path, PART_SIZE)
+    with open(f'{path}.sha256') as f:
+        assert f.read().split()[0] == checksum
+    assert not os.path.exists(f'{path}.part')
+    assert not os.path.exists(f'{path}.parts')
+
+
+def test_download_ranges(server, tmp_path):
+    path = str(tmp_path / 'meeting.mp4')
+
+    checksum = downloader().download(server, path)
+
+    assert_downloaded(path, checksum)
+    assert sorted(VideoHandler.requested) == list(range(0, len(DATA), PART_SIZE))
+    # A finished download is not requested again
+    assert downloader().download(server, path) is None
+
+
+def test_resume_after_interrupt(server, tmp_path):
+    path = str(tmp_path / 'meeting.mp4')
+    VideoHandler.fail_offsets = {3 * PART_SIZE}
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        downloader().download(server, path)
+    with open(f'{path}.parts') as f:
+        assert sorted(map(int, json.load(f)['done'])) == [i for i in range(11) if i != 3]
+
+    VideoHandler.fail_offsets = set()
+    VideoHandler.requested = []
+    checksum = downloader().download(server, path)
+
+    assert_downloaded(path, checksum)
+    assert VideoHandler.requested == [3 * PART_SIZE]
+
+
+def test_resume_downloads_a_part_that_does_not_match_its_digest(server, tmp_path):
+    path = str(tmp_path / 'meeting.mp4')
+    VideoHandler.fail_offsets = {3 * PART_SIZE}
+    with pytest.raises(requests.exceptions.HTTPError):
+        downloader().download(server, path)
+
+    # Part 5 was recorded as done, then its bytes changed on disk
+    with open(f'{path}.part', 'r+b') as f:
+        f.seek(5 * PART_SIZE + 10)
+        f.write(b'\x00' * 10)
+
+    VideoHandler.fail_offsets = set()
+    VideoHandler.requested = []
+    checksum = downloader().download(server, path)
+
+    assert_downloaded(path, checksum)
+    assert sorted(VideoHandler.requested) == [3 * PART_SIZE, 5 * PART_SIZE]
+
+
+def test_download_without_range_support(server, tmp_path):
+    path = str(tmp_path / 'meeting.mp4')
+    VideoHandler.ranges = False
+
+    checksum = downloader().download(server, path)
+
+    assert_downloaded(path, checksum)
+    assert VideoHandler.requested == [None]
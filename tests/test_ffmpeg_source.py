@@ -0,0 +1,44 @@
+import subprocess
+
+import pytest
+
+from src.processing.ffmpeg_source import FFMPEG_BINARY, FFmpegRoiSource
+
+REGION = [16, 48, 8, 72]
+
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('videos') / 'meeting.mp4')
+    subprocess.run([FFMPEG_BINARY, '-v', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc=s=128x64:r=25', '-t', '4',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path], check=True)
+    return path
+
+
+def test_reads_every_sampled_region(video):
+    with FFmpegRoiSource(video, REGION, frame_skip=25) as source:
+        frames = [(frame_number, region.shape) for frame_number, _, region in source]
+
+    assert frames == [(i * 25, (32, 64, 3)) for i in range(4)]
+
+
+def test_stopping_early_is_not_an_error(video):
+    with FFmpegRoiSource(video, REGION, frame_skip=1) as source:
+        for frame_number, _, _ in source:
+            break
+
+    assert frame_number == 0
+
+
+def test_end_frame(video):
+    with FFmpegRoiSource(video, REGION, frame_skip=10, start_frame=20, end_frame=50) as source:
+        assert [frame_number for frame_number, _, _ in source] == [20, 30, 40]
+
+
+def test_raises_when_ffmpeg_fails(tmp_path):
+    path = tmp_path / 'corrupt.mp4'
+    path.write_bytes(b'not a video' * 100)
+
+    with FFmpegRoiSource(str(path), REGION, frame_skip=25) as source:
+        with pytest.raises(RuntimeError, match='ffmpeg exited with status'):
+            list(source)
@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions
+
+from src.google import gcs
+from src.google.gcs import AudioProcessor
+from src.google.transcript_cache import TranscriptCache
+
+
+class FakeBlob:
+    def __init__(self, name, data):
+        self.name = name
+        self.size = len(data)
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+        self.crc32c = None
+
+
+class FakeBucket:
+    name = 'althingi'
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def list_blobs(self, prefix=None):
+        return [blob for blob in self.blobs if blob.name.startswith(prefix or '')]
+
+
+class FakeOperation:
+    def __init__(self, client, uri, polls):
+        self.client = client
+        self.uri = uri
+        self.polls = polls
+        self.checks = 0
+
+    def done(self):
+        self.checks += 1
+        return self.polls is not None and self.checks > self.polls
+
+    def result(self):
+        self.client.active -= 1
+        alternative = SimpleNamespace(transcript=f'transcript of {os.path.basename(self.uri)}')
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])])
+
+
+class FakeSpeechClient:
+    """
+    Starts operations that finish after `polls` checks, None for never, raising the queued errors
+    first.
+    """
+
+    def __init__(self, polls=1, errors=()):
+        self.polls = polls
+        self.errors = list(errors)
+        self.calls = []
+        self.operations = []
+        self.active = 0
+        self.max_active = 0
+
+    def long_running_recognize(self, config, audio):
+        self.calls.append(audio.uri)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.operations.append(FakeOperation(self, audio.uri, self.polls))
+        return self.operations[-1]
+
+
+@pytest.fixture(autouse=True)
+def no_waiting(monkeypatch):
+    monkeypatch.setattr(gcs, 'backoff_delay', lambda attempt, base=1.0, cap=60.0: 0)
+
+
+def processor(client, count):
+    audio_processor = AudioProcessor.__new__(AudioProcessor)
+    audio_processor.client = client
+    audio_processor.bucket = FakeBucket([FakeBlob(f'labeled/Flokkur/speech{i}.wav', f'audio {i}'.encode('utf-8'))
+                                         for i in range(count)])
+    return audio_processor
+
+
+def transcribe(audio_processor, tmp_path, **kwargs):
+    kwargs.setdefault('poll_interval', 0)
+    return audio_processor.transcribe_audio_files('labeled', str(tmp_path / 'text'), 'V1',
+                                                  cache_path=str(tmp_path / 'transcripts.sqlite'),
+                                                  manifest_path=str(tmp_path / 'manifest.sqlite'), **kwargs)
+
+
+def test_retries_when_the_api_is_over_quota(tmp_path):
+    client = FakeSpeechClient(errors=[exceptions.ResourceExhausted('quota'), exceptions.ServiceUnavailable('down')])
+
+    counts = transcribe(processor(client, 1), tmp_path)
+
+    assert counts['transcribed'] == 1
+    assert len(client.calls) == 3
+    with open(tmp_path / 'text' / 'V1' / 'Flokkur' / 'speech0.txt') as f:
+        assert f.read() == 'transcript of speech0.wav\n'
+
+
+def test_gives_up_after_max_retries(tmp_path):
+    client = FakeSpeechClient(errors=[exceptions.TooManyRequests('slow down')] * 3)
+
+    counts = transcribe(processor(client, 1), tmp_path, max_retries=3)
+
+    assert counts['failed'] == 1
+    assert len(client.calls) == 3
+
+
+def test_does_not_retry_other_errors(tmp_path):
+    client = FakeSpeechClient(errors=[exceptions.InvalidArgument('bad audio')])
+
+    counts = transcribe(processor(client, 2), tmp_path)
+
+    assert counts == {'transcribed': 1, 'cached': 0, 'skipped': 0, 'failed': 1}
+    assert len(client.calls) == 2
+
+
+def test_keeps_concurrency_operations_in_flight(tmp_path):
+    client = FakeSpeechClient(polls=2)
+
+    counts = transcribe(processor(client, 7), tmp_path, concurrency=3)
+
+    assert counts['transcribed'] == 7
+    assert client.max_active == 3
+    assert client.active == 0
+
+
+def test_polls_until_done_and_times_out(tmp_path):
+    client = FakeSpeechClient(polls=3)
+    audio_processor = processor(client, 1)
+
+    assert transcribe(audio_processor, tmp_path)['transcribed'] == 1
+    assert client.operations[0].checks == 4
+
+    client = FakeSpeechClient(polls=None)
+    audio_processor.client = client
+    audio_processor.bucket.blobs.append(FakeBlob('labeled/Flokkur/never.wav', b'never'))
+
+    counts = transcribe(audio_processor, tmp_path, timeout=0)
+
+    assert counts == {'transcribed': 0, 'cached': 0, 'skipped': 1, 'failed': 1}
+    assert not os.path.exists(tmp_path / 'text' / 'V1' / 'Flokkur' / 'never.txt')
+
+
+def test_max_transcriptions_only_counts_files_not_in_the_cache(tmp_path):
+    audio_processor = processor(FakeSpeechClient(), 3)
+    transcribe(audio_processor, tmp_path)
+
+    # A new manifest and text folder, the cache has speech0 to speech2, listed after the new files
+    client = FakeSpeechClient()
+    audio_processor.client = client
+    audio_processor.bucket.blobs[:0] = [FakeBlob(f'labeled/Flokkur/new{i}.wav', f'new {i}'.encode('utf-8'))
+                                        for i in range(2)]
+    counts = audio_processor.transcribe_audio_files('labeled', str(tmp_path / 'again'), 'V1', max_transcriptions=1,
+                                                    poll_interval=0, cache_path=str(tmp_path / 'transcripts.sqlite'),
+                                                    manifest_path=str(tmp_path / 'again.sqlite'))
+
+    assert counts == {'transcribed': 1, 'cached': 3, 'skipped': 0, 'failed': 0}
+    assert client.calls == ['gs://althingi/labeled/Flokkur/new0.wav']
+    assert sorted(os.listdir(tmp_path / 'again' / 'V1' / 'Flokkur')) == ['new0.txt', 'speech0.txt', 'speech1.txt',
+                                                                         'speech2.txt']
+
+
+def test_evicts_the_cache_after_the_run(tmp_path):
+    transcribe(processor(FakeSpeechClient(), 3), tmp_path, cache_max_entries=2)
+
+    assert TranscriptCache(str(tmp_path / 'transcripts.sqlite')).stats()['entries'] == 2
@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import os
+
+import google_crc32c
+
+from src.google.gcs import AudioProcessor
+
+
+def crc32c(data):
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode('ascii')
+
+
+def md5(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+class FakeBlob:
+    def __init__(self, name, data=None, crc32c=None, md5_hash=None, chunk_size=None):
+        self.name = name
+        self.size = None if data is None else len(data)
+        self.crc32c = crc32c
+        self.md5_hash = md5_hash
+        self.chunk_size = chunk_size
+        self.uploaded_from = None
+
+    def upload_from_filename(self, file_path):
+        self.uploaded_from = file_path
+
+
+class FakeBucket:
+    name = 'althingi'
+
+    def __init__(self, blobs):
+        self.blobs = {blob.name: blob for blob in blobs}
+        self.uploads = {}
+
+    def list_blobs(self, prefix=None):
+        return [blob for name, blob in self.blobs.items() if name.startswith(prefix or '')]
+
+    def blob(self, name, chunk_size=None):
+        blob = self.uploads[name] = FakeBlob(name, chunk_size=chunk_size)
+        return blob
+
+
+def processor(bucket):
+    # No credentials, the bucket is all upload_files_to_bucket uses
+    audio_processor = AudioProcessor.__new__(AudioProcessor)
+    audio_processor.bucket = bucket
+    return audio_processor
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_upload_skips_unchanged_files(tmp_path):
+    folder = str(tmp_path / 'labeled')
+    files = {name: f'audio of {name}'.encode('utf-8') * 100 for name in
+             ('same_crc', 'same_md5', 'changed', 'resized', 'no_checksum', 'missing')}
+    for name, data in files.items():
+        write(os.path.join(folder, 'Samfylkingin', f'{name}.wav'), data)
+    write(os.path.join(folder, 'unlabeled', 'other.wav'), b'not uploaded')
+
+    changed = bytearray(files['changed'])
+    changed[0] ^= 0xff
+    bucket = FakeBucket([
+        FakeBlob('labeled/Samfylkingin/same_crc.wav', files['same_crc'], crc32c=crc32c(files['same_crc'])),
+        FakeBlob('labeled/Samfylkingin/same_md5.wav', files['same_md5'], md5_hash=md5(files['same_md5'])),
+        FakeBlob('labeled/Samfylkingin/changed.wav', bytes(changed), crc32c=crc32c(bytes(changed)),
+                 md5_hash=md5(bytes(changed))),
+        FakeBlob('labeled/Samfylkingin/resized.wav', files['resized'] + b'x', crc32c=crc32c(files['resized'])),
+        FakeBlob('labeled/Samfylkingin/no_checksum.wav', files['no_checksum']),
+    ])
+
+    counts = processor(bucket).upload_files_to_bucket(folder, workers=2)
+
+    assert counts == {'uploaded': 4, 'skipped': 2, 'failed': 0}
+    assert sorted(bucket.uploads) == ['labeled/Samfylkingin/changed.wav', 'labeled/Samfylkingin/missing.wav',
+                                      'labeled/Samfylkingin/no_checksum.wav', 'labeled/Samfylkingin/resized.wav']
+    assert bucket.uploads['labeled/Samfylkingin/missing.wav'].uploaded_from == \
+        os.path.join(folder, 'Samfylkingin', 'missing.wav')
+
+
+def test_upload_counts_failures(tmp_path):
+    folder = str(tmp_path / 'labeled')
+    write(os.path.join(folder, 'Píratar', 'speech.wav'), b'audio')
+
+    class FailingBucket(FakeBucket):
+        def blob(self, name, chunk_size=None):
+            raise ConnectionError('connection reset')
+
+    counts = processor(FailingBucket([])).upload_files_to_bucket(folder)
+
+    assert counts == {'uploaded': 0, 'skipped': 0, 'failed': 1}
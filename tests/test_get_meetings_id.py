@@ -0,0 +1,26 @@
+from src.web import get_meetings_id
+from src.web.metadata import MeetingStore
+
+PAGE = '''<table>
+<tr><th>Fundur</th><th>Dagsetning</th></tr>
+<tr><td>12. fundur</td><td>mánudaginn 2.10.2023 (15:00 - 18:30) Horfa</td></tr>
+<tr><td>13. fundur</td><td>þriðjudaginn 3.10.2023 (13:30 - 16:00) Horfa</td></tr>
+</table>'''
+
+
+def test_get_max_fundarnr_reads_the_page_of_the_session(tmp_path, monkeypatch):
+    fetched = []
+
+    def fetch(crawler, url):
+        fetched.append(url)
+        return PAGE
+
+    monkeypatch.setattr(get_meetings_id.MeetingCrawler, 'fetch', fetch)
+    store_path = str(tmp_path / 'meetings.sqlite')
+
+    fundnr = get_meetings_id.get_max_fundarnr(lthing=154, store_path=store_path, cache_dir=str(tmp_path / 'cache'))
+
+    assert fundnr == 13
+    assert fetched == ['https://www.althingi.is/thingstorf/thingfundir-og-raedur/fundargerdir-og-upptokur/?lthing=154']
+    assert MeetingStore(store_path).ready_meetings(154, today='2023-12-31') == [12, 13]
+    assert MeetingStore(store_path).ready_meetings(153, today='2023-12-31') == []
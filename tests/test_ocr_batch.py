@@ -0,0 +1,83 @@
+import numpy as np
+
+from src.processing.ocr import batch_image_to_string
+
+# Each fake caption image is filled with the value its lines are looked up by
+CAPTIONS = {
+    10: ['Jón Jónsson (Samf.)'],
+    20: ['Katrín Jakobsdóttir', '(Vg.)'],
+    30: ['Forseti'],
+}
+
+
+def caption(value, height=30, width=200):
+    image = np.zeros((height, width), dtype=np.uint8)
+    image[5:height - 5, 10:width - 10] = value
+    return image
+
+
+class FakeEngine:
+    """
+    Reads the images made by `caption` the way the tesseract command line lays out text: lines of a
+    block end with a newline, blocks are separated by a blank line and the page ends with a form feed.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def _blocks(self, image):
+        blocks, row = [], 0
+        while row < image.shape[0]:
+            value = int(image[row].max())
+            if not value:
+                row += 1
+                continue
+            top = row
+            while row < image.shape[0] and int(image[row].max()) == value:
+                row += 1
+            blocks.append((top, row, CAPTIONS[value]))
+        return blocks
+
+    def image_to_words(self, image):
+        self.calls += 1
+        blocks = self._blocks(image)
+        if not blocks:
+            return '\f', []
+        text, words = '', []
+        for top, bottom, lines in blocks:
+            text += '\n' if text else ''
+            for line in lines:
+                words += [(top, bottom, word) for word in line.split()]
+                # Tesseract collapses runs of spaces to one
+                text += ' '.join(line.split()) + '\n'
+        return text + '\f', words
+
+    def image_to_string(self, image):
+        return self.image_to_words(image)[0]
+
+
+def test_batch_matches_single_images():
+    engine = FakeEngine()
+    images = [caption(10), caption(20), caption(30, height=40, width=120)]
+
+    single = [engine.image_to_string(image) for image in images]
+    engine.calls = 0
+    batched = batch_image_to_string(engine, images)
+
+    assert batched == single
+    assert engine.calls == 1
+
+
+def test_batch_keeps_the_line_breaks_of_an_image():
+    assert batch_image_to_string(FakeEngine(), [caption(20)]) == ['Katrín Jakobsdóttir\n(Vg.)\n\f']
+
+
+def test_batch_image_without_text():
+    engine = FakeEngine()
+    images = [caption(10), np.zeros((30, 200), dtype=np.uint8), caption(30)]
+
+    assert batch_image_to_string(engine, images) == [engine.image_to_string(image) for image in images]
+
+
+def test_batch_of_no_images():
+    assert batch_image_to_string(FakeEngine(), []) == []
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from src.processing.processing_v2 import stitch_observations, write_timeline
+from src.processing.speaker_resolver import SpeakerResolver
+from src.processing.timeline import read_columnar, read_timeline
+
+with open(os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'party_mapping.json'), 'r') as f:
+    PARTY_MAPPING = json.load(f)
+
+
+@pytest.fixture
+def resolver():
+    return SpeakerResolver(PARTY_MAPPING)
+
+
+@pytest.mark.parametrize('text, party', [
+    ('Samf.', 'samfylking'),
+    ('Framsfl.', 'framsokn'),
+    # OCR errors that are not in the mapping
+    ('Framsfi.', 'framsokn'),
+    ('Sarnf.', 'samfylking'),
+    ('Midfi.', 'midflokkur'),
+    ('Vinstri-qr.', 'vinstri-gr'),
+    ('Viðreis', 'viðreisn'),
+])
+def test_match_party(resolver, text, party):
+    assert resolver.match_party(text)[0] == party
+
+
+@pytest.mark.parametrize('text', [
+    # Words close to a party variant are not taken for it
+    'Framsal-um',
+    'Forsetinn',
+    'Samt.',
+    'Guðrún Hafsteinsdóttir',
+    'Forsætisráðherra',
+    'Piratinn',
+])
+def test_match_party_rejects_words_like_a_party(resolver, text):
+    assert resolver.match_party(text) == (None, 0.0)
+
+
+def test_resolve_noisy_readings_to_one_speaker(resolver):
+    first = resolver.resolve('Jóhann Páll Jóhannsson (Samf.)')
+    noisy = resolver.resolve('Jóhann PálI Jóhannson (Sarnf.)')
+
+    assert (first.speaker, first.party, first.speaker_confidence) == ('Jóhann Páll Jóhannsson', 'samfylking', 1.0)
+    assert noisy.speaker == 'Jóhann Páll Jóhannsson'
+    assert noisy.party == 'samfylking'
+    assert 0.7 <= noisy.speaker_confidence < 1.0
+
+
+def test_resolve_without_party(resolver):
+    resolution = resolver.resolve('Framsal-um')
+
+    assert resolution.party is None
+    assert resolution.party_confidence == 0.0
+
+
+def test_timeline_gets_the_resolved_speaker(resolver, tmp_path):
+    observations = [
+        (0, 0.0, 'Jóhann Páll Jóhannsson (Samf.)\n', 'Fjárlög'),
+        (500, 20.0, 'Inga Sæland (Fl. fólksins)\n', 'Fjárlög'),
+        (1000, 40.0, 'Jóhann PálI Jóhannson (Sarnf.)\n', 'Fjárlög'),
+    ]
+    speakers = stitch_observations(observations, lambda frame_number: '', resolver)
+
+    timeline_base = str(tmp_path / 'meeting')
+    write_timeline(timeline_base, 'meeting', speakers)
+
+    for records in (read_timeline(f'{timeline_base}.jsonl'), read_columnar(f'{timeline_base}.npz')):
+        assert [record.name for record in records] == ['Jóhann Páll Jóhannsson', 'Inga Sæland',
+                                                       'Jóhann Páll Jóhannsson']
+        assert [record.party for record in records] == ['samfylking', 'fl-folksins', 'samfylking']
+        assert records[0].confidence == 1.0
+        assert 0.7 <= records[2].confidence < 1.0
+        assert records[2].speaker == 'Jóhann PálI Jóhannson (Sarnf.)'
+
+
+def test_timeline_without_resolver(tmp_path):
+    speakers = stitch_observations([(0, 0.0, 'Inga Sæland (Fl. fólksins)', 'Fjárlög')], lambda frame_number: '')
+
+    write_timeline(str(tmp_path / 'meeting'), 'meeting', speakers)
+
+    record, = read_columnar(str(tmp_path / 'meeting.npz'))
+    assert (record.name, record.party, record.confidence) == (None, None, None)
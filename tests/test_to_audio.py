@@ -0,0 +1,42 @@
+import os
+import stat
+import subprocess
+import wave
+
+import pytest
+from moviepy.config import FFMPEG_BINARY
+
+from src.transform import to_audio
+
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('videos') / 'meeting.mp4')
+    subprocess.run([FFMPEG_BINARY, '-v', 'error', '-y', '-f', 'lavfi', '-i', 'color=c=black:s=64x64:r=25',
+                    '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100', '-t', '2',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-ac', '2', path], check=True)
+    return path
+
+
+def test_extract_audio(video, tmp_path):
+    audio_path = str(tmp_path / 'meeting.wav')
+
+    frames = to_audio.extract_audio(video, audio_path)
+
+    with wave.open(audio_path, 'rb') as audio:
+        assert audio.getnchannels() == 1
+        assert audio.getnframes() == frames > 0
+    assert os.listdir(tmp_path) == ['meeting.wav']
+
+
+def test_extract_audio_raises_when_ffmpeg_fails(video, tmp_path, monkeypatch):
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text('#!/bin/sh\necho "meeting.mp4: Invalid data found when processing input" >&2\nexit 1\n')
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(to_audio, 'FFMPEG_BINARY', str(ffmpeg))
+    audio_dir = tmp_path / 'audio'
+    audio_dir.mkdir()
+
+    with pytest.raises(RuntimeError, match='status 1.*Invalid data found'):
+        to_audio.extract_audio(video, str(audio_dir / 'meeting.wav'))
+    assert os.listdir(audio_dir) == []